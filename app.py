@@ -25,19 +25,46 @@
 
 import streamlit as st
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
 import json
+import csv
 from datetime import datetime
 import io
 import re
+import time
+import random
+import threading
+import os
+import sys
+import hashlib
+import functools
+from contextlib import contextmanager
+from pathlib import Path
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3.exceptions
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # 1. CONFIGURAÇÕES GLOBAIS
 # ═══════════════════════════════════════════════════════════════════════════════
 
+# Copy-on-Write: cópias rasas dos DataFrames em cache são seguras
+# (sempre ativo a partir do pandas 3.0)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
 SHEET_ID = "1qoUk6AsNXLpHyzRrZplM4F5573zN9hUwQTNVUF3UC8E"
-BASE_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid="
+# SALES_BI_BASE_URL aponta o export CSV para outro servidor (ex.: benchmark.py)
+BASE_URL = os.environ.get(
+    "SALES_BI_BASE_URL", f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid="
+)
 
 # Mapeamento de TODAS as abas com seus GIDs
 ABAS = {
@@ -66,6 +93,41 @@ ABAS = {
 # URLs de exportação CSV
 ABAS_URLS = {k: BASE_URL + v["gid"] for k, v in ABAS.items()}
 
+# Cache e pré-carregamento das abas
+TTL_ABAS = 300                  # segundos
+MAX_DOWNLOADS_PARALELOS = 8     # threads simultâneas no prefetch
+TIMEOUT_DOWNLOAD = 30           # segundos por requisição CSV (leitura)
+TIMEOUT_CONEXAO = 5             # segundos para abrir a conexão
+TENTATIVAS_DOWNLOAD = 3         # retentativas em falha de rede / 429 / 5xx
+BACKOFF_DOWNLOAD = 0.5          # segundos (dobra a cada tentativa)
+DIR_CACHE_DISCO = os.environ.get("SALES_BI_CACHE_DIR", ".cache_abas")
+ORCAMENTO_CACHE_BYTES = int(os.environ.get("SALES_BI_CACHE_MB", "512")) * 2**20  # abas em memória
+
+# Fonte das abas: export CSV público ou Sheets API autenticada (um batchGet para várias abas)
+FONTE_CSV = "csv"
+FONTE_API = "api"
+FONTES_ABAS = {FONTE_CSV: "Export CSV", FONTE_API: "Sheets API (batchGet)"}
+FONTE_ABAS_PADRAO = os.environ.get("SALES_BI_FONTE_ABAS", FONTE_CSV)
+
+# Perfil de desempenho (spans de tempo por rerun, também gravados em JSON Lines)
+# SALES_BI_LOG_SPANS: caminho do log ("" desliga); padrão = spans.jsonl no cache em disco
+LOG_SPANS = os.environ.get("SALES_BI_LOG_SPANS")
+LIMITE_LOG_SPANS_BYTES = 10 * 2**20   # acima disso o log vira .1 e recomeça
+
+# Upload em lotes
+TAMANHO_LOTE_UPLOAD = 5000      # linhas por lote (memória constante)
+LIMITE_PREVIEW_UPLOAD = 1000    # linhas exibidas na pré-visualização
+
+# Deduplicação de uploads (coluna interna, não vai para a planilha)
+COLUNA_DUPLICADO = "_duplicado"
+
+# Escrita no Sheets
+MAX_LINHAS_LOTE_SHEETS = 2000       # linhas por chamada append_rows
+MAX_BYTES_LOTE_SHEETS = 1_000_000   # payload estimado por chamada
+MAX_TENTATIVAS_SHEETS = 6           # em 429/5xx
+BACKOFF_INICIAL_SHEETS = 1.0        # segundos (dobra a cada tentativa)
+BACKOFF_MAXIMO_SHEETS = 60.0
+
 # Canais de venda
 CHANNELS = {
     "geral": "Geral",
@@ -167,6 +229,11 @@ def normalizar(texto):
         return ""
     return str(texto).strip().lower()
 
+def normalizar_series(serie):
+    """Versão vetorizada de normalizar para uma coluna inteira"""
+    texto = serie.astype(object).where(serie.notna(), "")
+    return texto.astype(str).str.strip().str.lower()
+
 def safe_int(value):
     """Converte para inteiro de forma segura"""
     try:
@@ -183,6 +250,378 @@ def get_status_meta(valor, minimo, ideal):
     else:
         return "🔴"
 
+# ───────────────────────────────────────────────────────────────────────────────
+# 2.1 VERSÕES VETORIZADAS (coluna inteira de uma vez)
+# Mesma semântica de clean_currency / clean_percent / safe_int, célula a célula
+# ───────────────────────────────────────────────────────────────────────────────
+
+TIPOS_NUMERICOS_INFERIDOS = {"integer", "floating", "mixed-integer-float", "boolean"}
+
+def _texto_para_float(textos):
+    """
+    Converte um array de textos para float com a semântica de float()
+    Retorna (valores, falhou) - falhou marca onde float() levantaria erro
+    """
+    textos = np.asarray(textos, dtype=object)
+    valores = np.full(len(textos), np.nan, dtype="float64")
+    falhou = np.zeros(len(textos), dtype=bool)
+    if len(textos) == 0:
+        return valores, falhou
+
+    # Caminho rápido: coluna inteira válida (numpy usa float() por célula, em C)
+    try:
+        return textos.astype("float64"), falhou
+    except (TypeError, ValueError):
+        pass
+
+    # Coluna suja: o parser do pandas marca o que é claramente numérico
+    validos = pd.to_numeric(pd.Series(textos), errors="coerce").notna().to_numpy()
+    try:
+        valores[validos] = textos[validos].astype("float64")
+    except (TypeError, ValueError):
+        validos[:] = False
+
+    # Restante (vazios, "nan", "-", NBSP...) passa pelo float() original
+    for i in np.flatnonzero(~validos):
+        try:
+            valores[i] = float(textos[i])
+        except (TypeError, ValueError):
+            falhou[i] = True
+
+    return valores, falhou
+
+def _separar_celulas(serie):
+    """
+    Separa as células de uma Series em nulas, numéricas e texto
+    Retorna (array object, nulos, numericos)
+    """
+    valores = serie.to_numpy(dtype=object)
+    nulos = pd.isna(valores)
+    tipo = pd.api.types.infer_dtype(serie, skipna=True)
+
+    if tipo in ("string", "empty"):
+        numericos = np.zeros(len(valores), dtype=bool)
+    elif tipo in TIPOS_NUMERICOS_INFERIDOS:
+        numericos = ~nulos
+    else:
+        # Coluna mista (comum em Excel): verifica tipo célula a célula
+        numericos = np.fromiter(
+            (isinstance(v, (int, float)) for v in valores), dtype=bool, count=len(valores)
+        ) & ~nulos
+
+    return valores, nulos, numericos
+
+def _por_categoria(serie, limpar):
+    """Aplica `limpar` só às categorias distintas e espalha o resultado pelos códigos"""
+    categorias = limpar(pd.Series(serie.cat.categories.to_numpy(dtype=object), dtype=object)).to_numpy()
+    vazio = limpar(pd.Series([np.nan], dtype=object)).to_numpy()  # código -1 = célula vazia
+    return pd.Series(np.concatenate([categorias, vazio])[serie.cat.codes.to_numpy()], index=serie.index)
+
+def clean_currency_series(serie):
+    """Versão vetorizada de clean_currency para uma coluna inteira"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return _por_categoria(serie, clean_currency_series)
+    if pd.api.types.is_numeric_dtype(serie):
+        valores = serie.to_numpy(dtype="float64", na_value=np.nan)
+        return pd.Series(np.where(np.isnan(valores), 0.0, valores), index=serie.index)
+
+    valores, nulos, numericos = _separar_celulas(serie)
+    resultado = np.zeros(len(valores), dtype="float64")
+    resultado[numericos] = valores[numericos].astype("float64")
+
+    textos = ~nulos & ~numericos
+    if textos.any():
+        limpos = (
+            pd.Series(valores[textos], dtype=object).astype(str)
+            .str.replace("R$", "", regex=False)
+            .str.replace(" ", "", regex=False)
+            .str.replace(".", "", regex=False)
+            .str.replace(",", ".", regex=False)
+        )
+        convertidos, falhou = _texto_para_float(limpos.to_numpy(dtype=object))
+        convertidos[falhou] = 0.0
+        resultado[textos] = convertidos
+
+    return pd.Series(resultado, index=serie.index)
+
+def clean_percent_series(serie):
+    """Versão vetorizada de clean_percent para uma coluna inteira"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return _por_categoria(serie, clean_percent_series)
+    if pd.api.types.is_numeric_dtype(serie):
+        valores = serie.to_numpy(dtype="float64", na_value=np.nan)
+        valores = np.where(np.isnan(valores), 0.0, valores)
+        return pd.Series(np.where(valores > 1, valores / 100, valores), index=serie.index)
+
+    valores, nulos, numericos = _separar_celulas(serie)
+    resultado = np.zeros(len(valores), dtype="float64")
+
+    nums = valores[numericos].astype("float64")
+    resultado[numericos] = np.where(nums > 1, nums / 100, nums)
+
+    textos = ~nulos & ~numericos
+    if textos.any():
+        limpos = (
+            pd.Series(valores[textos], dtype=object).astype(str)
+            .str.replace("%", "", regex=False)
+            .str.replace(" ", "", regex=False)
+            .str.replace(",", ".", regex=False)
+        )
+        convertidos, falhou = _texto_para_float(limpos.to_numpy(dtype=object))
+        convertidos = np.where(convertidos > 1, convertidos / 100, convertidos)
+        convertidos[falhou] = 0.0
+        resultado[textos] = convertidos
+
+    return pd.Series(resultado, index=serie.index)
+
+def safe_int_series(serie):
+    """Versão vetorizada de safe_int para uma coluna inteira"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return _por_categoria(serie, safe_int_series)
+    if pd.api.types.is_numeric_dtype(serie):
+        valores = serie.to_numpy(dtype="float64", na_value=np.nan)
+    else:
+        # safe_int usa float(valor) direto, então número e texto seguem o mesmo caminho
+        brutos = serie.to_numpy(dtype=object)
+        preenchidos = ~pd.isna(brutos)
+        valores = np.full(len(brutos), np.nan, dtype="float64")
+        convertidos, falhou = _texto_para_float(brutos[preenchidos])
+        convertidos[falhou] = np.nan
+        valores[preenchidos] = convertidos
+
+    # int(float(x)) falha para NaN/inf -> 0
+    finitos = np.isfinite(valores)
+    if (np.abs(valores[finitos]) >= 2**63).any():
+        # Fora do int64: célula a célula, como safe_int (int do Python, coluna object)
+        return pd.Series([safe_int(v) for v in serie.to_numpy(dtype=object)], index=serie.index, dtype=object)
+    resultado = np.zeros(len(valores), dtype="int64")
+    resultado[finitos] = np.trunc(valores[finitos]).astype("int64")
+    return pd.Series(resultado, index=serie.index)
+
+# ───────────────────────────────────────────────────────────────────────────────
+# 2.2 FORMATAÇÃO EM LOTE PARA EXIBIÇÃO (mesmo texto de format_*_br, via Arrow)
+# ───────────────────────────────────────────────────────────────────────────────
+
+def _digitos(inteiros, largura=1):
+    """Inteiros não negativos como texto, com zeros à esquerda até `largura`"""
+    return pc.utf8_lpad(pc.cast(pa.array(inteiros), pa.string()), width=largura, padding="0")
+
+def _decimal_br(valores, milhar):
+    """
+    Texto '1.234,56' (ou '1234,56' sem milhar) de um array float64 sem NaN
+    Empates de meio centavo e valores enormes/infinitos usam o format do Python
+    """
+    with np.errstate(invalid="ignore"):
+        escala = np.abs(valores) * 100
+        centavos = np.rint(escala)
+        incerto = (np.abs(escala - np.floor(escala) - 0.5) < 1e-6) | ~(centavos < 2**53)
+    inteiro, resto = np.divmod(np.where(incerto, 0, centavos).astype("int64"), 100)
+
+    if milhar:
+        texto = _digitos(inteiro % 1000, 3)
+        grupo = inteiro // 1000
+        while (grupo > 0).any():
+            texto = pc.if_else(
+                pa.array(grupo > 0), pc.binary_join_element_wise(_digitos(grupo % 1000, 3), texto, "."), texto
+            )
+            grupo = grupo // 1000
+        texto = pc.if_else(pa.array(inteiro == 0), "0", pc.utf8_ltrim(texto, characters="0"))
+    else:
+        texto = _digitos(inteiro)
+    texto = pc.binary_join_element_wise(texto, _digitos(resto, 2), ",")
+    texto = pc.if_else(pa.array(np.signbit(valores)), pc.binary_join_element_wise("-", texto, ""), texto)
+
+    if incerto.any():
+        modelo = "{:,.2f}" if milhar else "{:.2f}"
+        trocas = [modelo.format(v).replace(",", "X").replace(".", ",").replace("X", ".") for v in valores[incerto]]
+        texto = pc.replace_with_mask(texto, pa.array(incerto), pa.array(trocas, pa.string()))
+    return texto
+
+def format_currency_series(serie):
+    """Versão vetorizada de format_currency_br para uma coluna inteira"""
+    valores = pd.to_numeric(serie, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    zero = np.isnan(valores) | (valores == 0)
+    texto = pc.binary_join_element_wise("R$ ", _decimal_br(np.where(zero, 0.0, valores), milhar=True), "")
+    texto = pc.if_else(pa.array(zero), "R$ 0,00", texto)
+    return pd.Series(pd.arrays.ArrowExtensionArray(texto), index=serie.index)
+
+def format_percent_series(serie):
+    """Versão vetorizada de format_percent_br para uma coluna inteira"""
+    valores = pd.to_numeric(serie, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    vazio = np.isnan(valores)
+    texto = pc.binary_join_element_wise(_decimal_br(np.where(vazio, 0.0, valores) * 100, milhar=False), "%", "")
+    texto = pc.if_else(pa.array(vazio), "0,00%", texto)
+    return pd.Series(pd.arrays.ArrowExtensionArray(texto), index=serie.index)
+
+def status_meta_series(serie, minimo, ideal):
+    """Versão vetorizada de get_status_meta (🟢 ≥ ideal, 🟡 ≥ mínimo, 🔴 abaixo)"""
+    valores = pd.to_numeric(serie, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    return pd.Series(np.select([valores >= ideal, valores >= minimo], ["🟢", "🟡"], "🔴"), index=serie.index)
+
+def formatar_tabela(df, colunas_monetarias=(), metas=None):
+    """
+    Cópia rasa de df pronta para st.dataframe
+    - Colunas monetárias e a coluna de margem viram texto BR em uma passada cada
+    - Com metas, insere 'Status' (🟢🟡🔴 da margem contra carregar_metas) antes da margem
+    """
+    df_display = df.copy(deep=False)
+    for col in colunas_monetarias:
+        if col in df_display.columns:
+            df_display[col] = format_currency_series(df_display[col])
+
+    if 'Margem' in df_display.columns or 'Margem (%)' in df_display.columns:
+        col_margem = 'Margem (%)' if 'Margem (%)' in df_display.columns else 'Margem'
+        if metas is not None and 'Status' not in df_display.columns:
+            df_display.insert(
+                df_display.columns.get_loc(col_margem), 'Status',
+                status_meta_series(df[col_margem], metas['margem_minima'], metas['margem_ideal'])
+            )
+        df_display[col_margem] = format_percent_series(df_display[col_margem])
+
+    if 'Crescimento' in df_display.columns and pd.api.types.is_numeric_dtype(df['Crescimento']):
+        # Matriz BCG do motor local: sem venda no período anterior = produto novo
+        df_display['Crescimento'] = format_percent_series(df['Crescimento']).where(df['Crescimento'] != np.inf, "Novo")
+
+    return df_display
+
+# ───────────────────────────────────────────────────────────────────────────────
+# 2.3 INSTRUMENTAÇÃO (spans de tempo: painel de perfil + log JSON Lines)
+# ───────────────────────────────────────────────────────────────────────────────
+
+@st.cache_resource
+def _estado_spans():
+    """
+    Pilha de spans abertos por thread + lock do log
+    Fica fora das globais do módulo: o script é reexecutado a cada rerun, mas
+    objetos em cache (CacheAbas, MotorLocal...) continuam anotando os spans
+    """
+    return {"local": threading.local(), "lock": threading.Lock()}
+
+def _pilha_spans():
+    local = _estado_spans()["local"]
+    if not hasattr(local, "pilha"):
+        local.pilha = []
+        local.nivel_base = 0
+    return local.pilha
+
+def span_atual():
+    """Registro do span mais interno aberto nesta thread (ou None)"""
+    pilha = _pilha_spans()
+    return pilha[-1] if pilha else None
+
+def herdar_span(pai):
+    """Spans desta thread (ex.: prefetch) ficam aninhados sob `pai`, aberto em outra thread"""
+    _pilha_spans()
+    _estado_spans()["local"].nivel_base = pai["nivel"] + 1 if pai else 0
+
+def anotar_span(**atributos):
+    """Acrescenta atributos (cache, linhas...) ao span mais interno desta thread"""
+    registro = span_atual()
+    if registro is not None:
+        registro.update(atributos)
+
+def abrir_span(nome, **atributos):
+    """Início de um span que não cabe num bloco `with` (fechar com fechar_span)"""
+    pilha = _pilha_spans()
+    registro = {"span": nome, **atributos,
+                "nivel": pilha[-1]["nivel"] + 1 if pilha else _estado_spans()["local"].nivel_base,
+                "inicio": time.perf_counter()}
+    pilha.append(registro)
+    return registro
+
+def fechar_span(registro):
+    """Fecha o span (e os internos que ficaram abertos) e registra"""
+    registro["segundos"] = time.perf_counter() - registro["inicio"]
+    pilha = _pilha_spans()
+    if registro in pilha:
+        del pilha[pilha.index(registro):]
+    _registrar_span(registro)
+
+@contextmanager
+def span(nome, **atributos):
+    """Mede o bloco; o registro devolvido aceita atributos definidos dentro dele"""
+    registro = abrir_span(nome, **atributos)
+    try:
+        yield registro
+    finally:
+        fechar_span(registro)
+
+def _linhas_resultado(resultado):
+    """Nº de linhas de um DataFrame (ou do primeiro de uma tupla); None nos demais"""
+    if isinstance(resultado, tuple) and resultado:
+        resultado = resultado[0]
+    return len(resultado) if isinstance(resultado, (pd.DataFrame, pd.Series)) else None
+
+def medido(funcao):
+    """Decorador: um span por chamada, com o nº de linhas do resultado"""
+    @functools.wraps(funcao)
+    def medida(*args, **kwargs):
+        with span(funcao.__name__) as registro:
+            resultado = funcao(*args, **kwargs)
+            registro.setdefault("linhas", _linhas_resultado(resultado))
+            return resultado
+    return medida
+
+def iniciar_perfil():
+    """Começa a coleta de spans de um rerun (lista nova na sessão)"""
+    st.session_state["_rerun_perfil"] = st.session_state.get("_rerun_perfil", 0) + 1
+    st.session_state["_spans"] = []
+    local = _estado_spans()["local"]
+    local.pilha = []
+    local.nivel_base = 0
+
+def _registrar_span(registro):
+    """Guarda o span no rerun da sessão (se houver) e no log"""
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        registro["sessao"] = ctx.session_id
+        try:
+            registro["rerun"] = st.session_state.get("_rerun_perfil")
+            spans = st.session_state.get("_spans")
+            if spans is not None:
+                spans.append(registro)
+        except Exception:
+            pass
+    _gravar_log_span(registro)
+
+def _caminho_log_spans():
+    if LOG_SPANS is not None:
+        return Path(LOG_SPANS) if LOG_SPANS else None
+    return Path(DIR_CACHE_DISCO) / "spans.jsonl"
+
+def _gravar_log_span(registro):
+    """Uma linha JSON por span (falha silenciosa: o log nunca derruba o app)"""
+    caminho = _caminho_log_spans()
+    if caminho is None:
+        return
+    linha = {"ts": datetime.now().isoformat(timespec="milliseconds"),
+             **{k: v for k, v in registro.items() if k != "inicio"}}
+    try:
+        with _estado_spans()["lock"]:
+            caminho.parent.mkdir(parents=True, exist_ok=True)
+            if caminho.exists() and caminho.stat().st_size > LIMITE_LOG_SPANS_BYTES:
+                os.replace(caminho, caminho.with_suffix(".jsonl.1"))
+            with open(caminho, "a", encoding="utf-8") as f:
+                f.write(json.dumps(linha, ensure_ascii=False, default=str) + "\n")
+    except OSError:
+        pass
+
+def tabela_spans(spans):
+    """Spans de um rerun em ordem de início, aninhados pela indentação"""
+    if not spans:
+        return pd.DataFrame(columns=["Etapa", "ms", "Cache", "Linhas"])
+    df = pd.DataFrame(spans).sort_values("inicio", kind="stable")
+    alvo = df["aba"] if "aba" in df.columns else pd.Series(None, index=df.index)
+    if "visao" in df.columns:
+        alvo = alvo.fillna(df["visao"])
+    etapa = df["nivel"].astype(int).map("\u2003".__mul__) + df["span"] + np.where(alvo.notna(), " · " + alvo.astype(str), "")
+    return pd.DataFrame({
+        "Etapa": etapa.to_numpy(),
+        "ms": (df["segundos"] * 1000).round(1).to_numpy(),
+        "Cache": df["cache"].fillna("").to_numpy() if "cache" in df.columns else "",
+        "Linhas": df["linhas"].astype("Int64").to_numpy() if "linhas" in df.columns else None,
+    })
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # 3. AUTENTICAÇÃO GOOGLE SHEETS
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -192,7 +631,13 @@ def get_gspread_client():
     """
     Autentica com Google Sheets usando service account
     Retorna cliente gspread autenticado
+    Só roda ao salvar ou testar a conexão: gspread e google-auth são importados
+    aqui para não pesar no carregamento do dashboard (que lê o export CSV)
+    A conexão é validada por quem abre a planilha (open_by_key de SHEET_ID)
     """
+    import gspread
+    from google.oauth2.service_account import Credentials
+    
     try:
         # Busca credenciais do Streamlit Secrets
         creds_raw = st.secrets.get("GOOGLE_SHEETS_CREDENTIALS")
@@ -243,16 +688,8 @@ def get_gspread_client():
             scopes=scopes
         )
         
-        # Autentica com gspread
-        client = gspread.authorize(credentials)
-        
-        # Testa conexão
-        try:
-            client.openall()
-            return client
-        except Exception as e:
-            st.error(f"❌ Erro ao testar conexão: {str(e)}")
-            return None
+        # Autentica com gspread (o token só é pedido na primeira chamada à API)
+        return gspread.authorize(credentials)
             
     except Exception as e:
         st.error(f"❌ Erro na autenticação: {str(e)}")
@@ -262,115 +699,1573 @@ def get_gspread_client():
 # 4. FUNÇÕES DE LEITURA DE DADOS (DASHBOARD)
 # ═══════════════════════════════════════════════════════════════════════════════
 
-@st.cache_data(ttl=300)
+# Trechos de nome que identificam colunas monetárias (texto "R$ 1.234,56")
+COLUNAS_MONETARIAS = [
+    'Total Venda', 'Custo Produto', 'Impostos', 'Comissão',
+    'Taxas Fixas', 'Embalagem', 'Investimento Ads', 
+    'Custo Total', 'Lucro Bruto', 'Valor', 'Custo', 'Preço'
+]
+
+def _coluna_monetaria(col):
+    """True para colunas em moeda ou percentual BR (limpas por limpar_dados_aba)"""
+    return any(mon in col for mon in COLUNAS_MONETARIAS) or col in ('Margem (%)', 'Margem')
+
+def limpar_dados_aba(df):
+    """
+    Aplica limpeza automática de dados brasileiros
+    (colunas monetárias, margem e quantidade)
+    """
+    # Identifica e limpa colunas monetárias
+    for col in df.columns:
+        if any(mon in col for mon in COLUNAS_MONETARIAS):
+            # "Comissão (%)", "Impostos (%)"... são percentuais, não moeda
+            if '%' in col:
+                df[col] = clean_percent_series(df[col])
+            else:
+                df[col] = clean_currency_series(df[col])
+    
+    # Limpa coluna de Margem
+    if 'Margem (%)' in df.columns or 'Margem' in df.columns:
+        col_margem = 'Margem (%)' if 'Margem (%)' in df.columns else 'Margem'
+        df[col_margem] = clean_percent_series(df[col_margem])
+    
+    # Limpa Quantidade
+    if 'Quantidade' in df.columns:
+        df['Quantidade'] = safe_int_series(df['Quantidade'])
+    
+    return df
+
+# Texto com até esta fração de valores distintos vira category
+LIMITE_CARDINALIDADE_CATEGORIA = 0.5
+
+def memoria_df(df):
+    """Bytes ocupados pelo DataFrame (inclui o conteúdo dos textos)"""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+def otimizar_tipos(df):
+    """
+    Reduz a memória de uma aba já limpa sem perder informação
+    - Data vira datetime64 quando todas as células preenchidas são datas
+    - Texto de baixa cardinalidade (Canal, CNPJ, Produto, Tipo...) vira category
+    - Números inteiros (inclusive valores sem centavos) viram int32 quando cabem
+    Valores com centavos continuam float64 (float32 erraria os totais)
+    """
+    df = df.copy(deep=False)
+    limite_int32 = np.iinfo("int32").max
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype) or pd.api.types.is_datetime64_any_dtype(serie):
+            continue
+        
+        if col == 'Data':
+            datas = datas_vendas(serie)
+            preenchidas = serie.notna().to_numpy() & (serie.astype(str).str.strip() != "").to_numpy()
+            if datas.notna().to_numpy()[preenchidas].all():
+                df[col] = datas
+                continue
+        
+        if pd.api.types.is_bool_dtype(serie):
+            continue
+        if pd.api.types.is_numeric_dtype(serie):
+            valores = serie.to_numpy(dtype="float64", na_value=np.nan)
+            if (len(valores) and np.isfinite(valores).all() and (valores == np.trunc(valores)).all()
+                    and np.abs(valores).max() <= limite_int32):
+                df[col] = serie.astype("int32")
+        elif len(serie) and serie.nunique(dropna=False) <= LIMITE_CARDINALIDADE_CATEGORIA * len(serie):
+            df[col] = serie.astype("category")
+    return df
+
+# ───────────────────────────────────────────────────────────────────────────────
+# 4.1 CACHE EM DISCO (Parquet por GID, revalidado por ETag / hash do CSV)
+# ───────────────────────────────────────────────────────────────────────────────
+
+def _caminhos_cache_disco(gid):
+    """Retorna (arquivo parquet, arquivo de metadados) do cache de uma aba"""
+    base = Path(DIR_CACHE_DISCO)
+    return base / f"{gid}.parquet", base / f"{gid}.json"
+
+def _ler_cache_disco(gid):
+    """Lê metadados do cache em disco; retorna {} se não houver cache válido"""
+    arquivo_dados, arquivo_meta = _caminhos_cache_disco(gid)
+    if not arquivo_dados.exists() or not arquivo_meta.exists():
+        return {}
+    try:
+        return json.loads(arquivo_meta.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def _salvar_cache_disco(gid, df, meta):
+    """Grava DataFrame limpo + metadados (escrita atômica, falha silenciosa)"""
+    arquivo_dados, arquivo_meta = _caminhos_cache_disco(gid)
+    try:
+        arquivo_dados.parent.mkdir(parents=True, exist_ok=True)
+        if df is not None:
+            temporario = arquivo_dados.with_suffix(".parquet.tmp")
+            df.to_parquet(temporario, index=False)
+            os.replace(temporario, arquivo_dados)
+        arquivo_meta.write_text(json.dumps(meta), encoding="utf-8")
+    except Exception:
+        # Cache é só otimização: nunca derruba o carregamento
+        pass
+
+# Colunas lidas sempre como texto no parse do CSV (as demais o pyarrow infere)
+# Chaves não podem virar número: SKU "00123" perderia o zero à esquerda
+COLUNAS_TEXTO_CSV = ["Data", "Canal", "Marketplace", "CNPJ", "Produto", "SKU", "Tipo", "Classificação"]
+COLUNAS_TEXTO_ABAS = {
+    "produtos": ["Código", "Codigo"],
+    "kits": ["Kit", "SKU Kit", "Código Kit", "Codigo Kit", "Componente", "SKU Componente"],
+    "impostos": ["Regime", "CNPJ / Regime"],
+}
+
+# Mesmos marcadores de vazio do pd.read_csv
+VALORES_NULOS_CSV = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+@st.cache_resource
+def get_sessao_http():
+    """
+    Session HTTP compartilhada pelos downloads (keep-alive)
+    Pool com uma conexão por thread do prefetch, retentativa com backoff
+    em falha de rede / 429 / 5xx e resposta comprimida (gzip)
+    """
+    sessao = requests.Session()
+    retentativas = Retry(
+        total=TENTATIVAS_DOWNLOAD,
+        backoff_factor=BACKOFF_DOWNLOAD,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,  # a última resposta segue para raise_for_status
+    )
+    adaptador = HTTPAdapter(
+        pool_connections=4,  # docs.google.com + host do redirect do export
+        pool_maxsize=MAX_DOWNLOADS_PARALELOS,
+        max_retries=retentativas,
+    )
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    sessao.headers["Accept-Encoding"] = "gzip, deflate"
+    return sessao
+
+def colunas_chave_aba(nome_aba, colunas):
+    """Colunas da aba que são chaves/rótulos de texto (nunca números)"""
+    texto = set(COLUNAS_TEXTO_CSV) | set(COLUNAS_TEXTO_ABAS.get(nome_aba, ()))
+    return [col for col in colunas if col in texto]
+
+def tipos_csv_aba(nome_aba, colunas):
+    """Colunas da aba que o parse deve manter como texto (chaves e valores BR)"""
+    chaves = set(colunas_chave_aba(nome_aba, colunas))
+    return [col for col in colunas if col in chaves or _coluna_monetaria(col)]
+
+def _ler_csv_pyarrow(conteudo, texto):
+    """
+    pyarrow.csv com as colunas de `texto` fixas em string; devolve um DataFrame
+    com os mesmos tipos que o pd.read_csv daria (datas continuam texto,
+    coluna toda vazia vira float)
+    """
+    # Linha longa é descartada, como no on_bad_lines='skip'; linha curta o pandas
+    # completa com NaN - "error" levanta ArrowInvalid e ler_csv_aba cai na engine C
+    opcoes_parse = pa_csv.ParseOptions(
+        invalid_row_handler=lambda linha: "skip" if linha.actual_columns > linha.expected_columns else "error"
+    )
+    tipos = {col: pa.string() for col in texto}
+    for _ in range(2):
+        tabela = pa_csv.read_csv(
+            pa.BufferReader(conteudo),
+            parse_options=opcoes_parse,
+            convert_options=pa_csv.ConvertOptions(
+                column_types=tipos, null_values=VALORES_NULOS_CSV, strings_can_be_null=True,
+            ),
+        )
+        # O pandas não reconhece datas no parse: relê essas colunas como texto
+        temporais = [campo.name for campo in tabela.schema if pa.types.is_temporal(campo.type)]
+        if not temporais:
+            break
+        tipos.update({col: pa.string() for col in temporais})
+    
+    for i, campo in enumerate(tabela.schema):
+        if pa.types.is_null(campo.type):
+            tabela = tabela.set_column(i, campo.name, tabela.column(i).cast(pa.float64()))
+    return tabela.to_pandas()
+
+def ler_csv_aba(nome_aba, conteudo):
+    """
+    Parse do CSV exportado direto dos bytes da resposta
+    - Engine pyarrow (multithread) com tipos explícitos por aba: chaves e
+      valores em texto BR como string, o resto inferido
+    - Cabeçalho repetido, linha curta ou CSV que o pyarrow recusa: engine C do pandas
+    Linhas com colunas a mais são descartadas e linhas curtas completadas com
+    vazio, como no pd.read_csv(on_bad_lines='skip')
+    """
+    try:
+        colunas = next(csv.reader([conteudo.split(b"\n", 1)[0].decode("utf-8-sig")]), [])
+    except (UnicodeDecodeError, csv.Error):
+        colunas = []
+    texto = tipos_csv_aba(nome_aba, colunas)
+    
+    if colunas and len(set(colunas)) == len(colunas):
+        try:
+            return _ler_csv_pyarrow(conteudo, texto)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+    
+    return pd.read_csv(io.BytesIO(conteudo), dtype={col: str for col in texto}, on_bad_lines='skip')
+
+def _baixar_aba(nome_aba, url):
+    """
+    Baixa o CSV de uma aba usando o cache em disco
+    - 304 (ETag/Last-Modified) ou mesmo hash do conteúdo: lê o Parquet local
+    - Conteúdo novo: faz parse + limpeza e atualiza o cache
+    """
+    gid = ABAS[nome_aba]["gid"]
+    meta = _ler_cache_disco(gid)
+    arquivo_dados, _ = _caminhos_cache_disco(gid)
+    
+    # Requisição condicional
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    
+    resposta = get_sessao_http().get(url, headers=headers, timeout=(TIMEOUT_CONEXAO, TIMEOUT_DOWNLOAD))
+    if resposta.status_code == 304 and meta:
+        return _ler_parquet_otimizado(gid, meta)
+    resposta.raise_for_status()
+    
+    conteudo = resposta.content
+    novo_meta = {
+        "sha256": hashlib.sha256(conteudo).hexdigest(),
+        "etag": resposta.headers.get("ETag"),
+        "last_modified": resposta.headers.get("Last-Modified"),
+        "atualizado_em": datetime.now().isoformat(timespec="seconds"),
+    }
+    
+    return _aba_do_conteudo(gid, meta, novo_meta, lambda: ler_csv_aba(nome_aba, conteudo))
+
+def _aba_do_conteudo(gid, meta, novo_meta, ler):
+    """
+    Etapa comum às fontes: mesmo hash do último conteúdo lê o Parquet local
+    (sem `meta`, sempre relê); senão `ler()` dá o DataFrame bruto, que é limpo, otimizado e gravado em disco
+    """
+    # Conteúdo idêntico ao último download: pula parse e limpeza
+    if meta and meta.get("sha256") == novo_meta["sha256"]:
+        try:
+            if "memoria" in meta:
+                novo_meta["memoria"] = meta["memoria"]
+            df = _ler_parquet_otimizado(gid, novo_meta)
+            _salvar_cache_disco(gid, None, novo_meta)
+            return df
+        except Exception:
+            pass
+    
+    df = ler()
+    
+    if df.empty:
+        return pd.DataFrame()
+    
+    df, novo_meta["memoria"] = _otimizar_com_relatorio(limpar_dados_aba(df))
+    _salvar_cache_disco(gid, df, novo_meta)
+    return df
+
+@st.cache_resource
+def _planilha_api():
+    """Planilha SHEET_ID aberta pelo cliente autenticado (falha não fica em cache)"""
+    client = get_gspread_client()
+    if not client:
+        raise RuntimeError("Falha na autenticação do Google Sheets")
+    return client.open_by_key(SHEET_ID)
+
+def _faixa_api(nome_aba):
+    """Range A1 da aba inteira ('Custo por pedido' entre aspas simples)"""
+    return "'" + ABAS[nome_aba]["nome"].replace("'", "''") + "'"
+
+def _texto_chave_api(valor):
+    """Célula de chave vinda da API como o CSV mostraria: 123 / 123.0 -> '123', vazio -> None"""
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+def _df_valores_api(nome_aba, linhas):
+    """
+    Monta o DataFrame bruto a partir dos valores do batchGet (1ª linha = cabeçalho)
+    com os tipos que o export CSV daria: chaves em texto (convertidas célula a
+    célula, antes de o pandas inferir float), vazio = NaN e colunas numéricas
+    já numéricas (as limpezas BR passam direto por elas)
+    Percentuais chegam como fração exata (0,5% = 0.005, 150% = 1.5): como no
+    CSV, número acima de 1 é lido como % inteiro (1.5 -> 0.015); abaixo de 1%
+    a API acerta onde o texto "0,50%" do CSV vira 0.5
+    """
+    if not linhas:
+        return pd.DataFrame()
+    colunas = _nomes_colunas(linhas[0])
+    largura = len(colunas)
+    # A API corta as células vazias no fim de cada linha
+    dados = [linha if len(linha) == largura else (linha + [None] * largura)[:largura] for linha in linhas[1:]]
+    df = pd.DataFrame(dados, columns=colunas, dtype=object)
+    chaves = set(colunas_chave_aba(nome_aba, colunas))
+    
+    for col in colunas:
+        serie = df[col]
+        if col in chaves:
+            df[col] = pd.Series([_texto_chave_api(v) for v in serie.to_numpy()], index=df.index, dtype=object).infer_objects()
+            continue
+        # Célula vazia no meio da linha chega como "" (no CSV seria NaN)
+        serie = serie.mask(serie.eq(""))
+        df[col] = np.nan if serie.isna().all() else serie.infer_objects()
+    return df
+
+def _baixar_abas_api(nomes_abas):
+    """
+    Baixa várias abas numa única chamada values.batchGet (Sheets API autenticada)
+    - UNFORMATTED_VALUE: moeda e percentual chegam como número, sem "R$" para limpar
+    - Datas continuam texto formatado, como no export CSV
+    Grava no mesmo cache em disco do CSV; sem hash do conteúdo, que custaria
+    mais que a limpeza (já quase toda em colunas numéricas)
+    Retorna {nome: DataFrame}
+    """
+    nomes = list(nomes_abas)
+    resposta = _planilha_api().values_batch_get(
+        [_faixa_api(nome) for nome in nomes],
+        params={"valueRenderOption": "UNFORMATTED_VALUE", "dateTimeRenderOption": "FORMATTED_STRING"},
+    )
+    faixas = resposta.get("valueRanges", [])
+    if len(faixas) != len(nomes):
+        raise RuntimeError(f"batchGet devolveu {len(faixas)} de {len(nomes)} abas")
+    
+    resultado = {}
+    for nome, faixa in zip(nomes, faixas):
+        linhas = faixa.get("values", [])
+        novo_meta = {
+            "sha256": None,
+            "fonte": FONTE_API,
+            "atualizado_em": datetime.now().isoformat(timespec="seconds"),
+        }
+        resultado[nome] = _aba_do_conteudo(
+            ABAS[nome]["gid"], {}, novo_meta, lambda nome=nome, linhas=linhas: _df_valores_api(nome, linhas)
+        )
+    return resultado
+
+def _otimizar_com_relatorio(df):
+    """otimizar_tipos + [bytes antes, bytes depois] (também guardado em df.attrs)"""
+    antes = memoria_df(df)
+    df = otimizar_tipos(df)
+    memoria = [antes, memoria_df(df)]
+    df.attrs["memoria"] = tuple(memoria)
+    return df, memoria
+
+def _ler_parquet_otimizado(gid, meta):
+    """Lê o Parquet da aba; cache gravado antes da otimização de tipos é convertido e regravado"""
+    arquivo_dados, _ = _caminhos_cache_disco(gid)
+    df = pd.read_parquet(arquivo_dados)
+    if "memoria" not in meta:
+        df, meta["memoria"] = _otimizar_com_relatorio(df)
+        _salvar_cache_disco(gid, df, meta)
+    df.attrs["memoria"] = tuple(meta["memoria"])
+    return df
+
+def _ler_df_cache_disco(nome_aba):
+    """Lê o último DataFrame gravado em disco para a aba (ou None)"""
+    gid = ABAS[nome_aba]["gid"]
+    meta = _ler_cache_disco(gid)
+    if not meta:
+        return None
+    try:
+        return _ler_parquet_otimizado(gid, meta)
+    except Exception:
+        return None
+
+# ───────────────────────────────────────────────────────────────────────────────
+# 4.2 CACHE EM MEMÓRIA (stale-while-revalidate)
+# ───────────────────────────────────────────────────────────────────────────────
+
+class CacheAbas:
+    """
+    Cache em memória compartilhado entre sessões
+    - Aba expirada continua sendo servida enquanto uma thread refaz o download
+    - Invalidação seletiva: só as abas escolhidas são recarregadas
+    - Só bloqueia na primeira carga de uma aba sem nenhuma cópia (nem em disco)
+    - Orçamento de bytes: acima dele as abas usadas há mais tempo saem da memória
+      (voltam do Parquet em disco com a mesma versão no próximo acesso)
+    - Fonte CSV: um download por aba; fonte API: as abas agendadas juntas
+      saem de um único batchGet
+    """
+    
+    def __init__(self, ttl=TTL_ABAS, max_workers=MAX_DOWNLOADS_PARALELOS, orcamento_bytes=ORCAMENTO_CACHE_BYTES):
+        self.ttl = ttl
+        self.orcamento_bytes = orcamento_bytes
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # nome -> {"df", "carregado_em", "erro", "bytes"}, do menos ao mais usado
+        self._despejadas = {}           # nome -> carregado_em da versão que saiu da memória
+        self._contadores = {"acertos": 0, "faltas": 0, "despejos": 0}
+        self._em_andamento = {}   # nome -> Future do download
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="atualiza-aba")
+    
+    def obter(self, nome_aba, fonte=FONTE_CSV):
+        """Retorna (DataFrame, erro) da aba, agendando recarga se expirada"""
+        with self._lock:
+            entrada = self._entradas.get(nome_aba)
+            if entrada is not None:
+                self._entradas.move_to_end(nome_aba)
+                self._contadores["acertos"] += 1
+            else:
+                self._contadores["faltas"] += 1
+        anotar_span(cache="acerto" if entrada is not None else "falta")
+        
+        if entrada is None:
+            # Início a frio: serve a cópia do disco e revalida em segundo plano
+            df_disco = _ler_df_cache_disco(nome_aba)
+            if df_disco is not None:
+                anotar_span(cache="disco")
+                with self._lock:
+                    entrada = self._entradas.setdefault(nome_aba, {
+                        "df": df_disco,
+                        # Aba despejada volta com a versão que tinha (o disco guarda o mesmo conteúdo)
+                        "carregado_em": self._despejadas.pop(nome_aba, 0.0),
+                        "erro": None,
+                        "bytes": memoria_df(df_disco),
+                    })
+                    self._aplicar_orcamento(nome_aba)
+            else:
+                df_baixado = None
+                try:
+                    df_baixado = self._agendar(nome_aba, fonte).result()
+                except Exception:
+                    pass
+                with self._lock:
+                    entrada = self._entradas.get(nome_aba)
+                if entrada is None:
+                    # Despejada logo após o download por outra sessão: usa o resultado direto
+                    entrada = {"df": df_baixado if df_baixado is not None else pd.DataFrame(),
+                               "carregado_em": time.time(), "erro": None}
+        
+        if time.time() - entrada["carregado_em"] > self.ttl:
+            anotar_span(revalidando=True)
+            self._agendar(nome_aba, fonte)
+        
+        return entrada["df"], entrada["erro"]
+    
+    def invalidar(self, nomes_abas=None, fonte=FONTE_CSV):
+        """Expira as abas indicadas (todas se None) e recarrega em segundo plano"""
+        nomes = list(nomes_abas) if nomes_abas else list(ABAS_URLS.keys())
+        with self._lock:
+            for nome in nomes:
+                if nome in self._entradas:
+                    self._entradas[nome]["carregado_em"] = 0.0
+        self._agendar_varias(nomes, fonte)
+    
+    def preparar(self, nomes_abas, fonte=FONTE_CSV):
+        """
+        Agenda de uma vez as abas sem cópia ou expiradas (antes dos obter do prefetch)
+        Na fonte API isso vira um único batchGet em vez de um por aba
+        """
+        agora = time.time()
+        with self._lock:
+            pendentes = []
+            for nome in nomes_abas:
+                entrada = self._entradas.get(nome)
+                versao = entrada["carregado_em"] if entrada else self._despejadas.get(nome, 0.0)
+                if agora - versao > self.ttl:
+                    pendentes.append(nome)
+        if pendentes:
+            self._agendar_varias(pendentes, fonte)
+    
+    def atualizando(self):
+        """Lista as abas com download em andamento"""
+        with self._lock:
+            return list(self._em_andamento.keys())
+    
+    def versao(self, nome_aba):
+        """Momento da última carga da aba (muda a cada atualização)"""
+        with self._lock:
+            entrada = self._entradas.get(nome_aba)
+            return entrada["carregado_em"] if entrada else self._despejadas.get(nome_aba)
+    
+    def estatisticas(self):
+        """Contadores de acerto / falta / despejo e bytes ocupados"""
+        with self._lock:
+            return {
+                **self._contadores,
+                "bytes": sum(e["bytes"] for e in self._entradas.values()),
+                "orcamento": self.orcamento_bytes,
+                "abas": len(self._entradas),
+            }
+    
+    def _aplicar_orcamento(self, protegida):
+        """Despeja as abas menos usadas até caber no orçamento (chamado com o lock)"""
+        total = sum(e["bytes"] for e in self._entradas.values())
+        for nome in list(self._entradas):
+            if total <= self.orcamento_bytes:
+                break
+            if nome == protegida:
+                continue
+            entrada = self._entradas.pop(nome)
+            total -= entrada["bytes"]
+            if entrada["erro"] is None:
+                self._despejadas[nome] = entrada["carregado_em"]
+            self._contadores["despejos"] += 1
+    
+    def _agendar(self, nome_aba, fonte=FONTE_CSV):
+        """Agenda download da aba (no máximo um por aba ao mesmo tempo)"""
+        return self._agendar_varias([nome_aba], fonte)[nome_aba]
+    
+    def _agendar_varias(self, nomes_abas, fonte=FONTE_CSV):
+        """
+        Agenda as abas que ainda não têm download em andamento
+        Retorna {nome: Future com o DataFrame da aba}
+        """
+        with self._lock:
+            futuros = {nome: self._em_andamento[nome] for nome in nomes_abas if nome in self._em_andamento}
+            novas = [nome for nome in nomes_abas if nome not in futuros]
+            if novas and fonte == FONTE_API:
+                lote = {nome: Future() for nome in novas}
+                self._em_andamento.update(lote)
+                futuros.update(lote)
+                self._executor.submit(self._atualizar_lote, lote)
+            else:
+                for nome in novas:
+                    futuros[nome] = self._em_andamento[nome] = self._executor.submit(self._atualizar, nome)
+            return futuros
+    
+    def _atualizar(self, nome_aba):
+        """Baixa a aba e troca a entrada; em erro mantém a última versão boa"""
+        try:
+            df = _baixar_aba(nome_aba, ABAS_URLS[nome_aba])
+            self._guardar(nome_aba, df)
+            return df
+        except Exception as e:
+            self._guardar_erro(nome_aba, e)
+            raise
+        finally:
+            with self._lock:
+                self._em_andamento.pop(nome_aba, None)
+    
+    def _atualizar_lote(self, lote):
+        """Baixa as abas do lote num único batchGet e resolve o Future de cada uma"""
+        dfs, erro = {}, None
+        try:
+            dfs = _baixar_abas_api(lote.keys())
+        except Exception as e:
+            erro = e
+        for nome, futuro in lote.items():
+            if erro is None:
+                self._guardar(nome, dfs[nome])
+            else:
+                self._guardar_erro(nome, erro)
+            with self._lock:
+                self._em_andamento.pop(nome, None)
+            if erro is None:
+                futuro.set_result(dfs[nome])
+            else:
+                futuro.set_exception(erro)
+    
+    def _guardar(self, nome_aba, df):
+        """Troca a entrada da aba pela versão recém-baixada"""
+        with self._lock:
+            self._entradas[nome_aba] = {"df": df, "carregado_em": time.time(), "erro": None, "bytes": memoria_df(df)}
+            self._entradas.move_to_end(nome_aba)
+            self._despejadas.pop(nome_aba, None)
+            self._aplicar_orcamento(nome_aba)
+    
+    def _guardar_erro(self, nome_aba, erro):
+        """Registra o erro mantendo a última versão boa da aba"""
+        with self._lock:
+            anterior = self._entradas.get(nome_aba)
+            # Sem versão anterior guarda DataFrame vazio (evita novo download a cada clique)
+            self._entradas[nome_aba] = {
+                "df": anterior["df"] if anterior else pd.DataFrame(),
+                "carregado_em": time.time(),
+                "erro": str(erro),
+                "bytes": anterior["bytes"] if anterior else 0,
+            }
+
+@st.cache_resource
+def get_cache_abas():
+    """Instância única do cache de abas (compartilhada entre sessões)"""
+    return CacheAbas()
+
+def fonte_abas():
+    """Fonte escolhida na barra lateral: export CSV ou Sheets API (batchGet)"""
+    fonte = st.session_state.get("fonte_abas", FONTE_ABAS_PADRAO)
+    return fonte if fonte in FONTES_ABAS else FONTE_CSV
+
+def trocar_fonte_abas():
+    """Callback do seletor de fonte: recarrega todas as abas pela fonte nova"""
+    get_cache_abas().invalidar(fonte=fonte_abas())
+    st.session_state.pop("prefetch_em", None)
+
 def carregar_aba(nome_aba):
     """
-    Carrega uma aba da planilha via CSV export
+    Carrega uma aba da planilha via CSV export (ou Sheets API, conforme fonte_abas)
     Aplica limpeza automática de dados brasileiros
+    Serve a última versão em cache enquanto revalida em segundo plano
     """
+    if nome_aba not in ABAS_URLS:
+        st.error(f"❌ Aba '{nome_aba}' não encontrada no mapeamento")
+        return pd.DataFrame()
+    
+    with span("carregar_aba", aba=nome_aba) as registro:
+        df, erro = get_cache_abas().obter(nome_aba, fonte_abas())
+        registro["linhas"] = len(df)
+    if erro and df.empty:
+        st.error(f"❌ Erro ao carregar aba '{nome_aba}': {erro}")
+    
+    # Cópia rasa: compartilha os dados com o cache (Copy-on-Write protege o original)
+    return df.copy(deep=False)
+
+@medido
+def carregar_dashboard_geral():
+    """Carrega a aba Dashboard_Geral (dados consolidados por canal)"""
+    filtrado = visao_filtrada("dashboard_geral", lambda vendas: agregar_metricas(vendas, 'Canal'))
+    if filtrado is not None:
+        return filtrado
+    if usar_motor_local():
+        return calcular_abas_locais()["dashboard_geral"]
+    return carregar_aba("dashboard_geral")
+
+@medido
+def carregar_bcg_canal():
+    """Carrega a aba BCG_Canal_Mkt (matriz BCG por canal)"""
+    filtrado = visao_filtrada("bcg_canal_mkt", classificar_bcg)
+    if filtrado is not None:
+        return filtrado
+    if usar_motor_local():
+        return calcular_bcg_local()
+    return carregar_aba("bcg_canal_mkt")
+
+@medido
+def carregar_vendas_sku(explodir_kits=False):
+    """
+    Carrega a aba Vendas_sku_geral (giro de produtos)
+    Com `explodir_kits`, o giro é somado das linhas de venda com cada kit
+    trocado pelos seus componentes (índice de referências)
+    """
+    def construir(vendas):
+        return _finalizar_agregado(_somar_metricas(vendas, 'Produto'), 'Produto', 'Quantidade')
+    
+    if explodir_kits:
+        referencias = get_indice_referencias()
+        return get_indice_consulta().visao(
+            filtro_atual() or FILTRO_TODAS, ("vendas_sku_componentes", referencias.versao),
+            lambda vendas: construir(referencias.explodir_kits(vendas))
+        )
+    
+    filtrado = visao_filtrada("vendas_sku_geral", construir)
+    if filtrado is not None:
+        return filtrado
+    if usar_motor_local():
+        return calcular_abas_locais()["vendas_sku_geral"]
+    return carregar_aba("vendas_sku_geral")
+
+@medido
+def carregar_oportunidades():
+    """Carrega a aba Oportunidades_canais_mkt"""
+    if usar_motor_local() or filtro_atual() is not None:
+        df_bcg = carregar_bcg_canal()
+        return df_bcg[df_bcg['Classificação'] == "Interrogação ❓"].reset_index(drop=True)
+    return carregar_aba("oportunidades_canais_mkt")
+
+@medido
+def carregar_resultado_cnpj():
+    """Carrega a aba Resultado_CNPJ"""
+    filtrado = visao_filtrada("resultado_cnpj", lambda vendas: agregar_metricas(vendas, 'CNPJ'))
+    if filtrado is not None:
+        return filtrado
+    if usar_motor_local():
+        return calcular_abas_locais()["resultado_cnpj"]
+    return carregar_aba("resultado_cnpj")
+
+@medido
+def carregar_precos_mktp():
+    """Carrega a aba Preço_Simples_MKTP"""
+    return carregar_aba("preco_simples_mktp")
+
+@medido
+def carregar_metas():
+    """Carrega metas da planilha ou usa valores padrão"""
     try:
-        url = ABAS_URLS.get(nome_aba)
-        if not url:
-            st.error(f"❌ Aba '{nome_aba}' não encontrada no mapeamento")
-            return pd.DataFrame()
-        
-        # Lê CSV
-        df = pd.read_csv(url, on_bad_lines='skip')
-        
-        if df.empty:
-            return pd.DataFrame()
-        
-        # Identifica e limpa colunas monetárias
-        colunas_monetarias = [
-            'Total Venda', 'Custo Produto', 'Impostos', 'Comissão',
-            'Taxas Fixas', 'Embalagem', 'Investimento Ads', 
-            'Custo Total', 'Lucro Bruto', 'Valor', 'Custo', 'Preço'
-        ]
+        df_metas = carregar_aba("metas")
+        if not df_metas.empty and len(df_metas) > 0:
+            # Tenta extrair valores da primeira linha
+            metas_custom = {}
+            if 'Margem Mínima' in df_metas.columns:
+                metas_custom['margem_minima'] = clean_percent_series(df_metas['Margem Mínima'].head(1)).iloc[0]
+            if 'Margem Ideal' in df_metas.columns:
+                metas_custom['margem_ideal'] = clean_percent_series(df_metas['Margem Ideal'].head(1)).iloc[0]
+            if 'Ticket Mínimo' in df_metas.columns:
+                metas_custom['ticket_minimo'] = clean_currency_series(df_metas['Ticket Mínimo'].head(1)).iloc[0]
+            if 'Ticket Ideal' in df_metas.columns:
+                metas_custom['ticket_ideal'] = clean_currency_series(df_metas['Ticket Ideal'].head(1)).iloc[0]
+            
+            # Mescla com valores padrão
+            return {**METAS, **metas_custom}
+    except:
+        pass
+    
+    return METAS
+
+@medido
+def prefetch_abas(nomes_abas=None):
+    """
+    Baixa as abas em paralelo (pool limitado de threads)
+    Preenche o mesmo cache de carregar_aba e retorna o tempo de cada aba
+    """
+    nomes = list(nomes_abas) if nomes_abas else list(ABAS_URLS.keys())
+    if not nomes:
+        return {}
+    
+    # Fonte API: as abas pendentes saem juntas num batchGet (as threads só aguardam)
+    fonte = fonte_abas()
+    if fonte == FONTE_API:
+        get_cache_abas().preparar(nomes, fonte)
+    
+    # Propaga o contexto do Streamlit para as threads (st.error continua funcionando)
+    ctx = get_script_run_ctx()
+    pai = span_atual()
+    
+    def _carregar(nome):
+        if ctx is not None:
+            add_script_run_ctx(ctx=ctx)
+        herdar_span(pai)
+        inicio = time.perf_counter()
+        df = carregar_aba(nome)
+        antes, depois = df.attrs.get("memoria", (None, None))
+        return nome, {"segundos": time.perf_counter() - inicio, "linhas": len(df),
+                      "memoria_antes": antes, "memoria_depois": depois}
+    
+    with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOADS_PARALELOS, len(nomes))) as pool:
+        return dict(pool.map(_carregar, nomes))
+
+# ───────────────────────────────────────────────────────────────────────────────
+# 4.3 MOTOR LOCAL DE CÁLCULO (substitui as fórmulas das abas processadas)
+# Detalhes_Canais + abas de referência -> métricas por canal / CNPJ / SKU
+# ───────────────────────────────────────────────────────────────────────────────
+
+# Abas de que o motor depende (a versão de cada uma invalida o resultado)
+ABAS_MOTOR = ["detalhes_canais", "produtos", "kits", "custos", "canais", "impostos", "frete"]
+ABAS_REFERENCIA = ABAS_MOTOR[1:]
+
+# Nomes aceitos para as colunas das abas de referência (primeiro encontrado vale)
+COLUNAS_REFERENCIA = {
+    "produto_chave": ["SKU", "Código", "Codigo", "Produto"],
+    "produto_custo": ["Custo Unitário", "Custo Unitario", "Custo Produto", "Custo"],
+    "kit_chave": ["Kit", "SKU Kit", "Código Kit", "Codigo Kit"],
+    "kit_componente": ["Componente", "SKU Componente", "Produto", "SKU"],
+    "kit_quantidade": ["Quantidade", "Qtd", "Qtde"],
+    "canal": ["Canal", "Marketplace"],
+    "comissao": ["Comissão (%)", "Comissão", "Comissao (%)", "Comissao"],
+    "taxa_fixa": ["Taxa Fixa", "Taxas Fixas", "Tarifa Fixa"],
+    "custo_pedido": ["Custo por pedido", "Custo por Pedido", "Custo", "Valor"],
+    "imposto_chave": ["CNPJ", "Regime", "CNPJ / Regime"],
+    "aliquota": ["Alíquota (%)", "Alíquota", "Aliquota (%)", "Aliquota", "Impostos (%)", "Impostos"],
+    "frete": ["Frete", "Valor Frete", "Custo Frete", "Valor"],
+}
+
+# Abas calculadas por soma incremental: aba -> dimensão
+DIMENSOES_MOTOR = {"dashboard_geral": "Canal", "resultado_cnpj": "CNPJ", "vendas_sku_geral": "Produto"}
+COLUNAS_SOMADAS = ['Quantidade', 'Total Venda', 'Custo Total', 'Impostos', 'Lucro Bruto']
+
+COLUNAS_METRICAS = ['Quantidade', 'Total Venda', 'Custo Produto', 'Impostos', 'Comissão',
+                    'Taxas Fixas', 'Embalagem', 'Frete', 'Investimento Ads', 'Custo Total', 'Lucro Bruto']
+
+# Colunas de custo lidas da planilha (valor ≠ 0 prevalece sobre o calculado)
+COLUNAS_CUSTO_DETALHES = ['Custo Produto', 'Impostos', 'Comissão', 'Taxas Fixas', 'Embalagem', 'Frete', 'Investimento Ads']
+
+def impressao_detalhes(df):
+    """
+    Resumo barato e independente da ordem das linhas de Detalhes_Canais:
+    (nº de linhas, soma mod 2**64 de hash_linhas_vendas, somas das colunas de custo)
+    Edição de uma célula-chave, troca de linha ou custo alterado mudam o resumo
+    """
+    hashes = hash_linhas_vendas(df)
+    somas = np.array([
+        float(clean_currency_series(df[col]).sum()) if col in df.columns else 0.0
+        for col in COLUNAS_CUSTO_DETALHES
+    ])
+    return len(df), int(hashes.sum(dtype="uint64")), somas
+
+def _somar_impressoes(a, b):
+    """Resumo de Detalhes_Canais com as linhas de `b` acrescentadas às de `a`"""
+    return a[0] + b[0], (a[1] + b[1]) % 2**64, a[2] + b[2]
+
+def _mesma_impressao(a, b):
+    """Compara dois resumos (somas de custo com tolerância de centavos)"""
+    return a[0] == b[0] and a[1] == b[1] and np.allclose(a[2], b[2], rtol=1e-9, atol=0.005)
+
+def usar_motor_local():
+    """True quando o usuário escolheu calcular as abas processadas no app"""
+    return st.session_state.get("motor_local", False)
+
+def _achar_coluna(df, tipo):
+    """Primeira coluna de df que corresponde a um dos nomes aceitos para `tipo`"""
+    colunas = {normalizar(c): c for c in df.columns}
+    for candidato in COLUNAS_REFERENCIA[tipo]:
+        if normalizar(candidato) in colunas:
+            return colunas[normalizar(candidato)]
+    return None
+
+def _tabela_lookup(df, tipo_chave, tipo_valor, conversor=clean_currency_series):
+    """Series chave normalizada -> valor numérico (vazia se a aba não tiver as colunas)"""
+    if df is None or df.empty:
+        return pd.Series(dtype="float64")
+    col_chave = _achar_coluna(df, tipo_chave)
+    col_valor = _achar_coluna(df, tipo_valor)
+    if col_chave is None or col_valor is None or col_chave == col_valor:
+        return pd.Series(dtype="float64")
+    tabela = pd.Series(conversor(df[col_valor]).to_numpy(), index=normalizar_series(df[col_chave]))
+    return tabela[~tabela.index.duplicated(keep="first")]
+
+def _custos_unitarios(df_produtos, df_kits):
+    """
+    Custo unitário por produto normalizado (por SKU e por nome)
+    Kits sem custo próprio = soma(custo do componente x quantidade)
+    """
+    custos = []
+    if df_produtos is not None and not df_produtos.empty:
+        col_custo = _achar_coluna(df_produtos, "produto_custo")
+        if col_custo is not None:
+            for col_chave in (c for c in COLUNAS_REFERENCIA["produto_chave"] if c in df_produtos.columns):
+                if col_chave != col_custo:
+                    custos.append(pd.Series(
+                        clean_currency_series(df_produtos[col_custo]).to_numpy(),
+                        index=normalizar_series(df_produtos[col_chave])
+                    ))
+    custo = pd.concat(custos) if custos else pd.Series(dtype="float64")
+    custo = custo[~custo.index.duplicated(keep="first")]
+    
+    if df_kits is not None and not df_kits.empty and len(custo):
+        col_kit = _achar_coluna(df_kits, "kit_chave")
+        col_comp = _achar_coluna(df_kits, "kit_componente")
+        col_qtd = _achar_coluna(df_kits, "kit_quantidade")
+        if col_kit is not None and col_comp is not None and col_comp != col_kit:
+            qtd = safe_int_series(df_kits[col_qtd]) if col_qtd else pd.Series(1, index=df_kits.index)
+            custo_kit = (
+                normalizar_series(df_kits[col_comp]).map(custo).fillna(0.0).to_numpy() * qtd.to_numpy()
+            )
+            custo_kit = pd.Series(custo_kit).groupby(normalizar_series(df_kits[col_kit]).to_numpy()).sum()
+            custo = pd.concat([custo, custo_kit[~custo_kit.index.isin(custo.index)]])
+    
+    return custo
+
+def _posicoes_lookup(serie, chaves):
+    """
+    Posição de cada valor de `serie` (normalizado) em `chaves`; -1 se ausente
+    Normaliza e procura só os valores distintos (hash do pd.Index)
+    """
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    posicoes = chaves.get_indexer(normalizar_series(pd.Series(unicos, dtype=object)))
+    return posicoes[codigos]
+
+class IndiceReferencias:
+    """
+    Abas de referência indexadas pela chave normalizada, montadas uma vez por versão
+    - Produto (SKU ou nome) -> custo unitário (kits sem custo = soma dos componentes)
+    - Canal -> comissão, taxa fixa, custo por pedido e frete
+    - CNPJ / regime -> alíquota
+    - Kits em arrays ordenados (início + nº de componentes de cada kit), para
+      explodir as vendas em componentes com np.repeat, sem laço por linha
+    """
+    
+    def __init__(self, referencias, versao=None):
+        self.versao = versao
+        custo = _custos_unitarios(referencias.get("produtos"), referencias.get("kits"))
+        self.produtos = pd.DataFrame({"Custo Unitário": custo.to_numpy(dtype="float64")}, index=pd.Index(custo.index))
+        self.canais = pd.concat({
+            "Comissão (%)": _tabela_lookup(referencias.get("canais"), "canal", "comissao", clean_percent_series),
+            "Taxa Fixa": _tabela_lookup(referencias.get("canais"), "canal", "taxa_fixa"),
+            "Custo por Pedido": _tabela_lookup(referencias.get("custos"), "canal", "custo_pedido"),
+            "Frete": _tabela_lookup(referencias.get("frete"), "canal", "frete"),
+        }, axis=1)
+        self.impostos = _tabela_lookup(
+            referencias.get("impostos"), "imposto_chave", "aliquota", clean_percent_series
+        ).to_frame("Alíquota (%)")
+        self._montar_kits(referencias.get("kits"), custo)
+    
+    def _montar_kits(self, df_kits, custo):
+        """Componentes agrupados por kit (ordem estável) + peso de cada um no valor do kit"""
+        self.kits = pd.Index([], dtype=object)
+        self._kit_inicio = self._kit_contagem = np.array([], dtype="int64")
+        self._componentes = np.array([], dtype=object)
+        self._componente_qtd = np.array([], dtype="int64")
+        self._componente_peso = np.array([], dtype="float64")
+        if df_kits is None or df_kits.empty:
+            return
+        col_kit = _achar_coluna(df_kits, "kit_chave")
+        col_comp = _achar_coluna(df_kits, "kit_componente")
+        col_qtd = _achar_coluna(df_kits, "kit_quantidade")
+        if col_kit is None or col_comp is None or col_comp == col_kit:
+            return
+        
+        kit = normalizar_series(df_kits[col_kit]).to_numpy(dtype=object)
+        componente = df_kits[col_comp].astype(object).where(df_kits[col_comp].notna(), "").astype(str).str.strip()
+        qtd = (safe_int_series(df_kits[col_qtd]) if col_qtd else pd.Series(1, index=df_kits.index)).to_numpy(dtype="int64")
+        validos = (kit != "") & (componente.to_numpy() != "") & (qtd > 0)
+        kit, componente, qtd = kit[validos], componente.to_numpy(dtype=object)[validos], qtd[validos]
+        if not len(kit):
+            return
+        
+        ordem = np.argsort(kit, kind="stable")
+        kit, componente, qtd = kit[ordem], componente[ordem], qtd[ordem]
+        chaves, inicio, contagem = np.unique(kit, return_index=True, return_counts=True)
+        
+        # Peso = participação do componente no custo do kit (sem custo: pela quantidade)
+        custo_comp = np.nan_to_num(custo.reindex(normalizar_series(pd.Series(componente))).to_numpy(dtype="float64")) * qtd
+        grupo = np.repeat(np.arange(len(chaves)), contagem)
+        total_custo = np.bincount(grupo, weights=custo_comp)[grupo]
+        total_qtd = np.bincount(grupo, weights=qtd)[grupo]
+        
+        self.kits = pd.Index(chaves)
+        self._kit_inicio, self._kit_contagem = inicio.astype("int64"), contagem.astype("int64")
+        self._componentes, self._componente_qtd = componente, qtd
+        self._componente_peso = np.where(total_custo > 0, custo_comp / np.where(total_custo > 0, total_custo, 1), qtd / total_qtd)
+    
+    def consultar(self, df):
+        """
+        Valores de referência de cada linha de `df` (alinhados ao índice)
+        Uma busca por tabela nos valores distintos + take vetorizado; ausente = NaN
+        """
+        n = len(df)
+        colunas = {}
+        for coluna_df, tabela in (("Produto", self.produtos), ("Canal", self.canais), ("CNPJ", self.impostos)):
+            posicoes = _posicoes_lookup(df[coluna_df], tabela.index) if coluna_df in df.columns else np.full(n, -1)
+            for nome in tabela.columns:
+                # posição -1 cai no NaN acrescentado ao fim
+                colunas[nome] = np.append(tabela[nome].to_numpy(dtype="float64"), np.nan)[posicoes]
+            if coluna_df == "Produto":
+                colunas["Cadastrado"] = posicoes >= 0
+        return pd.DataFrame(colunas, index=df.index)
+    
+    def explodir_kits(self, vendas):
+        """
+        Troca cada venda de kit por uma linha por componente
+        - Quantidade = quantidade do kit x quantidade do componente
+        - Valores (venda, custos, lucro) são rateados pelo peso do componente
+        Linhas que não são kit ficam como estão; os totais de valor se mantêm
+        """
+        if vendas.empty or not len(self.kits) or 'Produto' not in vendas.columns:
+            return vendas
+        kit = _posicoes_lookup(vendas['Produto'], self.kits)
+        e_kit = kit >= 0
+        if not e_kit.any():
+            return vendas
+        
+        repeticoes = np.where(e_kit, self._kit_contagem[kit], 1)
+        linha = np.repeat(np.arange(len(vendas)), repeticoes)
+        deslocamento = np.arange(len(linha)) - np.repeat(np.cumsum(repeticoes) - repeticoes, repeticoes)
+        kit_linha = kit[linha]
+        e_kit_linha = kit_linha >= 0
+        componente = np.where(e_kit_linha, self._kit_inicio[kit_linha] + deslocamento, 0)
+        
+        explodido = vendas.iloc[linha].reset_index(drop=True)
+        produto = explodido['Produto'].to_numpy(dtype=object)
+        explodido['Produto'] = np.where(e_kit_linha, self._componentes[componente], produto)
+        if 'Quantidade' in explodido.columns:
+            quantidade = explodido['Quantidade'].to_numpy(dtype="int64")
+            explodido['Quantidade'] = np.where(e_kit_linha, quantidade * self._componente_qtd[componente], quantidade)
+        peso = np.where(e_kit_linha, self._componente_peso[componente], 1.0)
+        for col in COLUNAS_METRICAS:
+            if col != 'Quantidade' and col in explodido.columns and pd.api.types.is_numeric_dtype(explodido[col]):
+                explodido[col] = explodido[col].to_numpy(dtype="float64") * peso
+        return explodido
+
+def calcular_metricas_vendas(df_detalhes, indice):
+    """
+    Preenche os campos financeiros de cada linha de Detalhes_Canais (vetorizado)
+    Os valores de referência vêm de uma única consulta ao IndiceReferencias
+    - Custo Produto = custo unitário (Produtos/Kits) x Quantidade
+    - Impostos      = alíquota do CNPJ x Total Venda
+    - Comissão      = comissão do canal x Total Venda
+    - Taxas Fixas   = taxa fixa do canal x Quantidade
+    - Embalagem     = custo por pedido do canal (por linha)
+    - Frete         = frete do canal (por linha)
+    Valores já preenchidos (≠ 0) na planilha são mantidos
+    """
+    df = df_detalhes.copy(deep=False)
+    for col in COLUNAS_METRICAS:
+        if col not in df.columns:
+            df[col] = 0.0
+    
+    quantidade = df['Quantidade'].to_numpy(dtype="float64")
+    venda = df['Total Venda'].to_numpy(dtype="float64")
+    ref = indice.consultar(df).fillna(0.0)
+    
+    calculados = {
+        'Custo Produto': ref['Custo Unitário'].to_numpy() * quantidade,
+        'Impostos': ref['Alíquota (%)'].to_numpy() * venda,
+        'Comissão': ref['Comissão (%)'].to_numpy() * venda,
+        'Taxas Fixas': ref['Taxa Fixa'].to_numpy() * quantidade,
+        'Embalagem': ref['Custo por Pedido'].to_numpy(),
+        'Frete': ref['Frete'].to_numpy(),
+    }
+    for col, valores in calculados.items():
+        atual = df[col].to_numpy(dtype="float64")
+        df[col] = np.where(atual != 0, atual, valores)
+    
+    df['Custo Total'] = (
+        df['Custo Produto'] + df['Impostos'] + df['Comissão'] + df['Taxas Fixas']
+        + df['Embalagem'] + df['Frete'] + df['Investimento Ads']
+    )
+    df['Lucro Bruto'] = df['Total Venda'] - df['Custo Total']
+    df['Margem (%)'] = np.divide(
+        df['Lucro Bruto'].to_numpy(), venda, out=np.zeros(len(df)), where=venda != 0
+    )
+    return df
+
+def _somar_metricas(df, chave):
+    """Somas de COLUNAS_SOMADAS por `chave` (índice = chave)"""
+    if df.empty or chave not in df.columns:
+        return pd.DataFrame(columns=COLUNAS_SOMADAS, dtype="float64")
+    colunas = [c for c in COLUNAS_SOMADAS if c in df.columns]
+    return df.groupby(chave, sort=False, observed=True)[colunas].sum()
+
+def _finalizar_agregado(somas, chave, ordenar_por='Total Venda'):
+    """Recalcula a margem ponderada e ordena (custo proporcional ao nº de grupos)"""
+    agregado = somas.copy(deep=False)
+    if agregado.empty:
+        return pd.DataFrame(columns=[chave] + list(agregado.columns) + ['Margem (%)'])
+    if 'Quantidade' in agregado.columns:
+        agregado['Quantidade'] = agregado['Quantidade'].astype("int64")
+    venda = agregado['Total Venda'].to_numpy(dtype="float64")
+    agregado['Margem (%)'] = np.divide(
+        agregado['Lucro Bruto'].to_numpy(dtype="float64"), venda, out=np.zeros(len(agregado)), where=venda != 0
+    )
+    agregado.index.name = chave
+    return agregado.sort_values(ordenar_por, ascending=False).reset_index()
+
+def agregar_metricas(df, chave):
+    """Soma as métricas por `chave` e recalcula a margem ponderada"""
+    return _finalizar_agregado(_somar_metricas(df, chave), chave)
+
+def datas_vendas(serie):
+    """Coluna Data como datetime64 (ISO ou dd/mm/aaaa); converte só os valores distintos"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    codigos, unicas = pd.factorize(serie, use_na_sentinel=False)
+    datas = pd.to_datetime(_normalizar_datas_texto(pd.Series(unicas, dtype=object)), format="%Y-%m-%d", errors="coerce")
+    return pd.Series(datas.to_numpy()[codigos], index=serie.index)
+
+# Matriz BCG: mês mais recente x mês anterior, por SKU dentro de cada canal
+LIMIAR_CRESCIMENTO_BCG = 0.10    # crescimento ≥ 10% no período = alto
+LIMIAR_PARTICIPACAO_BCG = 0.50   # venda ≥ 50% do maior concorrente no canal = alta
+
+def classificar_bcg(vendas):
+    """
+    Classifica cada SKU x Canal nos quadrantes de ORDEM_BCG (vetorizado)
+    - Crescimento = venda do mês atual / venda do mês anterior - 1
+    - Participação relativa = venda do SKU / maior venda de outro SKU no canal
+    Pares sem venda no mês anterior contam como crescimento alto
+    """
+    colunas = ['Canal', 'Produto', 'Venda Atual', 'Venda Anterior', 'Crescimento',
+               'Participação Relativa', 'Lucro Bruto', 'Margem (%)', 'Classificação']
+    if vendas.empty or not {'Data', 'Canal', 'Produto', 'Total Venda'} <= set(vendas.columns):
+        return pd.DataFrame(columns=colunas)
+
+    meses = datas_vendas(vendas['Data']).to_numpy().astype("datetime64[M]")
+    mes = np.where(np.isnat(meses), np.nan, meses.astype("int64"))
+    valido = ~np.isnan(mes)
+    if not valido.any():
+        return pd.DataFrame(columns=colunas)
+    mes_atual = np.nanmax(mes)
+    atual = mes == mes_atual
+    periodo = valido & (atual | (mes == mes_atual - 1))
+
+    canal = vendas['Canal'].to_numpy()[periodo]
+    produto = vendas['Produto'].to_numpy()[periodo]
+    venda = vendas['Total Venda'].to_numpy(dtype="float64")[periodo]
+    lucro = (vendas['Lucro Bruto'].to_numpy(dtype="float64")[periodo]
+             if 'Lucro Bruto' in vendas.columns else np.zeros(len(venda)))
+    atual = atual[periodo]
+
+    # Um código inteiro por par (canal, produto); somas por bincount
+    cod_canal, canais = pd.factorize(canal, use_na_sentinel=False)
+    cod_produto, produtos = pd.factorize(produto, use_na_sentinel=False)
+    pares, cod_par = np.unique(cod_canal.astype("int64") * len(produtos) + cod_produto, return_inverse=True)
+    n = len(pares)
+    venda_atual = np.bincount(cod_par, weights=np.where(atual, venda, 0.0), minlength=n)
+    venda_anterior = np.bincount(cod_par, weights=np.where(atual, 0.0, venda), minlength=n)
+    lucro_atual = np.bincount(cod_par, weights=np.where(atual, lucro, 0.0), minlength=n)
+    canal_par = pares // len(produtos)
+
+    # Maior e segundo maior SKU de cada canal: o líder se compara com o segundo
+    ordem = np.lexsort((-venda_atual, canal_par))
+    inicio = np.r_[True, canal_par[ordem][1:] != canal_par[ordem][:-1]]
+    primeiro = np.flatnonzero(inicio)
+    segundo = np.minimum(primeiro + 1, n - 1)
+    tem_segundo = np.r_[primeiro[1:], n] - primeiro > 1
+    maior = np.zeros(len(canais))
+    vice = np.zeros(len(canais))
+    maior[canal_par[ordem][primeiro]] = venda_atual[ordem][primeiro]
+    vice[canal_par[ordem][primeiro]] = np.where(tem_segundo, venda_atual[ordem][segundo], 0.0)
+    eh_lider = np.zeros(n, dtype=bool)
+    eh_lider[ordem[primeiro]] = True
+    concorrente = np.where(eh_lider, vice[canal_par], maior[canal_par])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crescimento = np.where(venda_anterior > 0, venda_atual / venda_anterior - 1,
+                               np.where(venda_atual > 0, np.inf, 0.0))
+        participacao = np.where(concorrente > 0, venda_atual / concorrente,
+                                np.where(venda_atual > 0, np.inf, 0.0))
+        margem = np.where(venda_atual != 0, lucro_atual / venda_atual, 0.0)
+
+    alto_cresc = crescimento >= LIMIAR_CRESCIMENTO_BCG
+    alta_part = participacao >= LIMIAR_PARTICIPACAO_BCG
+    classificacao = np.select(
+        [alta_part & ~alto_cresc, alta_part & alto_cresc, ~alta_part & alto_cresc],
+        ORDEM_BCG[:3], default=ORDEM_BCG[3]
+    )
+
+    resultado = pd.DataFrame({
+        'Canal': canais[canal_par],
+        'Produto': produtos[pares % len(produtos)],
+        'Venda Atual': venda_atual,
+        'Venda Anterior': venda_anterior,
+        'Crescimento': crescimento,
+        'Participação Relativa': participacao,
+        'Lucro Bruto': lucro_atual,
+        'Margem (%)': margem,
+        'Classificação': pd.Categorical(classificacao, categories=ORDEM_BCG, ordered=True),
+    })
+    return resultado.sort_values(['Classificação', 'Venda Atual'], ascending=[True, False], ignore_index=True)
+
+class MotorLocal:
+    """
+    Resultado do motor local mantido de forma incremental
+    - Reconstrói tudo só quando as referências mudam ou a planilha diverge
+    - Cada upload soma apenas o lote novo às somas por canal / CNPJ / SKU
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indice = IndiceReferencias({})
+        self._versoes_referencias = None
+        self._versao_detalhes = None
+        self._linhas = 0
+        self._acumulado_em = 0.0   # momento do último lote somado
+        self._impressao = None     # impressao_detalhes das linhas somadas (reconstrução + lotes)
+        self._vendas = []          # blocos de linhas enriquecidas (concatenados sob demanda)
+        self._somas = {}           # aba -> DataFrame de somas indexado pela dimensão
+        self._revisao = 0          # muda a cada reconstrução / lote acumulado
+        self._bcg = (None, None)   # (revisão, matriz BCG calculada)
+        self._cubo = None          # CuboVendas, montado no primeiro uso
+    
+    def sincronizar(self, dados, versoes, indice):
+        """
+        Alinha o estado com as abas carregadas (`indice` = IndiceReferencias das referências)
+        Nova versão de Detalhes_Canais com o mesmo resumo (impressao_detalhes) das
+        linhas já somadas - ou seja, só os uploads deste app - é adotada sem
+        recalcular; qualquer outra diferença reconstrói tudo
+        Versão baixada antes do último lote somado (ou expirada pelo invalidar, 0.0)
+        ainda não tem esse lote: o estado atual é mantido até a recarga chegar
+        """
+        versao_detalhes, versoes_referencias = versoes[0], versoes[1:]
+        df_detalhes = dados["detalhes_canais"]
+        with self._lock:
+            if self._versao_detalhes is not None and (versao_detalhes or 0.0) <= self._acumulado_em:
+                anotar_span(cache="acerto")
+                return
+            if versoes_referencias == self._versoes_referencias:
+                if versao_detalhes == self._versao_detalhes:
+                    anotar_span(cache="acerto")
+                    return
+                if (self._versao_detalhes is not None and len(df_detalhes) == self._linhas
+                        and _mesma_impressao(impressao_detalhes(df_detalhes), self._impressao)):
+                    self._versao_detalhes = versao_detalhes
+                    anotar_span(cache="acerto")
+                    return
+            anotar_span(cache="falta")
+            with span("reconstruir_motor", linhas=len(df_detalhes)):
+                self._reconstruir(df_detalhes, indice)
+            self._versao_detalhes = versao_detalhes
+            self._versoes_referencias = versoes_referencias
+    
+    def acumular(self, lote):
+        """Soma um lote recém-gravado em Detalhes_Canais (O(lote) + O(grupos))"""
+        if len(lote) == 0:
+            return
+        with self._lock:
+            if self._versao_detalhes is None:
+                return  # ainda não construído: a primeira carga já incluirá o lote
+            lote = lote.drop(columns=[COLUNA_DUPLICADO], errors="ignore")
+            vendas = calcular_metricas_vendas(lote, self._indice)
+            self._vendas.append(vendas)
+            self._linhas += len(vendas)
+            self._acumulado_em = time.time()
+            self._impressao = _somar_impressoes(self._impressao, impressao_detalhes(lote))
+            self._revisao += 1
+            if self._cubo is not None:
+                self._cubo.acumular(vendas)
+            for nome_aba, chave in DIMENSOES_MOTOR.items():
+                novas = _somar_metricas(vendas, chave)
+                self._somas[nome_aba] = self._somas[nome_aba].add(novas, fill_value=0)
+    
+    def resultado(self):
+        """Abas calculadas (linhas enriquecidas + agregados por dimensão)"""
+        with self._lock:
+            if len(self._vendas) > 1:
+                self._vendas = [pd.concat(self._vendas, ignore_index=True)]
+            vendas = self._vendas[0] if self._vendas else pd.DataFrame(columns=COLUNAS_ESPERADAS + ['Frete'])
+            somas = dict(self._somas)
         
-        for col in df.columns:
-            if any(mon in col for mon in colunas_monetarias):
-                df[col] = df[col].apply(clean_currency)
+        resultado = {"vendas": vendas.copy(deep=False)}
+        for nome_aba, chave in DIMENSOES_MOTOR.items():
+            ordenar_por = 'Quantidade' if nome_aba == "vendas_sku_geral" else 'Total Venda'
+            resultado[nome_aba] = _finalizar_agregado(somas[nome_aba], chave, ordenar_por)
+        return resultado
+    
+    @property
+    def revisao(self):
+        """Contador que muda sempre que o resultado muda"""
+        return self._revisao
+    
+    def bcg(self):
+        """Matriz BCG das linhas atuais (recalculada só quando o estado muda)"""
+        revisao, matriz = self._bcg
+        if revisao != self._revisao:
+            revisao = self._revisao
+            matriz = classificar_bcg(self.resultado()["vendas"])
+            self._bcg = (revisao, matriz)
+        return matriz.copy(deep=False)
+    
+    def cubo(self):
+        """Cubo de tendências das linhas enriquecidas (deltas a cada lote acumulado)"""
+        if self._cubo is None:
+            cubo = CuboVendas(self.resultado()["vendas"])
+            with self._lock:
+                if self._cubo is None:
+                    self._cubo = cubo
+        return self._cubo
+    
+    def _reconstruir(self, df_detalhes, indice):
+        """Recalcula tudo a partir da aba inteira (chamado com o lock adquirido)"""
+        self._indice = indice
+        if df_detalhes.empty or 'Total Venda' not in df_detalhes.columns:
+            vendas = pd.DataFrame(columns=COLUNAS_ESPERADAS + ['Frete'])
+        else:
+            vendas = calcular_metricas_vendas(df_detalhes, indice)
+        self._vendas = [vendas]
+        self._linhas = len(df_detalhes)
+        self._impressao = impressao_detalhes(df_detalhes)
+        self._revisao += 1
+        self._cubo = None
+        self._somas = {nome_aba: _somar_metricas(vendas, chave) for nome_aba, chave in DIMENSOES_MOTOR.items()}
+
+@st.cache_resource
+def _indice_referencias():
+    """Último IndiceReferencias montado (compartilhado entre sessões)"""
+    return {"lock": threading.Lock(), "indice": None}
+
+def get_indice_referencias(dados=None):
+    """Índice das abas de referência (remontado só quando alguma muda de versão)"""
+    if dados is None:
+        dados = {nome: carregar_aba(nome) for nome in ABAS_REFERENCIA}
+    versao = tuple(get_cache_abas().versao(nome) for nome in ABAS_REFERENCIA)
+    memo = _indice_referencias()
+    with memo["lock"]:
+        if memo["indice"] is None or memo["indice"].versao != versao:
+            memo["indice"] = IndiceReferencias(dados, versao)
+        return memo["indice"]
+
+@st.cache_resource
+def get_motor_local():
+    """Instância única do motor local (compartilhada entre sessões)"""
+    return MotorLocal()
+
+def calcular_abas_locais():
+    """
+    Calcula as abas processadas a partir de Detalhes_Canais + referências
+    Recalcula só quando alguma aba de origem muda de versão
+    """
+    dados = {nome: carregar_aba(nome) for nome in ABAS_MOTOR}
+    versoes = tuple(get_cache_abas().versao(nome) for nome in ABAS_MOTOR)
+    
+    motor = get_motor_local()
+    motor.sincronizar(dados, versoes, get_indice_referencias(dados))
+    return motor.resultado()
+
+def calcular_bcg_local():
+    """Matriz BCG calculada no app a partir do histórico de Detalhes_Canais"""
+    calcular_abas_locais()
+    return get_motor_local().bcg()
+
+# ───────────────────────────────────────────────────────────────────────────────
+# 4.4 CONSULTA INDEXADA (filtros por período / canal / CNPJ / produto)
+# ───────────────────────────────────────────────────────────────────────────────
+
+DIMENSOES_FILTRO = ["Canal", "CNPJ", "Produto"]
+FILTRO_TODAS = (None, None, ())   # filtro que seleciona todas as linhas
+LIMITE_MEMO_FILTROS = 32   # combinações de filtro mantidas em memória (LRU)
+
+class IndiceConsulta:
+    """
+    Índices das linhas de venda para responder filtros sem varrer a tabela
+    - Canal / CNPJ / Produto viram códigos inteiros (categorias ordenadas)
+    - Data fica ordenada: um período vira um intervalo achado por busca binária
+    - Resultados recentes ficam num LRU por combinação de filtros
+    """
+    
+    def __init__(self, vendas, versao):
+        self.vendas = vendas
+        self.versao = versao
+        self.categorias = {}
+        self._codigos = {}
+        for dim in DIMENSOES_FILTRO:
+            if dim in vendas.columns:
+                codigos, categorias = pd.factorize(vendas[dim], sort=True)  # vazio = -1
+                self._codigos[dim] = codigos
+                self.categorias[dim] = categorias
         
-        # Limpa coluna de Margem
-        if 'Margem (%)' in df.columns or 'Margem' in df.columns:
-            col_margem = 'Margem (%)' if 'Margem (%)' in df.columns else 'Margem'
-            df[col_margem] = df[col_margem].apply(clean_percent)
+        if 'Data' in vendas.columns:
+            datas = datas_vendas(vendas['Data']).to_numpy()
+        else:
+            datas = np.full(len(vendas), np.datetime64("NaT"), dtype="datetime64[ns]")
+        self._ordem_datas = np.argsort(datas, kind="stable")  # NaT vai para o fim
+        self._datas_ordenadas = datas[self._ordem_datas]
+        validas = self._datas_ordenadas[~np.isnat(self._datas_ordenadas)]
+        self.periodo = (validas[0], validas[-1]) if len(validas) else None
         
-        # Limpa Quantidade
-        if 'Quantidade' in df.columns:
-            df['Quantidade'] = df['Quantidade'].apply(lambda x: safe_int(x) if pd.notna(x) else 0)
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()  # filtro -> {"posicoes", "visoes"}
+    
+    def consultar(self, filtro):
+        """Posições (na ordem original) das linhas que atendem ao filtro"""
+        return self._entrada(filtro)["posicoes"]
+    
+    def visao(self, filtro, nome, construir):
+        """Tabela derivada das linhas filtradas, memorizada junto com o filtro"""
+        entrada = self._entrada(filtro)
+        anotar_span(cache="acerto" if nome in entrada["visoes"] else "falta")
+        if nome not in entrada["visoes"]:
+            entrada["visoes"][nome] = construir(self.vendas.iloc[entrada["posicoes"]])
+        return entrada["visoes"][nome].copy(deep=False)
+    
+    def _entrada(self, filtro):
+        with self._lock:
+            entrada = self._memo.get(filtro)
+            if entrada is not None:
+                self._memo.move_to_end(filtro)
+                return entrada
+        entrada = {"posicoes": self._filtrar(filtro), "visoes": {}}
+        with self._lock:
+            entrada = self._memo.setdefault(filtro, entrada)
+            while len(self._memo) > LIMITE_MEMO_FILTROS:
+                self._memo.popitem(last=False)
+        return entrada
+    
+    def _filtrar(self, filtro):
+        """Período por busca binária, depois tabela de códigos permitidos por dimensão"""
+        inicio, fim, selecoes = filtro
+        posicoes = None
+        if inicio is not None or fim is not None:
+            datas = self._datas_ordenadas
+            esquerda = 0 if inicio is None else np.searchsorted(datas, np.datetime64(inicio, "D").astype(datas.dtype), "left")
+            direita = (np.count_nonzero(~np.isnat(datas)) if fim is None
+                       else np.searchsorted(datas, (np.datetime64(fim, "D") + 1).astype(datas.dtype), "left"))
+            posicoes = self._ordem_datas[esquerda:direita]
         
-        return df
+        for dim, valores in selecoes:
+            if dim not in self._codigos:
+                return np.array([], dtype="int64")
+            indices = self.categorias[dim].get_indexer(list(valores))
+            permitido = np.zeros(len(self.categorias[dim]) + 1, dtype=bool)  # última posição = vazio (-1)
+            permitido[indices[indices >= 0]] = True
+            codigos = self._codigos[dim]
+            if posicoes is None:
+                posicoes = np.flatnonzero(permitido[codigos])
+            else:
+                posicoes = posicoes[permitido[codigos[posicoes]]]
         
-    except Exception as e:
-        st.error(f"❌ Erro ao carregar aba '{nome_aba}': {str(e)}")
-        return pd.DataFrame()
+        if posicoes is None:
+            return np.arange(len(self.vendas))
+        return np.sort(posicoes)
 
-@st.cache_data(ttl=300)
-def carregar_dashboard_geral():
-    """Carrega a aba Dashboard_Geral (dados consolidados por canal)"""
-    return carregar_aba("dashboard_geral")
+@medido
+def carregar_vendas_detalhadas():
+    """(linhas de venda, versão): enriquecidas pelo motor local ou como estão na planilha"""
+    if usar_motor_local():
+        vendas = calcular_abas_locais()["vendas"]
+        return vendas, ("motor", get_motor_local().revisao)
+    return carregar_aba("detalhes_canais"), ("aba", get_cache_abas().versao("detalhes_canais"))
 
-@st.cache_data(ttl=300)
-def carregar_bcg_canal():
-    """Carrega a aba BCG_Canal_Mkt (matriz BCG por canal)"""
-    return carregar_aba("bcg_canal_mkt")
+@st.cache_resource
+def _indices_consulta():
+    """Um índice por origem das linhas (motor local / planilha)"""
+    return {"lock": threading.Lock(), "indices": {}}
 
-@st.cache_data(ttl=300)
-def carregar_vendas_sku():
-    """Carrega a aba Vendas_sku_geral (giro de produtos)"""
-    return carregar_aba("vendas_sku_geral")
+def get_indice_consulta():
+    """Índice da versão atual das linhas de venda (reconstruído só quando ela muda)"""
+    vendas, versao = carregar_vendas_detalhadas()
+    memo = _indices_consulta()
+    with memo["lock"]:
+        indice = memo["indices"].get(versao[0])
+        if indice is None or indice.versao != versao:
+            indice = IndiceConsulta(vendas, versao)
+            memo["indices"][versao[0]] = indice
+    return indice
 
-@st.cache_data(ttl=300)
-def carregar_oportunidades():
-    """Carrega a aba Oportunidades_canais_mkt"""
-    return carregar_aba("oportunidades_canais_mkt")
+def filtro_atual():
+    """Filtro escolhido na barra lateral, hashable (None quando nenhum está ativo)"""
+    periodo = tuple(st.session_state.get("filtro_periodo") or ())
+    inicio = periodo[0] if periodo else None
+    fim = periodo[1] if len(periodo) > 1 else inicio
+    selecoes = tuple(
+        (dim, tuple(sorted(map(str, st.session_state[f"filtro_{dim.lower()}"]))))
+        for dim in DIMENSOES_FILTRO
+        if st.session_state.get(f"filtro_{dim.lower()}")
+    )
+    if inicio is None and not selecoes:
+        return None
+    return (inicio, fim, selecoes)
 
-@st.cache_data(ttl=300)
-def carregar_resultado_cnpj():
-    """Carrega a aba Resultado_CNPJ"""
-    return carregar_aba("resultado_cnpj")
+def visao_filtrada(nome, construir):
+    """Visão `nome` calculada sobre as linhas do filtro atual (None sem filtro)"""
+    filtro = filtro_atual()
+    if filtro is None:
+        return None
+    return get_indice_consulta().visao(filtro, nome, construir)
 
-@st.cache_data(ttl=300)
-def carregar_precos_mktp():
-    """Carrega a aba Preço_Simples_MKTP"""
-    return carregar_aba("preco_simples_mktp")
+# ───────────────────────────────────────────────────────────────────────────────
+# 4.5 CUBO DE TENDÊNCIAS (Data x Canal x CNPJ x Produto por dia / semana / mês)
+# ───────────────────────────────────────────────────────────────────────────────
 
-@st.cache_data(ttl=300)
-def carregar_metas():
-    """Carrega metas da planilha ou usa valores padrão"""
-    try:
-        df_metas = carregar_aba("metas")
-        if not df_metas.empty and len(df_metas) > 0:
-            # Tenta extrair valores da primeira linha
-            metas_custom = {}
-            if 'Margem Mínima' in df_metas.columns:
-                metas_custom['margem_minima'] = clean_percent(df_metas['Margem Mínima'].iloc[0])
-            if 'Margem Ideal' in df_metas.columns:
-                metas_custom['margem_ideal'] = clean_percent(df_metas['Margem Ideal'].iloc[0])
-            if 'Ticket Mínimo' in df_metas.columns:
-                metas_custom['ticket_minimo'] = clean_currency(df_metas['Ticket Mínimo'].iloc[0])
-            if 'Ticket Ideal' in df_metas.columns:
-                metas_custom['ticket_ideal'] = clean_currency(df_metas['Ticket Ideal'].iloc[0])
-            
-            # Mescla com valores padrão
-            return {**METAS, **metas_custom}
-    except:
-        pass
+GRAOS_CUBO = ["Dia", "Semana", "Mês"]
+DIMENSOES_CUBO = ["Canal", "CNPJ", "Produto"]
+MEDIDAS_CUBO = ['Quantidade', 'Total Venda', 'Lucro Bruto']
+
+def _balde(dias, grao):
+    """Início do período (datetime64[D]) que contém cada dia"""
+    if grao == "Semana":
+        return dias - (dias.astype("int64") + 3) % 7  # 01/01/1970 foi quinta; semana começa na segunda
+    if grao == "Mês":
+        return dias.astype("datetime64[M]").astype("datetime64[D]")
+    return dias
+
+def _cubo_diario(vendas):
+    """Somas de MEDIDAS_CUBO por dia x Canal x CNPJ x Produto (linhas sem data ficam de fora)"""
+    niveis = ["Data"] + DIMENSOES_CUBO
+    if vendas.empty or 'Data' not in vendas.columns:
+        indice = pd.MultiIndex.from_arrays([pd.DatetimeIndex([])] + [[]] * len(DIMENSOES_CUBO), names=niveis)
+        return pd.DataFrame(columns=MEDIDAS_CUBO, index=indice, dtype="float64")
     
-    return METAS
+    dias = datas_vendas(vendas['Data']).to_numpy().astype("datetime64[D]")
+    validos = ~np.isnat(dias)
+    colunas = {"Data": dias[validos]}
+    for dim in DIMENSOES_CUBO:
+        colunas[dim] = vendas[dim].to_numpy(dtype=object)[validos] if dim in vendas.columns else ""
+    for medida in MEDIDAS_CUBO:
+        colunas[medida] = vendas[medida].to_numpy(dtype="float64")[validos] if medida in vendas.columns else 0.0
+    return pd.DataFrame(colunas).groupby(niveis, sort=False, dropna=False)[MEDIDAS_CUBO].sum()
+
+class CuboVendas:
+    """
+    Cubo materializado de vendas por período
+    - Grão diário montado uma vez por carga; semana e mês são rollups do diário
+    - Lotes novos entram como deltas (O(lote)) e são consolidados na próxima leitura
+    - A linha total de cada grão fica pronta: o gráfico custa O(nº de períodos)
+    """
+    
+    def __init__(self, vendas):
+        self._lock = threading.Lock()
+        self._dia = _cubo_diario(vendas)
+        self._deltas = []
+        self._graos = {}   # grão -> cubo consolidado
+        self._totais = {}  # grão -> somas por período
+    
+    @property
+    def vazio(self):
+        return self._dia.empty and not self._deltas
+    
+    def acumular(self, lote):
+        """Guarda as somas diárias de um lote novo (consolidadas na próxima leitura)"""
+        novas = _cubo_diario(lote)
+        if len(novas):
+            with self._lock:
+                self._deltas.append(novas)
+    
+    def cubo(self, grao="Dia"):
+        """Somas por período do grão x Canal x CNPJ x Produto"""
+        with self._lock:
+            if self._deltas:
+                self._dia = (
+                    pd.concat([self._dia] + self._deltas)
+                    .groupby(level=list(range(self._dia.index.nlevels)), sort=False, dropna=False).sum()
+                )
+                self._deltas = []
+                self._graos = {}
+                self._totais = {}
+            if grao not in self._graos:
+                if grao == "Dia":
+                    self._graos[grao] = self._dia
+                else:
+                    indice = self._dia.index
+                    baldes = _balde(indice.get_level_values(0).to_numpy().astype("datetime64[D]"), grao)
+                    chaves = [pd.Index(baldes, name="Data")] + [indice.get_level_values(dim) for dim in DIMENSOES_CUBO]
+                    self._graos[grao] = self._dia.groupby(chaves, sort=False, dropna=False).sum()
+            return self._graos[grao]
+    
+    def tendencia(self, grao, medida, por=None, filtro=None):
+        """Série (ou uma coluna por valor de `por`) da medida ao longo dos períodos"""
+        cubo = self.cubo(grao)
+        if por is None and filtro is None:
+            with self._lock:
+                if grao not in self._totais:
+                    self._totais[grao] = cubo.groupby(level="Data").sum().sort_index()
+                return self._totais[grao][medida]
+        
+        mascara = np.ones(len(cubo), dtype=bool)
+        if filtro is not None:
+            inicio, fim, selecoes = filtro
+            periodos = cubo.index.get_level_values("Data").to_numpy().astype("datetime64[D]")
+            if inicio is not None:
+                mascara &= periodos >= _balde(np.array([inicio], dtype="datetime64[D]"), grao)[0]
+            if fim is not None:
+                mascara &= periodos <= np.datetime64(fim, "D")
+            for dim, valores in selecoes:
+                mascara &= cubo.index.get_level_values(dim).isin(valores)
+        selecao = cubo.loc[mascara, medida]
+        if por is None:
+            return selecao.groupby(level="Data").sum().sort_index()
+        return selecao.groupby(level=["Data", por], dropna=False).sum().unstack(por, fill_value=0).sort_index()
+
+@st.cache_resource
+def _cubo_planilha():
+    """Cubo montado de Detalhes_Canais como está na planilha (um por versão da aba)"""
+    return {"lock": threading.Lock(), "versao": None, "cubo": None}
+
+@medido
+def carregar_cubo_vendas():
+    """Cubo de tendências da origem atual (motor local ou planilha)"""
+    if usar_motor_local():
+        calcular_abas_locais()
+        return get_motor_local().cubo()
+    
+    df_detalhes = carregar_aba("detalhes_canais")
+    versao = get_cache_abas().versao("detalhes_canais")
+    memo = _cubo_planilha()
+    with memo["lock"]:
+        if memo["cubo"] is None or memo["versao"] != versao:
+            memo["cubo"] = CuboVendas(df_detalhes)
+            memo["versao"] = versao
+        return memo["cubo"]
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # 5. FUNÇÕES DE UPLOAD (SALVAR DADOS)
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def preparar_dados_para_salvar(df_raw, canal, cnpj, data_venda):
+@medido
+def preparar_dados_para_salvar(df_raw, canal, cnpj, data_venda, mostrar_status=True, verificar_duplicados=True,
+                               verificador=None):
     """
     Prepara dados do upload para salvar na aba Detalhes_Canais
     Garante todas as colunas esperadas
+    Marca em COLUNA_DUPLICADO as linhas que já existem na planilha
+    (`verificador`: o mesmo VerificadorDuplicados para todos os lotes de um upload)
     """
     try:
-        df = df_raw.copy()
+        # Cópia rasa (Copy-on-Write): as colunas novas não alteram df_raw
+        df = df_raw.copy(deep=False)
         
         # Adiciona metadados
         df['Data'] = data_venda
@@ -387,13 +2282,13 @@ def preparar_dados_para_salvar(df_raw, canal, cnpj, data_venda):
             return None
         
         # Converte Quantidade para inteiro
-        df['Quantidade'] = df['Quantidade'].apply(safe_int)
+        df['Quantidade'] = safe_int_series(df['Quantidade'])
         
         # Total Venda
         if 'Total Venda' not in df.columns:
             df['Total Venda'] = 0.0
         else:
-            df['Total Venda'] = df['Total Venda'].apply(clean_currency)
+            df['Total Venda'] = clean_currency_series(df['Total Venda'])
         
         # Preenche colunas financeiras com 0 (planilha calculará)
         df['Tipo'] = 'Venda'
@@ -408,71 +2303,798 @@ def preparar_dados_para_salvar(df_raw, canal, cnpj, data_venda):
         df['Margem (%)'] = '0%'
         
         # Garante ordem das colunas
-        df_final = df[COLUNAS_ESPERADAS].copy()
+        df_final = df[COLUNAS_ESPERADAS]
+        
+        # Deduplicação: consulta O(1) por linha no índice de hashes
+        if verificar_duplicados:
+            verificador = verificador or VerificadorDuplicados(get_indice_dedup())
+            df_final[COLUNA_DUPLICADO] = verificador.marcar(hash_linhas_vendas(df_final))
+        else:
+            df_final[COLUNA_DUPLICADO] = False
         
-        st.success(f"✅ {len(df_final)} registros preparados para salvar")
+        if mostrar_status:
+            st.success(f"✅ {len(df_final)} registros preparados para salvar")
+            duplicados = int(df_final[COLUNA_DUPLICADO].sum())
+            if duplicados:
+                st.warning(f"⚠️ {duplicados} registros já existem em 'Detalhes_Canais'")
         return df_final
         
     except Exception as e:
         st.error(f"❌ Erro ao preparar dados: {str(e)}")
         return None
 
-def salvar_dados_sheets(df_novos_dados):
+# ───────────────────────────────────────────────────────────────────────────────
+# 5.1 ÍNDICE DE DEDUPLICAÇÃO (hash de Data/Canal/CNPJ/Produto/Quantidade/Total Venda)
+# ───────────────────────────────────────────────────────────────────────────────
+
+def _normalizar_datas_texto(serie):
+    """Datas ISO ou dd/mm/aaaa viram 'aaaa-mm-dd'; o resto fica como texto"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return pd.Series(serie.dt.strftime("%Y-%m-%d").fillna("").to_numpy(dtype=object), index=serie.index, dtype=object)
+    texto = serie.astype(object).where(serie.notna(), "").astype(str).str.strip()
+    datas = pd.to_datetime(texto, format="%Y-%m-%d", errors="coerce")
+    # Timestamps misturados a texto (Data já convertida + lote novo) viram 'aaaa-mm-dd hh:mm:ss'
+    for formato in ("%d/%m/%Y", "%Y-%m-%d %H:%M:%S"):
+        faltando = datas.isna()
+        if not faltando.any():
+            break
+        datas[faltando] = pd.to_datetime(texto[faltando], format=formato, errors="coerce")
+    return pd.Series(
+        np.where(datas.notna(), datas.dt.strftime("%Y-%m-%d"), texto), index=serie.index, dtype=object
+    )
+
+def hash_linhas_vendas(df):
+    """Hash uint64 por linha das colunas-chave (mesmo valor para upload e planilha)"""
+    if df.empty:
+        return np.array([], dtype="uint64")
+    
+    def _texto(col):
+        serie = df[col] if col in df.columns else pd.Series("", index=df.index)
+        return serie.astype(object).where(serie.notna(), "").astype(str).str.strip().astype(object)
+    
+    chave = pd.DataFrame({
+        "Data": _normalizar_datas_texto(df["Data"]) if "Data" in df.columns else "",
+        "Canal": _texto("Canal"),
+        "CNPJ": _texto("CNPJ"),
+        "Produto": _texto("Produto"),
+        "Quantidade": safe_int_series(df["Quantidade"]) if "Quantidade" in df.columns else 0,
+        # + 0.0 normaliza -0.0
+        "Total Venda": (clean_currency_series(df["Total Venda"]).round(2) + 0.0) if "Total Venda" in df.columns else 0.0,
+    }, index=df.index)
+    return pd.util.hash_pandas_object(chave, index=False).to_numpy()
+
+class IndiceDedup:
     """
-    Salva novos dados na aba Detalhes_Canais
-    Usa gspread para append direto
+    Multiconjunto dos hashes das linhas gravadas em Detalhes_Canais
+    - Guarda quantas linhas iguais existem de cada hash: n linhas repetidas
+      num upload só são duplicadas se a planilha já tem n delas
+    - Consulta vetorizada O(1) por linha (tabela hash do pd.Index)
+    - Persistido em disco (um hash por linha) e reconciliado com a própria aba
+      a cada versão carregada: linhas apagadas da planilha deixam de contar
+    """
+    
+    def __init__(self, caminho):
+        self._caminho = Path(caminho)
+        self._lock = threading.Lock()
+        self._versao_sincronizada = None
+        self._pendentes = []  # (momento, hashes) dos uploads concluídos desde a última versão
+        try:
+            hashes = np.load(self._caminho)
+        except (OSError, ValueError):
+            hashes = np.array([], dtype="uint64")
+        self._indice, self._contagens = self._contar(hashes)
+    
+    def __len__(self):
+        return int(self._contagens.sum())
+    
+    @staticmethod
+    def _contar(hashes):
+        """(pd.Index dos hashes distintos, nº de linhas de cada um)"""
+        unicos, contagens = np.unique(np.asarray(hashes, dtype="uint64"), return_counts=True)
+        return pd.Index(unicos), contagens.astype("int64")
+    
+    @staticmethod
+    def _combinar(partes, operacao=np.add):
+        """Junta contagens (índice, contagens) somando ou tirando o máximo por hash"""
+        hashes = np.concatenate([indice.to_numpy() for indice, _ in partes])
+        contagens = np.concatenate([contagens for _, contagens in partes])
+        unicos, inverso = np.unique(hashes, return_inverse=True)
+        total = np.zeros(len(unicos), dtype="int64")
+        operacao.at(total, inverso, contagens)
+        return pd.Index(unicos), total
+    
+    def instantaneo(self):
+        """(índice, contagens) atuais; os arrays nunca são alterados depois de publicados"""
+        with self._lock:
+            return self._indice, self._contagens
+    
+    def adicionar(self, hashes):
+        """Soma as linhas de um upload concluído (uma chamada por upload) e grava em disco"""
+        hashes = np.asarray(hashes, dtype="uint64")
+        if len(hashes) == 0:
+            return
+        with self._lock:
+            self._indice, self._contagens = self._combinar([(self._indice, self._contagens), self._contar(hashes)])
+            self._pendentes.append((time.time(), hashes))
+            self._gravar()
+    
+    def sincronizar(self, df_detalhes, versao):
+        """
+        Reconcilia com a aba Detalhes_Canais (uma vez por versão carregada)
+        - As contagens passam a ser as da planilha, mais os uploads concluídos
+          depois que essa versão foi baixada
+        - Versão sem momento conhecido (cópia do disco, 0.0) só acrescenta:
+          vale o maior entre o índice e a aba
+        """
+        if versao is None or versao == self._versao_sincronizada:
+            return
+        da_aba = self._contar(hash_linhas_vendas(df_detalhes))
+        with self._lock:
+            if versao:
+                self._pendentes = [(momento, hashes) for momento, hashes in self._pendentes if momento > versao]
+                partes = [da_aba] + [self._contar(hashes) for _, hashes in self._pendentes]
+                self._indice, self._contagens = self._combinar(partes)
+            else:
+                self._indice, self._contagens = self._combinar(
+                    [(self._indice, self._contagens), da_aba], np.maximum
+                )
+            self._versao_sincronizada = versao
+            self._gravar()
+    
+    def _gravar(self):
+        try:
+            self._caminho.parent.mkdir(parents=True, exist_ok=True)
+            temporario = self._caminho.with_suffix(".tmp.npy")
+            np.save(temporario, np.repeat(self._indice.to_numpy(), self._contagens))
+            os.replace(temporario, self._caminho)
+        except OSError:
+            pass
+
+class VerificadorDuplicados:
     """
+    Marca os duplicados de um upload contra um instantâneo do índice tirado
+    antes do primeiro lote (o que o próprio upload grava não conta)
+    - A k-ésima linha igual do upload é duplicada só se a planilha já tem k
+    - As ocorrências se acumulam entre os lotes do mesmo upload
+    """
+    
+    def __init__(self, indice):
+        self._indice, self._contagens = indice.instantaneo()
+        self._vistas = np.zeros(len(self._indice), dtype="int64")
+    
+    def marcar(self, hashes):
+        """Máscara booleana dos duplicados deste lote"""
+        hashes = np.asarray(hashes, dtype="uint64")
+        duplicado = np.zeros(len(hashes), dtype=bool)
+        if len(hashes) == 0 or len(self._indice) == 0:
+            return duplicado
+        posicoes = self._indice.get_indexer(hashes)
+        na_planilha = posicoes != -1
+        posicoes = posicoes[na_planilha]
+        # Ocorrência da linha entre as iguais: lotes anteriores + ordem dentro do lote
+        ocorrencia = self._vistas[posicoes] + pd.Series(posicoes).groupby(posicoes).cumcount().to_numpy()
+        duplicado[na_planilha] = ocorrencia < self._contagens[posicoes]
+        np.add.at(self._vistas, posicoes, 1)
+        return duplicado
+
+@st.cache_resource
+def _indice_dedup():
+    """Instância única do índice de deduplicação"""
+    return IndiceDedup(Path(DIR_CACHE_DISCO) / "dedup_detalhes_canais.npy")
+
+def get_indice_dedup():
+    """Índice de deduplicação já sincronizado com a última carga de Detalhes_Canais"""
+    indice = _indice_dedup()
+    df_detalhes = carregar_aba("detalhes_canais")
+    indice.sincronizar(df_detalhes, get_cache_abas().versao("detalhes_canais"))
+    return indice
+
+# ───────────────────────────────────────────────────────────────────────────────
+# 5.2 LEITURA EM LOTES DO ARQUIVO DE UPLOAD (memória constante)
+# ───────────────────────────────────────────────────────────────────────────────
+
+def _nomes_colunas(cabecalho):
+    """Nomeia colunas como o pandas: vazias viram 'Unnamed: i', repetidas ganham '.n'"""
+    nomes = []
+    vistos = {}
+    for i, valor in enumerate(cabecalho):
+        nome = f"Unnamed: {i}" if valor is None or str(valor).strip() == "" else str(valor)
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        nomes.append(nome)
+    return nomes
+
+def _eh_excel_openpyxl(arquivo):
+    """xlsx é lido em streaming pelo openpyxl; xls/csv seguem outros caminhos"""
+    return getattr(arquivo, "name", "").lower().endswith(".xlsx")
+
+def _abrir_xlsx(arquivo):
+    """Workbook read-only do openpyxl (importado só quando chega um .xlsx)"""
+    from openpyxl import load_workbook
+    return load_workbook(arquivo, read_only=True, data_only=True)
+
+def ler_upload_em_lotes(arquivo, tamanho_lote=TAMANHO_LOTE_UPLOAD):
+    """
+    Lê o arquivo de vendas em lotes de até `tamanho_lote` linhas
+    - .xlsx: openpyxl em modo read-only (não carrega a planilha inteira)
+    - .csv: pandas com chunksize
+    - .xls: formato antigo sem leitura em streaming (lê tudo e fatia)
+    """
+    arquivo.seek(0)
+    nome = getattr(arquivo, "name", "").lower()
+    
+    if nome.endswith(".csv"):
+        # Detecta o separador (exports brasileiros costumam usar ';') e lê com o parser C
+        amostra = arquivo.read(64 * 1024)
+        arquivo.seek(0)
+        if isinstance(amostra, bytes):
+            amostra = amostra.decode("utf-8", errors="ignore")
+        try:
+            separador = csv.Sniffer().sniff(amostra, delimiters=",;\t|").delimiter
+        except csv.Error:
+            separador = ","
+        # Context manager: fecha o leitor sem fechar o arquivo enviado
+        with pd.read_csv(arquivo, chunksize=tamanho_lote, sep=separador) as leitor:
+            for lote in leitor:
+                yield lote
+        return
+    
+    if not _eh_excel_openpyxl(arquivo):
+        df = pd.read_excel(arquivo)
+        for inicio in range(0, len(df), tamanho_lote):
+            yield df.iloc[inicio:inicio + tamanho_lote]
+        return
+    
+    wb = _abrir_xlsx(arquivo)
     try:
-        client = get_gspread_client()
-        if not client:
-            st.error("❌ Falha na autenticação")
-            return False
+        linhas = wb.worksheets[0].iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        colunas = _nomes_colunas(cabecalho)
         
-        # Abre a planilha
-        sh = client.open_by_key(SHEET_ID)
-        
-        # Acessa a aba Detalhes_Canais
+        buffer = []
+        for linha in linhas:
+            # Linhas totalmente vazias são ignoradas (como no pd.read_excel)
+            if all(v is None for v in linha):
+                continue
+            linha = tuple(linha[:len(colunas)]) + (None,) * (len(colunas) - len(linha))
+            buffer.append(linha)
+            if len(buffer) >= tamanho_lote:
+                yield pd.DataFrame(buffer, columns=colunas)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=colunas)
+    finally:
+        wb.close()
+
+def ler_colunas_upload(arquivo):
+    """Retorna só os nomes de colunas do arquivo (para o mapeamento)"""
+    if _eh_excel_openpyxl(arquivo):
+        arquivo.seek(0)
+        wb = _abrir_xlsx(arquivo)
+        try:
+            cabecalho = next(wb.worksheets[0].iter_rows(values_only=True, max_row=1), ())
+        finally:
+            wb.close()
+        return _nomes_colunas(cabecalho)
+    
+    primeiro_lote = next(ler_upload_em_lotes(arquivo, tamanho_lote=1), pd.DataFrame())
+    return primeiro_lote.columns.tolist()
+
+def _preparar_lote_upload(lote, mapeamento, canal, cnpj, data_venda, verificador=None):
+    """Mapeia e prepara um lote bruto; retorna (lote_preparado, linhas_sem_produto)"""
+    df_mapped = lote.rename(columns=mapeamento)[['Produto', 'Quantidade', 'Total Venda']]
+    
+    # Valida: produto obrigatório
+    produto = df_mapped['Produto']
+    validos = produto.notna() & (produto.astype(str).str.strip() != "")
+    descartadas = int((~validos).sum())
+    
+    df_preparado = preparar_dados_para_salvar(
+        df_mapped[validos], canal, cnpj, data_venda, mostrar_status=False, verificador=verificador
+    )
+    if df_preparado is None:
+        raise ValueError("Falha ao preparar lote do upload")
+    return df_preparado, descartadas
+
+def processar_upload_em_lotes(arquivo, mapeamento, canal, cnpj, data_venda):
+    """
+    Mapeia, valida e prepara o upload lote a lote
+    Gera (lote_preparado, linhas_descartadas) - descarta linhas sem Produto
+    Duplicados só são marcados (COLUNA_DUPLICADO): a remoção fica com
+    salvar_dados_sheets, para a retomada por posição continuar válida
+    Todos os lotes são comparados com o índice como estava antes do upload
+    """
+    verificador = VerificadorDuplicados(get_indice_dedup())
+    for lote in ler_upload_em_lotes(arquivo):
+        yield _preparar_lote_upload(lote, mapeamento, canal, cnpj, data_venda, verificador)
+
+def produtos_sem_cadastro(df, indice):
+    """Máscara das linhas cujo Produto não está em Produtos/Kits (vazia se não há cadastro)"""
+    if not len(indice.produtos):
+        return np.zeros(len(df), dtype=bool)
+    return ~indice.consultar(df[['Produto']])["Cadastrado"].to_numpy()
+
+def totalizar_lotes(lotes, resumo, indice=None):
+    """
+    Repassa os lotes preparados somando os totais em `resumo`
+    Assim a mesma passada que grava no Sheets produz as métricas do upload
+    """
+    for lote, descartadas in lotes:
+        if indice is not None:
+            resumo["sem_cadastro"] += int(produtos_sem_cadastro(lote, indice).sum())
+        resumo["linhas"] += len(lote)
+        resumo["descartadas"] += descartadas
+        resumo["duplicados"] += int(lote[COLUNA_DUPLICADO].sum())
+        resumo["total_vendas"] += float(lote['Total Venda'].sum())
+        resumo["total_pecas"] += int(lote['Quantidade'].sum())
+        yield lote
+
+def resumo_vazio():
+    """Totais zerados, preenchidos por totalizar_lotes"""
+    return {"linhas": 0, "descartadas": 0, "duplicados": 0, "sem_cadastro": 0, "total_vendas": 0.0, "total_pecas": 0}
+
+def hash_upload(arquivo):
+    """SHA-256 do arquivo enviado (calculado uma vez por arquivo na sessão)"""
+    chave = (getattr(arquivo, "file_id", None) or getattr(arquivo, "name", ""), getattr(arquivo, "size", None))
+    memo = st.session_state.setdefault("_hash_upload", {})
+    if chave not in memo:
+        memo.clear()
+        memo[chave] = hashlib.sha256(arquivo.getvalue()).hexdigest()
+    return memo[chave]
+
+def _estimar_linhas_upload(arquivo):
+    """Nº aproximado de linhas de dados (só para a barra de progresso); None se desconhecido"""
+    nome = getattr(arquivo, "name", "").lower()
+    if nome.endswith(".csv"):
+        return max(0, arquivo.getvalue().count(b"\n") - 1)
+    if _eh_excel_openpyxl(arquivo):
+        arquivo.seek(0)
+        wb = _abrir_xlsx(arquivo)
+        try:
+            max_row = wb.worksheets[0].max_row
+        finally:
+            wb.close()
+        return max_row - 1 if max_row else None
+    return None
+
+def ler_upload_cacheado(arquivo, limite_amostra=LIMITE_PREVIEW_UPLOAD):
+    """
+    Cabeçalho, amostra bruta e nº estimado de linhas, guardados pelo hash do arquivo
+    Trocar o mapeamento ou marcar caixas não relê o arquivo
+    """
+    chave = hash_upload(arquivo)
+    memo = st.session_state.setdefault("_upload_lido", {})
+    if chave not in memo:
+        colunas = ler_colunas_upload(arquivo)
+        memo.clear()
+        memo[chave] = {
+            "colunas": colunas,
+            "amostra": next(ler_upload_em_lotes(arquivo, tamanho_lote=limite_amostra), pd.DataFrame(columns=colunas)),
+            "linhas_estimadas": _estimar_linhas_upload(arquivo),
+        }
+    return memo[chave]
+
+# ───────────────────────────────────────────────────────────────────────────────
+# 5.3 ESCRITA EM LOTES NO SHEETS (backoff + checkpoint para retomar)
+# ───────────────────────────────────────────────────────────────────────────────
+
+def id_upload(arquivo, *parametros):
+    """Identificador estável de um upload: hash do arquivo + canal/CNPJ/data/mapeamento"""
+    h = hashlib.sha256(hash_upload(arquivo).encode("utf-8"))
+    for parametro in parametros:
+        h.update(json.dumps(parametro, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()[:32]
+
+def _caminho_checkpoint(id_envio):
+    return Path(DIR_CACHE_DISCO) / "uploads" / f"{id_envio}.json"
+
+def _ler_checkpoint(id_envio):
+    """Progresso salvo de um upload ({} se nunca iniciado)"""
+    if not id_envio:
+        return {}
+    try:
+        return json.loads(_caminho_checkpoint(id_envio).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def _salvar_checkpoint(id_envio, progresso):
+    """Grava o progresso de forma atômica (sobrevive a queda do processo)"""
+    if not id_envio:
+        return
+    caminho = _caminho_checkpoint(id_envio)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    temporario = caminho.with_suffix(".json.tmp")
+    temporario.write_text(json.dumps(progresso), encoding="utf-8")
+    os.replace(temporario, caminho)
+
+def _lotes_por_tamanho(values, max_linhas=MAX_LINHAS_LOTE_SHEETS, max_bytes=MAX_BYTES_LOTE_SHEETS):
+    """Divide as linhas em lotes limitados por quantidade e por tamanho estimado do payload"""
+    lote = []
+    bytes_lote = 0
+    for linha in values:
+        # Estimativa do JSON: conteúdo + aspas/vírgulas por célula
+        tamanho = sum(len(celula) for celula in linha) + 3 * len(linha)
+        if lote and (len(lote) >= max_linhas or bytes_lote + tamanho > max_bytes):
+            yield lote
+            lote = []
+            bytes_lote = 0
+        lote.append(linha)
+        bytes_lote += tamanho
+    if lote:
+        yield lote
+
+def _erro_temporario(erro):
+    """429 (cota) e 5xx do Sheets, ou falha de rede, valem nova tentativa"""
+    # gspread só é importado ao autenticar; sem ele o erro não é do Sheets
+    gspread = sys.modules.get("gspread")
+    if gspread is not None and isinstance(erro, gspread.exceptions.APIError):
+        status = getattr(erro.response, "status_code", None)
+        return status == 429 or (status is not None and status >= 500)
+    return isinstance(erro, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def _envio_nao_aplicado(erro):
+    """
+    429 (cota) ou falha ao abrir a conexão: o Sheets com certeza não aplicou o append
+    Timeout de leitura, conexão caída depois do envio e 5xx são ambíguos
+    """
+    gspread = sys.modules.get("gspread")
+    if gspread is not None and isinstance(erro, gspread.exceptions.APIError):
+        return getattr(erro.response, "status_code", None) == 429
+    if isinstance(erro, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(erro, requests.exceptions.ConnectionError) and erro.args:
+        motivo = getattr(erro.args[0], "reason", erro.args[0])
+        return isinstance(motivo, urllib3.exceptions.NewConnectionError)
+    return False
+
+def _ultima_linha_gravada(resposta):
+    """Última linha do append segundo updates.updatedRange ('Aba'!A11:P20 -> 20), ou None"""
+    if not isinstance(resposta, dict):
+        return None
+    faixa = resposta.get("updates", {}).get("updatedRange", "")
+    encontrado = re.search(r"(\d+)$", faixa)
+    return int(encontrado.group(1)) if encontrado else None
+
+def _lote_ja_gravado(worksheet, values, ultima_linha):
+    """
+    Depois de uma falha ambígua, confere se o append foi aplicado mesmo assim:
+    as linhas logo após `ultima_linha` (sem ela, as últimas da aba) são as enviadas
+    Retorna a última linha do lote na aba, ou None se ele não está lá
+    """
+    if ultima_linha is None:
+        inicio = len(worksheet.col_values(1)) - len(values) + 1
+        if inicio < 2:
+            return None
+    else:
+        inicio = ultima_linha + 1
+    fim = inicio + len(values) - 1
+    
+    def _aparar(linha):
+        linha = [str(celula) for celula in linha]
+        while linha and linha[-1] == "":
+            linha.pop()
+        return linha
+    
+    gravadas = worksheet.get_values(f"{inicio}:{fim}")
+    if len(gravadas) == len(values) and all(_aparar(a) == _aparar(b) for a, b in zip(gravadas, values)):
+        return fim
+    return None
+
+def _anexar_com_retentativa(worksheet, values, ultima_linha=None):
+    """
+    append_rows com backoff exponencial (com jitter) em erros temporários
+    O append não é idempotente: fora 429 / falha de conexão, antes de reenviar
+    confere na aba se o lote já entrou (evita gravar o lote duas vezes)
+    Retorna a última linha gravada (ou None se a resposta não informar)
+    """
+    verificar = False
+    for tentativa in range(MAX_TENTATIVAS_SHEETS):
         try:
-            worksheet = sh.worksheet("Detalhes_Canais")
-        except:
-            st.error("❌ Aba 'Detalhes_Canais' não encontrada na planilha!")
-            return False
+            if verificar:
+                gravada = _lote_ja_gravado(worksheet, values, ultima_linha)
+                if gravada is not None:
+                    return gravada
+            return _ultima_linha_gravada(worksheet.append_rows(values))
+        except Exception as e:
+            if not _erro_temporario(e) or tentativa == MAX_TENTATIVAS_SHEETS - 1:
+                raise
+            # Uma vez ambígua, toda nova tentativa começa pela conferência
+            verificar = verificar or not _envio_nao_aplicado(e)
+            espera = min(BACKOFF_MAXIMO_SHEETS, BACKOFF_INICIAL_SHEETS * 2 ** tentativa)
+            time.sleep(espera * random.uniform(0.5, 1.0))
+
+def _celulas_planilha(df):
+    """
+    Texto de cada célula como vai para a planilha (append RAW, sem interpretação)
+    Números com vírgula decimal e sem milhar ("1234,56", "100,0"): a leitura BR
+    (clean_currency / safe_int) devolve o mesmo valor - str(float) gravaria
+    "1234.56", que volta da planilha como 123456
+    """
+    celulas = {}
+    for col in df.columns:
+        serie = df[col]
+        if pd.api.types.is_float_dtype(serie):
+            texto = serie.astype(str).str.replace(".", ",", regex=False)
+            celulas[col] = texto.where(serie.notna(), "")
+        else:
+            celulas[col] = serie.astype(str)
+    return pd.DataFrame(celulas, index=df.index)
+
+@medido
+def salvar_dados_sheets(df_novos_dados, id_envio=None, total_linhas=None, remover_duplicados=True, worksheet=None):
+    """
+    Salva novos dados na aba Detalhes_Canais
+    Usa gspread para append em lotes (limitados por linhas e bytes)
+    Aceita um DataFrame ou um iterável de DataFrames (lotes)
+    - Erros 429/5xx: backoff exponencial (lote de envio ambíguo é conferido antes)
+    - Com id_envio: grava checkpoint a cada lote e retoma de onde parou
+    - Linhas marcadas como duplicadas não são enviadas (remover_duplicados)
+    - `worksheet`: aba já aberta (ou substituta com row_values/append_row/append_rows);
+      sem ela, autentica e abre Detalhes_Canais
+    """
+    try:
+        if worksheet is None:
+            client = get_gspread_client()
+            if not client:
+                st.error("❌ Falha na autenticação")
+                return False
+            
+            # Abre a planilha
+            sh = client.open_by_key(SHEET_ID)
+            
+            # Acessa a aba Detalhes_Canais
+            try:
+                worksheet = sh.worksheet("Detalhes_Canais")
+            except:
+                st.error("❌ Aba 'Detalhes_Canais' não encontrada na planilha!")
+                return False
+        
+        # Retomada: pula linhas já gravadas numa tentativa anterior
+        progresso = _ler_checkpoint(id_envio)
+        if progresso.get("concluido"):
+            st.info(f"ℹ️ Este upload já foi salvo ({progresso['linhas_enviadas']} registros) - nada reenviado")
+            return True
+        ja_enviadas = progresso.get("linhas_enviadas", 0)
+        if ja_enviadas:
+            st.info(f"🔁 Retomando upload: {ja_enviadas} registros já estavam salvos")
         
         # Lê headers existentes
         existing_headers = worksheet.row_values(1)
         
         # Se planilha vazia, insere headers
+        ultima_linha = None  # última linha gravada (conferência de append ambíguo)
         if not existing_headers or len(existing_headers) == 0:
             worksheet.append_row(COLUNAS_ESPERADAS)
             existing_headers = COLUNAS_ESPERADAS
+            ultima_linha = 1
         
-        # Alinha DataFrame com colunas da planilha
-        df_aligned = pd.DataFrame(columns=existing_headers)
-        for col in existing_headers:
-            if col in df_novos_dados.columns:
-                df_aligned[col] = df_novos_dados[col]
-            else:
-                df_aligned[col] = ''
+        lotes = [df_novos_dados] if isinstance(df_novos_dados, pd.DataFrame) else df_novos_dados
+        barra = st.progress(0.0, text="Enviando...") if total_linhas else None
+        inicio = time.perf_counter()
+        linhas_lidas = 0
+        enviadas_agora = 0
+        duplicados_ignorados = 0
+        hashes_gravados = []  # entram no índice de duplicados só no fim do upload
         
-        # Converte tudo para string
-        df_aligned = df_aligned.astype(str)
+        for lote in lotes:
+            if len(lote) == 0:
+                continue
+            
+            # Descarta o trecho que já foi enviado antes da interrupção
+            # (posição conta também os duplicados, que nunca são removidos antes daqui)
+            pular = min(len(lote), max(0, ja_enviadas - linhas_lidas))
+            linhas_lidas += len(lote)
+            lote = lote.iloc[pular:]
+            
+            if remover_duplicados and COLUNA_DUPLICADO in lote.columns:
+                duplicados_ignorados += int(lote[COLUNA_DUPLICADO].sum())
+                enviadas_agora += int(lote[COLUNA_DUPLICADO].sum())
+                lote = lote[~lote[COLUNA_DUPLICADO]]
+            if len(lote) == 0:
+                continue
+            
+            # Alinha lote com colunas da planilha e converte tudo para texto BR
+            df_aligned = _celulas_planilha(lote.reindex(columns=existing_headers, fill_value=''))
+            hashes_lote = hash_linhas_vendas(lote)
+            
+            posicao = 0
+            for values in _lotes_por_tamanho(df_aligned.values.tolist()):
+                ultima_linha = _anexar_com_retentativa(worksheet, values, ultima_linha)
+                hashes_gravados.append(hashes_lote[posicao:posicao + len(values)])
+                get_motor_local().acumular(lote.iloc[posicao:posicao + len(values)])
+                posicao += len(values)
+                enviadas_agora += len(values)
+                _salvar_checkpoint(id_envio, {"linhas_enviadas": ja_enviadas + enviadas_agora, "concluido": False})
+                if barra:
+                    barra.progress(
+                        min(1.0, (ja_enviadas + enviadas_agora) / total_linhas),
+                        text=f"Enviando... {ja_enviadas + enviadas_agora}/{total_linhas}"
+                    )
         
-        # Append em lote
-        values = df_aligned.values.tolist()
-        worksheet.append_rows(values)
+        _salvar_checkpoint(id_envio, {"linhas_enviadas": ja_enviadas + enviadas_agora, "concluido": True})
+        if hashes_gravados:
+            get_indice_dedup().adicionar(np.concatenate(hashes_gravados))
         
-        st.success(f"✅ {len(values)} registros salvos na aba 'Detalhes_Canais'!")
-        st.info("⏳ Aguarde 1-2 minutos para as fórmulas da planilha processarem os dados")
+        segundos = time.perf_counter() - inicio
+        gravadas = enviadas_agora - duplicados_ignorados
+        anotar_span(linhas=gravadas)
+        taxa = gravadas / segundos if segundos > 0 else 0
+        st.success(f"✅ {gravadas} registros salvos na aba 'Detalhes_Canais'! ({taxa:,.0f} linhas/s)".replace(",", "."))
+        if duplicados_ignorados:
+            st.info(f"🧹 {duplicados_ignorados} registros duplicados foram ignorados")
+        # Recarrega Detalhes_Canais em segundo plano (o motor local usa na hora)
+        get_cache_abas().invalidar(["detalhes_canais"], fonte_abas())
+        if usar_motor_local():
+            st.info("⚡ Métricas calculadas no app - o dashboard reflete os dados em instantes")
+        else:
+            st.info("⏳ Aguarde 1-2 minutos para as fórmulas da planilha processarem os dados")
         return True
         
     except Exception as e:
         st.error(f"❌ Erro ao salvar: {str(e)}")
+        if id_envio and _ler_checkpoint(id_envio).get("linhas_enviadas"):
+            st.info("💡 O progresso foi salvo - clique em SALVAR novamente para retomar")
         return False
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # 6. INTERFACE PRINCIPAL
 # ═══════════════════════════════════════════════════════════════════════════════
 
+# ───────────────────────────────────────────────────────────────────────────────
+# 6.1 TABELA PAGINADA (ordenação e busca no servidor, só a página vai ao navegador)
+# ───────────────────────────────────────────────────────────────────────────────
+
+TAMANHOS_PAGINA = [25, 50, 100, 250]
+ORDEM_ORIGINAL = "(ordem da planilha)"
+
+# Abas que o motor local substitui quando "Calcular no app" está ligado
+ABAS_CALCULADAS = {"dashboard_geral", "resultado_cnpj", "vendas_sku_geral",
+                   "bcg_canal_mkt", "oportunidades_canais_mkt"}
+
+def versao_tabela(nome_aba):
+    """Identifica o conteúdo exibido de uma aba (muda quando é recarregada ou recalculada)"""
+    filtro = filtro_atual()
+    if filtro is not None and nome_aba in ABAS_CALCULADAS:
+        return ("filtro", get_indice_consulta().versao, filtro)
+    if usar_motor_local() and nome_aba in ABAS_CALCULADAS:
+        return ("motor", get_motor_local().revisao)
+    return ("aba", get_cache_abas().versao(nome_aba))
+
+@st.cache_resource
+def _indices_tabelas():
+    """chave da tabela -> (versão, {índice: array}) compartilhado entre sessões"""
+    return {"lock": threading.Lock(), "tabelas": {}}
+
+def _indice_tabela(chave, versao, nome_indice, construir):
+    """Índice pré-calculado da tabela (descartado quando a versão muda)"""
+    memo = _indices_tabelas()
+    with memo["lock"]:
+        versao_atual, indices = memo["tabelas"].get(chave, (None, {}))
+        if versao_atual != versao:
+            indices = {}
+            memo["tabelas"][chave] = (versao, indices)
+        if nome_indice in indices:
+            return indices[nome_indice]
+    indice = construir()
+    with memo["lock"]:
+        indices[nome_indice] = indice
+    return indice
+
+def _ordem_coluna(serie, decrescente):
+    """Posições que ordenam a coluna (estável, vazios no fim)"""
+    serie = serie.reset_index(drop=True)
+    try:
+        ordenada = serie.sort_values(ascending=not decrescente, kind="stable", na_position="last")
+    except TypeError:
+        ordenada = serie.astype(str).sort_values(ascending=not decrescente, kind="stable")
+    return ordenada.index.to_numpy()
+
+def _texto_busca(df):
+    """Texto normalizado das colunas de texto, uma linha por registro"""
+    colunas = [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c])]
+    if not colunas:
+        return pd.Series("", index=range(len(df)))
+    texto = normalizar_series(df[colunas[0]])
+    for col in colunas[1:]:
+        texto = texto + " | " + normalizar_series(df[col])
+    return texto.reset_index(drop=True)
+
+@medido
+def tabela_paginada(df, chave, versao, colunas_monetarias=(), metas=None, coluna_ordem=None):
+    """
+    Exibe df paginado: busca e ordenação rodam sobre índices em cache
+    e só a página visível é formatada e enviada ao navegador
+    """
+    col_busca, col_ordem, col_sentido, col_tamanho = st.columns([3, 2, 1, 1])
+    busca = col_busca.text_input("🔎 Buscar", key=f"{chave}_busca")
+    opcoes = [ORDEM_ORIGINAL] + list(df.columns)
+    indice_padrao = opcoes.index(coluna_ordem) if coluna_ordem in opcoes else 0
+    ordenar_por = col_ordem.selectbox("Ordenar por", opcoes, index=indice_padrao, key=f"{chave}_ordem")
+    decrescente = col_sentido.toggle("Decrescente", value=coluna_ordem is not None, key=f"{chave}_desc")
+    tamanho = col_tamanho.selectbox("Linhas", TAMANHOS_PAGINA, index=1, key=f"{chave}_tamanho")
+
+    if ordenar_por == ORDEM_ORIGINAL:
+        posicoes = np.arange(len(df))[::-1] if decrescente else np.arange(len(df))
+    else:
+        posicoes = _indice_tabela(
+            chave, versao, ("ordem", ordenar_por, decrescente),
+            lambda: _ordem_coluna(df[ordenar_por], decrescente)
+        )
+    termo = normalizar(busca)
+    if termo:
+        texto = _indice_tabela(chave, versao, "busca", lambda: _texto_busca(df))
+        encontrados = texto.str.contains(termo, regex=False).to_numpy(dtype=bool)
+        posicoes = posicoes[encontrados[posicoes]]
+
+    total = len(posicoes)
+    paginas = max(1, -(-total // tamanho))
+    chave_pagina = f"{chave}_pagina"
+    if st.session_state.get(chave_pagina, 1) > paginas:
+        st.session_state[chave_pagina] = paginas  # a busca encolheu o resultado
+    pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, step=1, key=chave_pagina)
+    inicio = (pagina - 1) * tamanho
+    pagina_df = df.iloc[posicoes[inicio:inicio + tamanho]]
+
+    st.dataframe(formatar_tabela(pagina_df, colunas_monetarias, metas), use_container_width=True, hide_index=True)
+
+    def _milhar(n):
+        return f"{n:,}".replace(",", ".")
+    
+    resumo = f"Mostrando {_milhar(min(inicio + 1, total))}–{_milhar(min(inicio + tamanho, total))} de {_milhar(total)}"
+    if total != len(df):
+        resumo += f" (filtrados de {_milhar(len(df))})"
+    if 'Total Venda' in df.columns and pd.api.types.is_numeric_dtype(df['Total Venda']) and total:
+        resumo += f" · Total Venda: {format_currency_br(df['Total Venda'].iloc[posicoes].sum())}"
+    st.caption(resumo)
+
+def _megabytes(valor):
+    """Bytes -> MB com 2 casas (None quando não medido)"""
+    return None if valor is None else round(valor / 2**20, 2)
+
+# Abas da importação: referências (produtos sem cadastro) e Detalhes_Canais
+# (índice de duplicados) - só pré-carregadas depois que um arquivo é escolhido
+ABAS_IMPORTACAO = sorted(set(ABAS_REFERENCIA) | {"detalhes_canais"})
+
+# Visões da tela principal -> abas que cada uma lê ao abrir
+VISOES = {
+    "📤 Importar Vendas": set(),
+    "📊 Dashboard Geral": {"dashboard_geral", "metas"},
+    "🏢 Por CNPJ": {"resultado_cnpj", "metas"},
+    "📈 BCG por Canal": {"bcg_canal_mkt"},
+    "💰 Preços MKTP": {"preco_simples_mktp"},
+    "🔄 Giro SKU": {"vendas_sku_geral"},
+    "💡 Oportunidades": {"oportunidades_canais_mkt", "metas"},
+}
+
+def abas_da_visao(visao):
+    """Abas a pré-carregar para a visão (com as de origem quando há cálculo no app)"""
+    abas = set(VISOES[visao])
+    if abas & ABAS_CALCULADAS:
+        abas.add("detalhes_canais")  # filtros e tendência
+        if usar_motor_local():
+            abas.update(ABAS_MOTOR)
+    return sorted(abas)
+
+def prefetch_uma_vez(chave, abas):
+    """Pré-carrega em paralelo as abas (uma vez por janela de TTL para cada chave)"""
+    prefetch_em = st.session_state.setdefault("prefetch_em", {})
+    if abas and time.time() - prefetch_em.get(chave, 0) > TTL_ABAS:
+        inicio = time.perf_counter()
+        st.session_state.setdefault("tempos_prefetch", {}).update(prefetch_abas(abas))
+        st.session_state["tempo_prefetch_total"] = time.perf_counter() - inicio
+        prefetch_em[chave] = time.time()
+
+def limpar_filtros():
+    """Volta os filtros da barra lateral ao estado inicial"""
+    st.session_state["filtro_periodo"] = ()
+    for dim in DIMENSOES_FILTRO:
+        st.session_state[f"filtro_{dim.lower()}"] = []
+
 def main():
     st.set_page_config(
         page_title="Sales BI Pro - V55",
@@ -483,6 +3105,21 @@ def main():
     st.title("📊 Sales BI Pro - V55 FINAL")
     st.caption("✅ Dashboard lê abas processadas | Upload salva em Detalhes_Canais")
     
+    # Perfil: um span para o rerun inteiro, com os internos aninhados
+    iniciar_perfil()
+    span_rerun = abrir_span("rerun")
+    
+    # Navegação: só a visão escolhida roda (st.tabs executaria as sete a cada rerun)
+    visao = st.radio("Visão", list(VISOES), horizontal=True, key="visao", label_visibility="collapsed")
+    
+    # Filtros de visões não exibidas continuam valendo ao voltar para elas
+    for chave in ["filtro_periodo"] + [f"filtro_{dim.lower()}" for dim in DIMENSOES_FILTRO]:
+        if chave in st.session_state:
+            st.session_state[chave] = st.session_state[chave]
+    
+    # Pré-carrega em paralelo as abas da visão atual (uma vez por janela de TTL)
+    prefetch_uma_vez(visao, abas_da_visao(visao))
+    
     # ═══════════════════════════════════════════════════════════════════════════
     # SIDEBAR - CONTROLES
     # ═══════════════════════════════════════════════════════════════════════════
@@ -512,32 +3149,97 @@ def main():
         if modo_simulacao:
             st.warning("⚠️ Dados não serão salvos na planilha")
         
+        # Fonte das abas processadas
+        st.toggle(
+            "⚡ Calcular no app (sem esperar fórmulas)",
+            key="motor_local",
+            help="Dashboard Geral, Por CNPJ e Giro SKU calculados direto de Detalhes_Canais + abas de referência"
+        )
+        
+        # Filtros sobre as linhas de Detalhes_Canais (respondidos pelo índice em cache)
+        filtro = filtro_atual()
+        if VISOES[visao] & ABAS_CALCULADAS:
+            with st.expander("🔎 Filtros" + (" (ativos)" if filtro else ""), expanded=filtro is not None):
+                indice = get_indice_consulta()
+                if indice.periodo is not None:
+                    menor, maior = (pd.Timestamp(d).date() for d in indice.periodo)
+                    st.session_state.setdefault("filtro_periodo", ())
+                    st.date_input("Período", min_value=menor, max_value=maior, key="filtro_periodo")
+                for dim in DIMENSOES_FILTRO:
+                    if dim in indice.categorias:
+                        st.multiselect(dim, options=list(indice.categorias[dim]), key=f"filtro_{dim.lower()}", placeholder="Todos")
+                if filtro is not None:
+                    st.caption(f"{len(indice.consultar(filtro)):,} de {len(indice.vendas):,} linhas".replace(",", "."))
+                    st.button("Limpar filtros", on_click=limpar_filtros, use_container_width=True)
+                st.caption("Com filtro, Dashboard / CNPJ / BCG / Giro / Oportunidades são calculados das linhas filtradas")
+        
         st.divider()
         
-        # Limpar cache
-        if st.button("🔄 Atualizar Dados (Limpar Cache)", use_container_width=True):
-            st.cache_data.clear()
+        # Origem dos downloads (trocar recarrega todas as abas pela nova fonte)
+        st.session_state.setdefault("fonte_abas", fonte_abas())
+        st.radio(
+            "📡 Fonte das abas",
+            options=list(FONTES_ABAS),
+            format_func=FONTES_ABAS.get,
+            key="fonte_abas",
+            on_change=trocar_fonte_abas,
+            help="Sheets API: todas as abas num único batchGet autenticado, com valores já numéricos"
+        )
+        
+        # Atualização de dados (em segundo plano, sem bloquear a tela)
+        abas_para_atualizar = st.multiselect(
+            "Abas para atualizar",
+            options=list(ABAS.keys()),
+            format_func=lambda x: ABAS[x]["nome"],
+            placeholder="Todas"
+        )
+        if st.button("🔄 Atualizar Dados", use_container_width=True):
+            get_cache_abas().invalidar(abas_para_atualizar or None, fonte_abas())
+            st.session_state.pop("prefetch_em", None)
             st.rerun()
+        
+        abas_atualizando = get_cache_abas().atualizando()
+        if abas_atualizando:
+            st.caption(f"⏳ Atualizando em segundo plano: {', '.join(ABAS[n]['nome'] for n in abas_atualizando)}")
+        
+        # Uso do cache em memória (orçamento + LRU)
+        estatisticas = get_cache_abas().estatisticas()
+        st.caption(
+            f"🧠 Cache: {_megabytes(estatisticas['bytes'])} de {_megabytes(estatisticas['orcamento'])} MB "
+            f"({estatisticas['abas']} abas) · acertos {estatisticas['acertos']} · "
+            f"faltas {estatisticas['faltas']} · despejos {estatisticas['despejos']}"
+        )
+        
+        # Perfil de desempenho deste rerun (preenchido no fim de main)
+        st.toggle("🐞 Perfil de desempenho", key="debug_spans",
+                  help="Tempo de cada etapa deste rerun: carga das abas, cálculos e renderização")
+        painel_spans = st.empty()
+        
+        # Tempos do último pré-carregamento
+        tempos_prefetch = st.session_state.get("tempos_prefetch")
+        if tempos_prefetch:
+            total = st.session_state.get("tempo_prefetch_total", 0)
+            with st.expander(f"⏱️ Carregamento das abas ({total:.2f}s)"):
+                st.dataframe(
+                    pd.DataFrame([
+                        {
+                            "Aba": ABAS[nome]["nome"], "Segundos": round(info["segundos"], 3), "Linhas": info["linhas"],
+                            "MB antes": _megabytes(info.get("memoria_antes")),
+                            "MB depois": _megabytes(info.get("memoria_depois")),
+                        }
+                        for nome, info in tempos_prefetch.items()
+                    ]),
+                    hide_index=True,
+                    use_container_width=True
+                )
     
-    # ═══════════════════════════════════════════════════════════════════════════
-    # ABAS PRINCIPAIS
-    # ═══════════════════════════════════════════════════════════════════════════
-    
-    tabs = st.tabs([
-        "📤 Importar Vendas",
-        "📊 Dashboard Geral",
-        "🏢 Por CNPJ",
-        "📈 BCG por Canal",
-        "💰 Preços MKTP",
-        "🔄 Giro SKU",
-        "💡 Oportunidades"
-    ])
+    span_visao = abrir_span("render", visao=visao)
     
     # ═══════════════════════════════════════════════════════════════════════════
     # ABA 1: IMPORTAR VENDAS
     # ═══════════════════════════════════════════════════════════════════════════
     
-    with tabs[0]:
+    if visao == "📤 Importar Vendas":
         st.header("📤 Importar Vendas")
         
         col1, col2, col3 = st.columns(3)
@@ -566,16 +3268,17 @@ def main():
         # Upload de arquivo
         uploaded_file = st.file_uploader(
             "📁 Selecione o arquivo Excel de vendas",
-            type=['xlsx', 'xls'],
+            type=['xlsx', 'xls', 'csv'],
             help="Arquivo deve conter: Código/Produto, Quantidade, Valor"
         )
         
         if uploaded_file:
+            # Referências e Detalhes_Canais só agora, em paralelo, antes da pré-visualização
+            prefetch_uma_vez("upload", ABAS_IMPORTACAO)
             try:
-                # Lê Excel
-                df_upload = pd.read_excel(uploaded_file)
-                
-                st.success(f"✅ Arquivo carregado: {len(df_upload)} linhas")
+                # Cabeçalho + amostra, lidos uma vez por arquivo (hash)
+                upload_lido = ler_upload_cacheado(uploaded_file)
+                colunas_upload = upload_lido["colunas"]
                 
                 # Mapeamento de colunas
                 st.subheader("🔗 Mapeamento de Colunas")
@@ -585,78 +3288,130 @@ def main():
                 with col_map1:
                     col_produto = st.selectbox(
                         "Coluna de PRODUTO:",
-                        options=df_upload.columns.tolist(),
+                        options=colunas_upload,
                         index=0
                     )
                 
                 with col_map2:
                     col_quantidade = st.selectbox(
                         "Coluna de QUANTIDADE:",
-                        options=df_upload.columns.tolist(),
-                        index=1 if len(df_upload.columns) > 1 else 0
+                        options=colunas_upload,
+                        index=1 if len(colunas_upload) > 1 else 0
                     )
                 
                 with col_map3:
                     col_valor = st.selectbox(
                         "Coluna de VALOR:",
-                        options=df_upload.columns.tolist(),
-                        index=2 if len(df_upload.columns) > 2 else 0
+                        options=colunas_upload,
+                        index=2 if len(colunas_upload) > 2 else 0
                     )
                 
-                # Renomeia colunas
-                df_mapped = df_upload.rename(columns={
+                mapeamento = {
                     col_produto: 'Produto',
                     col_quantidade: 'Quantidade',
                     col_valor: 'Total Venda'
-                })
+                }
                 
-                # Limpa valor
-                df_mapped['Total Venda'] = df_mapped['Total Venda'].apply(clean_currency)
-                df_mapped['Quantidade'] = df_mapped['Quantidade'].apply(safe_int)
+                parametros_envio = (mapeamento, canal, cnpj, data_venda)
+                id_envio = id_upload(uploaded_file, *parametros_envio)
                 
-                # Prepara dados
-                df_preparado = preparar_dados_para_salvar(
-                    df_mapped[['Produto', 'Quantidade', 'Total Venda']],
-                    canal,
-                    cnpj,
-                    data_venda
+                # Pré-visualização: só a amostra é mapeada e limpa; o arquivo
+                # inteiro é processado uma única vez, no envio
+                df_amostra, descartadas_amostra = _preparar_lote_upload(
+                    upload_lido["amostra"], *parametros_envio
                 )
+                linhas_estimadas = upload_lido["linhas_estimadas"]
                 
-                if df_preparado is not None:
+                if linhas_estimadas is not None:
+                    st.success(f"✅ Arquivo carregado: ~{linhas_estimadas} linhas")
+                else:
+                    st.success("✅ Arquivo carregado")
+                if descartadas_amostra:
+                    st.warning(f"⚠️ {descartadas_amostra} linhas sem produto na amostra serão ignoradas")
+                duplicados_amostra = int(df_amostra[COLUNA_DUPLICADO].sum())
+                if duplicados_amostra:
+                    st.warning(f"⚠️ {duplicados_amostra} registros da amostra já existem em 'Detalhes_Canais'")
+                indice_referencias = get_indice_referencias()
+                sem_cadastro = produtos_sem_cadastro(df_amostra, indice_referencias)
+                if sem_cadastro.any():
+                    exemplos = ", ".join(map(str, df_amostra['Produto'][sem_cadastro].unique()[:5]))
+                    st.warning(f"⚠️ {int(sem_cadastro.sum())} linhas da amostra com produto fora de Produtos/Kits (ex.: {exemplos}) - ficarão sem custo")
+                
+                if len(df_amostra) > 0:
                     # Pré-visualização
                     st.subheader("👀 Pré-visualização")
-                    
-                    # Calcula totais
-                    total_vendas = df_preparado['Total Venda'].sum()
-                    total_pecas = df_preparado['Quantidade'].sum()
-                    ticket_medio = total_vendas / len(df_preparado) if len(df_preparado) > 0 else 0
-                    
-                    col_tot1, col_tot2, col_tot3 = st.columns(3)
-                    col_tot1.metric("💰 Total Vendas", format_currency_br(total_vendas))
-                    col_tot2.metric("📦 Total Peças", f"{total_pecas}")
-                    col_tot3.metric("🎯 Ticket Médio", format_currency_br(ticket_medio))
-                    
+                    st.caption(
+                        f"Amostra das primeiras {len(upload_lido['amostra'])} linhas - "
+                        "os totais do arquivo são calculados durante o envio"
+                    )
                     st.dataframe(
-                        df_preparado[['Data', 'Canal', 'CNPJ', 'Produto', 'Quantidade', 'Total Venda']],
+                        df_amostra[['Data', 'Canal', 'CNPJ', 'Produto', 'Quantidade', 'Total Venda']],
                         use_container_width=True
                     )
                     
                     st.divider()
                     
+                    def processar_com_totais():
+                        """Passada única pelo arquivo: prepara os lotes e acumula os totais"""
+                        resumo = resumo_vazio()
+                        lotes = totalizar_lotes(
+                            processar_upload_em_lotes(uploaded_file, *parametros_envio), resumo, indice_referencias
+                        )
+                        return lotes, resumo
+                    
                     # Botão de salvar
                     if modo_simulacao:
                         st.info("🧪 Modo SIMULAÇÃO ativo - dados não serão salvos")
+                        if st.button("🧮 Calcular totais do arquivo", use_container_width=True):
+                            with st.spinner("Processando..."):
+                                lotes, resumo = processar_com_totais()
+                                for _ in lotes:
+                                    pass
+                            st.session_state["resumo_upload"] = (id_envio, resumo)
                     else:
+                        remover_duplicados = st.checkbox(
+                            "🧹 Ignorar registros já importados",
+                            value=True
+                        )
                         confirmar = st.checkbox("✅ Confirmo que os dados estão corretos")
                         
                         if confirmar:
                             if st.button("💾 SALVAR DADOS NA PLANILHA", type="primary", use_container_width=True):
                                 with st.spinner("Salvando..."):
-                                    sucesso = salvar_dados_sheets(df_preparado)
+                                    # Relê o arquivo em lotes: nunca há mais de um lote em memória
+                                    lotes, resumo = processar_com_totais()
+                                    sucesso = salvar_dados_sheets(
+                                        lotes,
+                                        id_envio=id_envio,
+                                        total_linhas=linhas_estimadas,
+                                        remover_duplicados=remover_duplicados
+                                    )
+                                    # Upload já concluído antes: nada foi relido, mantém o resumo anterior
+                                    if resumo["linhas"] or resumo["descartadas"]:
+                                        st.session_state["resumo_upload"] = (id_envio, resumo)
                                     if sucesso:
                                         st.balloons()
                                         st.success("✅ Dados salvos com sucesso!")
-                                        st.info("💡 Clique em '🔄 Atualizar Dados' no sidebar após 1-2 minutos")
+                                        if not usar_motor_local():
+                                            st.info("💡 Clique em '🔄 Atualizar Dados' no sidebar após 1-2 minutos")
+                    
+                    # Totais do arquivo completo (da mesma passada que salvou)
+                    id_resumo, resumo = st.session_state.get("resumo_upload", (None, None))
+                    if id_resumo == id_envio:
+                        st.subheader("🧾 Totais do arquivo")
+                        ticket_medio = resumo['total_vendas'] / resumo['linhas'] if resumo['linhas'] > 0 else 0
+                        
+                        col_tot1, col_tot2, col_tot3, col_tot4 = st.columns(4)
+                        col_tot1.metric("📄 Linhas", f"{resumo['linhas']}")
+                        col_tot2.metric("💰 Total Vendas", format_currency_br(resumo['total_vendas']))
+                        col_tot3.metric("📦 Total Peças", f"{resumo['total_pecas']}")
+                        col_tot4.metric("🎯 Ticket Médio", format_currency_br(ticket_medio))
+                        if resumo["descartadas"]:
+                            st.warning(f"⚠️ {resumo['descartadas']} linhas sem produto foram ignoradas")
+                        if resumo["duplicados"]:
+                            st.warning(f"⚠️ {resumo['duplicados']} registros já existiam em 'Detalhes_Canais'")
+                        if resumo["sem_cadastro"]:
+                            st.warning(f"⚠️ {resumo['sem_cadastro']} linhas com produto fora de Produtos/Kits")
             
             except Exception as e:
                 st.error(f"❌ Erro ao processar arquivo: {str(e)}")
@@ -665,7 +3420,7 @@ def main():
     # ABA 2: DASHBOARD GERAL
     # ═══════════════════════════════════════════════════════════════════════════
     
-    with tabs[1]:
+    if visao == "📊 Dashboard Geral":
         st.header("📊 Dashboard Geral")
         
         # Carrega dados processados
@@ -730,16 +3485,8 @@ def main():
             # Tabela por canal
             st.subheader("📊 Dados por Canal")
             
-            # Formata DataFrame para exibição
-            df_display = df_dashboard.copy()
-            
-            if 'Total Venda' in df_display.columns:
-                df_display['Total Venda'] = df_display['Total Venda'].apply(format_currency_br)
-            if 'Lucro Bruto' in df_display.columns:
-                df_display['Lucro Bruto'] = df_display['Lucro Bruto'].apply(format_currency_br)
-            if 'Margem' in df_display.columns or 'Margem (%)' in df_display.columns:
-                col_margem = 'Margem (%)' if 'Margem (%)' in df_display.columns else 'Margem'
-                df_display[col_margem] = df_display[col_margem].apply(format_percent_br)
+            # Formata DataFrame para exibição (status da margem contra as metas)
+            df_display = formatar_tabela(df_dashboard, ['Total Venda', 'Lucro Bruto'], metas)
             
             st.dataframe(df_display, use_container_width=True)
             
@@ -749,12 +3496,22 @@ def main():
                 st.bar_chart(
                     df_dashboard.set_index('Canal')['Total Venda'] if 'Canal' in df_dashboard.columns else df_dashboard['Total Venda']
                 )
+        
+        # Tendência no tempo (lida do cubo materializado por dia / semana / mês)
+        cubo = carregar_cubo_vendas()
+        if not cubo.vazio:
+            st.subheader("📈 Tendência")
+            col_grao, col_medida, col_quebra = st.columns(3)
+            grao = col_grao.radio("Período", GRAOS_CUBO, index=2, horizontal=True, key="tendencia_grao")
+            medida = col_medida.selectbox("Métrica", MEDIDAS_CUBO, index=1, key="tendencia_medida")
+            quebra = col_quebra.selectbox("Quebrar por", ["Total", "Canal", "CNPJ"], key="tendencia_quebra")
+            st.line_chart(cubo.tendencia(grao, medida, None if quebra == "Total" else quebra, filtro_atual()))
     
     # ═══════════════════════════════════════════════════════════════════════════
     # ABA 3: POR CNPJ
     # ═══════════════════════════════════════════════════════════════════════════
     
-    with tabs[2]:
+    if visao == "🏢 Por CNPJ":
         st.header("🏢 Resultado por CNPJ")
         
         df_cnpj = carregar_resultado_cnpj()
@@ -762,25 +3519,17 @@ def main():
         if df_cnpj.empty:
             st.warning("⚠️ Nenhum dado encontrado na aba 'Resultado_CNPJ'")
         else:
-            # Formata para exibição
-            df_display = df_cnpj.copy()
-            
-            colunas_monetarias = ['Total Venda', 'Lucro Bruto', 'Custo Total', 'Impostos']
-            for col in colunas_monetarias:
-                if col in df_display.columns:
-                    df_display[col] = df_display[col].apply(format_currency_br)
-            
-            if 'Margem' in df_display.columns or 'Margem (%)' in df_display.columns:
-                col_margem = 'Margem (%)' if 'Margem (%)' in df_display.columns else 'Margem'
-                df_display[col_margem] = df_display[col_margem].apply(format_percent_br)
-            
-            st.dataframe(df_display, use_container_width=True)
+            tabela_paginada(
+                df_cnpj, "tabela_cnpj", versao_tabela("resultado_cnpj"),
+                ['Total Venda', 'Lucro Bruto', 'Custo Total', 'Impostos'], carregar_metas(),
+                coluna_ordem='Total Venda'
+            )
     
     # ═══════════════════════════════════════════════════════════════════════════
     # ABA 4: BCG POR CANAL
     # ═══════════════════════════════════════════════════════════════════════════
     
-    with tabs[3]:
+    if visao == "📈 BCG por Canal":
         st.header("📈 Matriz BCG por Canal")
         
         df_bcg = carregar_bcg_canal()
@@ -788,19 +3537,10 @@ def main():
         if df_bcg.empty:
             st.warning("⚠️ Nenhum dado encontrado na aba 'BCG_Canal_Mkt'")
         else:
-            # Formata para exibição
-            df_display = df_bcg.copy()
-            
-            colunas_monetarias = ['Total Venda', 'Lucro Bruto']
-            for col in colunas_monetarias:
-                if col in df_display.columns:
-                    df_display[col] = df_display[col].apply(format_currency_br)
-            
-            if 'Margem' in df_display.columns or 'Margem (%)' in df_display.columns:
-                col_margem = 'Margem (%)' if 'Margem (%)' in df_display.columns else 'Margem'
-                df_display[col_margem] = df_display[col_margem].apply(format_percent_br)
-            
-            st.dataframe(df_display, use_container_width=True)
+            tabela_paginada(
+                df_bcg, "tabela_bcg", versao_tabela("bcg_canal_mkt"),
+                ['Total Venda', 'Lucro Bruto', 'Venda Atual', 'Venda Anterior']
+            )
             
             # Se existir coluna de Classificação BCG, agrupa
             if 'Classificação' in df_bcg.columns or 'BCG' in df_bcg.columns:
@@ -809,13 +3549,14 @@ def main():
                 st.subheader("📊 Distribuição BCG")
                 
                 bcg_counts = df_bcg[col_bcg].value_counts()
-                st.bar_chart(bcg_counts)
+                ordem = ORDEM_BCG + [c for c in bcg_counts.index if c not in ORDEM_BCG]
+                st.bar_chart(bcg_counts.reindex(ordem, fill_value=0))
     
     # ═══════════════════════════════════════════════════════════════════════════
     # ABA 5: PREÇOS MKTP
     # ═══════════════════════════════════════════════════════════════════════════
     
-    with tabs[4]:
+    if visao == "💰 Preços MKTP":
         st.header("💰 Preços por Marketplace")
         
         df_precos = carregar_precos_mktp()
@@ -823,41 +3564,38 @@ def main():
         if df_precos.empty:
             st.warning("⚠️ Nenhum dado encontrado na aba 'Preço_Simples_MKTP'")
         else:
-            # Formata para exibição
-            df_display = df_precos.copy()
-            
-            colunas_monetarias = ['Preço', 'Valor', 'Custo']
-            for col in colunas_monetarias:
-                if col in df_display.columns:
-                    df_display[col] = df_display[col].apply(format_currency_br)
-            
-            st.dataframe(df_display, use_container_width=True)
+            tabela_paginada(df_precos, "tabela_precos", versao_tabela("preco_simples_mktp"), ['Preço', 'Valor', 'Custo'])
     
     # ═══════════════════════════════════════════════════════════════════════════
     # ABA 6: GIRO SKU
     # ═══════════════════════════════════════════════════════════════════════════
     
-    with tabs[5]:
+    if visao == "🔄 Giro SKU":
         st.header("🔄 Giro de Produtos (SKU)")
         
-        df_giro = carregar_vendas_sku()
+        explodir_kits = st.toggle(
+            "🧩 Contar kits pelos componentes",
+            key="giro_explodir_kits",
+            help="Cada venda de kit vira uma venda de cada componente (aba Kits)"
+        )
+        df_giro = carregar_vendas_sku(explodir_kits)
         
         if df_giro.empty:
             st.warning("⚠️ Nenhum dado encontrado na aba 'Vendas_sku_geral'")
         else:
-            # Ordena por quantidade vendida
+            # Maiores quantidades vendidas (seleção parcial, sem ordenar tudo)
             if 'Quantidade' in df_giro.columns:
-                df_giro = df_giro.sort_values('Quantidade', ascending=False)
+                df_giro = df_giro.nlargest(20, 'Quantidade')
             
             # Top 20
             st.subheader("🏆 Top 20 Produtos Mais Vendidos")
-            df_top20 = df_giro.head(20).copy()
+            df_top20 = df_giro.head(20)
             
             # Formata para exibição
             colunas_monetarias = ['Total Venda', 'Lucro Bruto']
             for col in colunas_monetarias:
                 if col in df_top20.columns:
-                    df_top20[col] = df_top20[col].apply(format_currency_br)
+                    df_top20[col] = format_currency_series(df_top20[col])
             
             st.dataframe(df_top20, use_container_width=True)
             
@@ -869,7 +3607,7 @@ def main():
     # ABA 7: OPORTUNIDADES
     # ═══════════════════════════════════════════════════════════════════════════
     
-    with tabs[6]:
+    if visao == "💡 Oportunidades":
         st.header("💡 Oportunidades de Melhoria")
         
         df_oportunidades = carregar_oportunidades()
@@ -879,19 +3617,22 @@ def main():
         else:
             st.info("💡 Produtos com classificação 'Interrogação ❓' são oportunidades para promoção")
             
-            # Formata para exibição
-            df_display = df_oportunidades.copy()
-            
-            colunas_monetarias = ['Total Venda', 'Lucro Bruto', 'Preço']
-            for col in colunas_monetarias:
-                if col in df_display.columns:
-                    df_display[col] = df_display[col].apply(format_currency_br)
-            
-            if 'Margem' in df_display.columns or 'Margem (%)' in df_display.columns:
-                col_margem = 'Margem (%)' if 'Margem (%)' in df_display.columns else 'Margem'
-                df_display[col_margem] = df_display[col_margem].apply(format_percent_br)
-            
-            st.dataframe(df_display, use_container_width=True)
+            tabela_paginada(
+                df_oportunidades, "tabela_oportunidades", versao_tabela("oportunidades_canais_mkt"),
+                ['Total Venda', 'Lucro Bruto', 'Preço', 'Venda Atual', 'Venda Anterior'], carregar_metas()
+            )
+    
+    fechar_span(span_visao)
+    fechar_span(span_rerun)
+    
+    if st.session_state.get("debug_spans"):
+        with painel_spans.container():
+            spans = st.session_state.get("_spans", [])
+            st.caption(f"⏱️ Rerun em {span_rerun['segundos'] * 1000:.0f} ms · {len(spans)} spans")
+            st.dataframe(tabela_spans(spans), hide_index=True, use_container_width=True)
+            caminho_log = _caminho_log_spans()
+            if caminho_log is not None:
+                st.caption(f"📝 Log: {caminho_log}")
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # EXECUÇÃO
@@ -904,3 +3645,5 @@ if __name__ == "__main__":
 ═══════════════════════════════════════════════════════════════════════════════
     ✅ CÓDIGO V55 COMPLETO - PRONTO PARA USAR!
 ═══════════════════════════════════════════════════════════════════════════════
+
+"""
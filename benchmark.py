@@ -0,0 +1,446 @@
+"""
+═══════════════════════════════════════════════════════════════════════════════
+    SALES BI PRO - BENCHMARK OFFLINE
+═══════════════════════════════════════════════════════════════════════════════
+
+Mede as etapas do app sem acessar o Google:
+   1. Gera Detalhes_Canais sintético (1k / 100k / 1M linhas) a partir dos
+      produtos de exemplo_vendas.csv, mais as abas de referência
+   2. Sobe um servidor HTTP local que imita o export CSV das abas e recebe
+      os append_rows de uma aba falsa (mesmo payload JSON do gspread)
+   3. Reporta tempo e pico de memória de carga, limpeza, agregação,
+      formatação e escrita
+
+Uso:
+   python benchmark.py                              # 1k, 100k e 1M linhas
+   python benchmark.py --linhas 1000 100000 --json atual.json
+   python benchmark.py --base atual.json            # aponta regressões (saída 1)
+
+═══════════════════════════════════════════════════════════════════════════════
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+import requests
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 1. CONFIGURAÇÕES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+TAMANHOS_PADRAO = [1_000, 100_000, 1_000_000]
+SEMENTE = 42
+ARQUIVO_SEMENTE = Path(__file__).with_name("exemplo_vendas.csv")
+TOLERANCIA_REGRESSAO = 0.20     # etapa 20% mais lenta que a base = regressão
+INTERVALO_AMOSTRA_RSS = 0.002   # segundos entre leituras do RSS
+
+CORES_EXTRAS = ["Preto", "Amarelo", "Lilás", "Cinza"]
+TAMANHOS_EXTRAS = ["GG"]
+CNPJS = ["Simples Nacional", "Lucro Presumido", "MEI"]
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 2. DADOS SINTÉTICOS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def catalogo_semente(caminho=ARQUIVO_SEMENTE):
+    """
+    Produtos do arquivo de exemplo + combinações de modelo x cor x tamanho
+    ("Body Branco RN" -> modelo Body, cor Branco, tamanho RN)
+    """
+    produtos = pd.read_csv(caminho)["Produto"].dropna().astype(str).str.strip().unique().tolist()
+    partes = [p.split() for p in produtos if len(p.split()) >= 3]
+    modelos = sorted({p[0] for p in partes}) or ["Produto"]
+    cores = sorted({" ".join(p[1:-1]) for p in partes}) + CORES_EXTRAS
+    tamanhos = sorted({p[-1] for p in partes}) + TAMANHOS_EXTRAS
+    catalogo = [f"{m} {c} {t}" for m in modelos for c in cores for t in tamanhos]
+    return list(dict.fromkeys(produtos + catalogo))
+
+def _kits(catalogo):
+    """Um kit trio por tamanho: três cores do mesmo tamanho"""
+    kits = []
+    for tamanho in sorted({p.split()[-1] for p in catalogo}):
+        componentes = [p for p in catalogo if p.split()[-1] == tamanho][:3]
+        if len(componentes) == 3:
+            kits.append((f"Kit Trio {tamanho}", componentes))
+    return kits
+
+def gerar_referencias(app, catalogo):
+    """Abas de referência no formato da planilha (nome da aba -> DataFrame)"""
+    rng = np.random.default_rng(SEMENTE)
+    canais = [nome for chave, nome in app.CHANNELS.items() if chave != "geral"]
+    custos = rng.uniform(12, 35, len(catalogo)).round(2)
+    brl = lambda valores: app.format_currency_series(pd.Series(valores)).astype(str).to_numpy()
+    kits = _kits(catalogo)
+
+    return {
+        "produtos": pd.DataFrame({
+            "SKU": [p.lower().replace(" ", "-") for p in catalogo],
+            "Produto": catalogo,
+            "Custo": brl(custos),
+        }),
+        "kits": pd.DataFrame(
+            [(kit, componente, 1) for kit, componentes in kits for componente in componentes],
+            columns=["Kit", "Componente", "Quantidade"],
+        ),
+        "custos": pd.DataFrame({"Canal": canais, "Custo por pedido": brl(np.full(len(canais), 1.5))}),
+        "canais": pd.DataFrame({
+            "Canal": canais,
+            "Comissão (%)": app.format_percent_series(pd.Series(np.linspace(0.12, 0.18, len(canais)))).astype(str).to_numpy(),
+            "Taxa Fixa": brl(np.full(len(canais), 5.0)),
+        }),
+        "impostos": pd.DataFrame({"CNPJ": CNPJS, "Alíquota (%)": ["6%", "11,33%", "0%"]}),
+        "frete": pd.DataFrame({"Canal": canais, "Frete": brl(np.zeros(len(canais)))}),
+        "metas": pd.DataFrame({
+            "Margem Mínima": ["15%"], "Margem Ideal": ["25%"],
+            "Ticket Mínimo": ["R$ 40,00"], "Ticket Ideal": ["R$ 60,00"],
+        }),
+    }
+
+def gerar_detalhes(app, n, catalogo):
+    """
+    Detalhes_Canais com n linhas, como sai do export CSV (valores em texto BR)
+    Produtos seguem uma distribuição de cauda longa; kits entram em ~5% das vendas
+    """
+    rng = np.random.default_rng([SEMENTE, n])
+    canais = np.array([nome for chave, nome in app.CHANNELS.items() if chave != "geral"], dtype=object)
+    produtos = np.array(catalogo + [kit for kit, _ in _kits(catalogo)], dtype=object)
+    pesos = 1.0 / np.arange(1, len(produtos) + 1)
+    pesos /= pesos.sum()
+    precos = rng.uniform(39.9, 89.9, len(produtos)).round(2)
+
+    produto = rng.choice(len(produtos), n, p=pesos)
+    quantidade = rng.integers(1, 21, n)
+    venda = (quantidade * precos[produto]).round(2)
+    custo_total = (venda * rng.uniform(0.55, 1.05, n)).round(2)
+    lucro = venda - custo_total
+    dias = np.datetime64("2025-01-01") + rng.integers(0, 365, n).astype("timedelta64[D]")
+    brl = app.format_currency_series
+
+    return pd.DataFrame({
+        "Data": np.datetime_as_string(dias, unit="D"),
+        "Canal": canais[rng.integers(0, len(canais), n)],
+        "CNPJ": np.array(CNPJS, dtype=object)[rng.integers(0, len(CNPJS), n)],
+        "Produto": produtos[produto],
+        "Tipo": "Venda",
+        "Quantidade": quantidade,
+        "Total Venda": brl(pd.Series(venda)),
+        "Custo Produto": brl(pd.Series((custo_total * 0.5).round(2))),
+        "Impostos": brl(pd.Series((venda * 0.06).round(2))),
+        "Comissão": brl(pd.Series((venda * 0.14).round(2))),
+        "Taxas Fixas": brl(pd.Series(np.full(n, 5.0))),
+        "Embalagem": brl(pd.Series(np.full(n, 1.5))),
+        "Investimento Ads": brl(pd.Series(np.zeros(n))),
+        "Custo Total": brl(pd.Series(custo_total)),
+        "Lucro Bruto": brl(pd.Series(lucro)),
+        "Margem (%)": app.format_percent_series(pd.Series(lucro / venda)),
+    })[app.COLUNAS_ESPERADAS]
+
+def gerar_upload(app, n, catalogo):
+    """Planilha de upload já mapeada (Produto / Quantidade / Total Venda em texto)"""
+    rng = np.random.default_rng([SEMENTE, n, 1])
+    quantidade = rng.integers(1, 21, n)
+    return pd.DataFrame({
+        "Produto": np.array(catalogo, dtype=object)[rng.integers(0, len(catalogo), n)],
+        "Quantidade": quantidade.astype(str),
+        "Total Venda": app.format_currency_series(pd.Series((quantidade * rng.uniform(39.9, 89.9, n)).round(2))),
+    })
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 3. SERVIDOR LOCAL (export CSV + aba para append)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ServidorPlanilha:
+    """
+    Imita a planilha em 127.0.0.1 (porta livre)
+    - GET /export?format=csv&gid=<gid>: CSV da aba, com ETag e 304
+    - POST /append: corpo {"values": [[...], ...]} como o append_rows do gspread
+    """
+
+    def __init__(self):
+        self.abas = {}             # gid -> bytes do CSV
+        self.linhas_anexadas = 0
+        self.requisicoes_append = 0
+        self._lock = threading.Lock()
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._servidor.daemon_threads = True
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+
+    @property
+    def url_base(self):
+        return f"http://127.0.0.1:{self._servidor.server_port}/export?format=csv&gid="
+
+    @property
+    def url_append(self):
+        return f"http://127.0.0.1:{self._servidor.server_port}/append"
+
+    def publicar(self, gid, df):
+        """Troca o conteúdo de uma aba (nova ETag)"""
+        with self._lock:
+            self.abas[gid] = df.to_csv(index=False).encode("utf-8")
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                gid = parse_qs(urlparse(self.path).query).get("gid", [""])[0]
+                with servidor._lock:
+                    conteudo = servidor.abas.get(gid)
+                if conteudo is None:
+                    return self._responder(404)
+                etag = '"' + hashlib.md5(conteudo).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._responder(304, cabecalhos={"ETag": etag})
+                self._responder(200, conteudo, {"Content-Type": "text/csv; charset=utf-8", "ETag": etag})
+
+            def do_POST(self):
+                corpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                linhas = json.loads(corpo)["values"]
+                with servidor._lock:
+                    servidor.linhas_anexadas += len(linhas)
+                    servidor.requisicoes_append += 1
+                self._responder(200, b"{}", {"Content-Type": "application/json"})
+
+            def _responder(self, status, corpo=b"", cabecalhos=None):
+                self.send_response(status)
+                for chave, valor in (cabecalhos or {}).items():
+                    self.send_header(chave, valor)
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+class AbaFalsa:
+    """Substituta de gspread.Worksheet para salvar_dados_sheets: cada append_rows vira um POST"""
+
+    def __init__(self, url_append, cabecalho):
+        self.url_append = url_append
+        self.cabecalho = list(cabecalho)
+        self._sessao = requests.Session()
+
+    def row_values(self, linha):
+        return list(self.cabecalho) if linha == 1 else []
+
+    def append_row(self, valores):
+        self.append_rows([valores])
+
+    def append_rows(self, valores):
+        resposta = self._sessao.post(
+            self.url_append, data=json.dumps({"values": valores}),
+            headers={"Content-Type": "application/json"}, timeout=60
+        )
+        resposta.raise_for_status()
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 4. MEDIÇÃO (tempo + pico de memória)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _rss_bytes():
+    """RSS atual do processo (Linux: /proc/self/statm); None se indisponível"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def medir(funcao):
+    """
+    Executa funcao() e retorna (resultado, segundos, pico de memória em MB)
+    O pico é o maior RSS amostrado durante a etapa menos o RSS no início
+    (inclui buffers Arrow/NumPy, que o tracemalloc não vê por inteiro)
+    """
+    inicial = _rss_bytes()
+    pico = [inicial or 0]
+    parar = threading.Event()
+
+    def amostrar():
+        while not parar.wait(INTERVALO_AMOSTRA_RSS):
+            atual = _rss_bytes()
+            if atual and atual > pico[0]:
+                pico[0] = atual
+
+    amostrador = threading.Thread(target=amostrar, daemon=True) if inicial is not None else None
+    if amostrador:
+        amostrador.start()
+    inicio = time.perf_counter()
+    try:
+        resultado = funcao()
+    finally:
+        segundos = time.perf_counter() - inicio
+        parar.set()
+        if amostrador:
+            amostrador.join()
+    final = _rss_bytes()
+    if inicial is None:
+        return resultado, segundos, None
+    return resultado, segundos, (max(pico[0], final or 0) - inicial) / 2**20
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 5. ETAPAS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _reiniciar_app(app, diretorio):
+    """Cache em disco vazio e singletons recriados (cada tamanho começa a frio)"""
+    shutil.rmtree(diretorio, ignore_errors=True)
+    app.DIR_CACHE_DISCO = str(diretorio)
+    for singleton in (app.get_cache_abas, app._indice_dedup, app._indice_referencias, app.get_motor_local):
+        singleton.clear()
+
+def executar_tamanho(app, servidor, n, catalogo, referencias, diretorio):
+    """Roda as etapas para n linhas; retorna a lista de medições"""
+    gid_detalhes = app.ABAS["detalhes_canais"]["gid"]
+    servidor.publicar(gid_detalhes, gerar_detalhes(app, n, catalogo))
+    upload = gerar_upload(app, n, catalogo)
+    _reiniciar_app(app, diretorio)
+    url = app.ABAS_URLS["detalhes_canais"]
+    medicoes = []
+
+    def registrar(etapa, funcao, linhas=n):
+        resultado, segundos, pico_mb = medir(funcao)
+        medicoes.append({"linhas": n, "etapa": etapa, "segundos": segundos, "pico_mb": pico_mb,
+                         "linhas_por_segundo": linhas / segundos if segundos > 0 else None})
+        return resultado
+
+    # Carga: download + parse + limpeza + tipos + Parquet; depois revalidação (304)
+    detalhes = registrar("carga", lambda: app._baixar_aba("detalhes_canais", url))
+    registrar("carga_304", lambda: app._baixar_aba("detalhes_canais", url))
+
+    # Limpeza do upload (com consulta ao índice de duplicados já montado)
+    app.get_indice_dedup()
+    preparado = registrar("limpeza", lambda: app.preparar_dados_para_salvar(
+        upload, "mercado_livre", "Simples Nacional", "2025-12-31", mostrar_status=False
+    ))
+
+    # Agregação: enriquecimento pelas referências + somas por canal / CNPJ / SKU
+    indice = app.IndiceReferencias(referencias)
+
+    def agregar():
+        vendas = app.calcular_metricas_vendas(detalhes, indice)
+        return vendas, [app.agregar_metricas(vendas, chave) for chave in ("Canal", "CNPJ", "Produto")]
+    vendas, _ = registrar("agregacao", agregar)
+
+    # Formatação das linhas para exibição (todas as colunas monetárias + status da margem)
+    registrar("formatacao", lambda: app.formatar_tabela(
+        vendas, [c for c in app.COLUNAS_METRICAS if c != "Quantidade"], app.METAS
+    ))
+
+    # Escrita: append em lotes na aba falsa (POST no servidor local)
+    antes = servidor.linhas_anexadas
+    aba = AbaFalsa(servidor.url_append, app.COLUNAS_ESPERADAS)
+    sucesso = registrar("escrita", lambda: app.salvar_dados_sheets(preparado, remover_duplicados=False, worksheet=aba))
+    if not sucesso or servidor.linhas_anexadas - antes != len(preparado):
+        raise RuntimeError(f"escrita incompleta: {servidor.linhas_anexadas - antes} de {len(preparado)} linhas")
+    return medicoes
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 6. RELATÓRIO
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def imprimir_relatorio(medicoes, base=None):
+    """Tabela por tamanho x etapa (com variação contra a base, se houver)"""
+    referencia = {(m["linhas"], m["etapa"]): m for m in (base or [])}
+    print(f"\n{'linhas':>10}  {'etapa':<11} {'segundos':>9} {'linhas/s':>12} {'pico MB':>9}  {'vs base':>8}")
+    print("─" * 68)
+    for m in medicoes:
+        pico = f"{m['pico_mb']:.1f}" if m["pico_mb"] is not None else "-"
+        taxa = f"{m['linhas_por_segundo']:,.0f}" if m["linhas_por_segundo"] else "-"
+        anterior = referencia.get((m["linhas"], m["etapa"]))
+        variacao = f"{m['segundos'] / anterior['segundos'] - 1:+.0%}" if anterior and anterior["segundos"] > 0 else ""
+        print(f"{m['linhas']:>10,}  {m['etapa']:<11} {m['segundos']:>9.3f} {taxa:>12} {pico:>9}  {variacao:>8}")
+
+def regressoes(medicoes, base, tolerancia=TOLERANCIA_REGRESSAO):
+    """Etapas mais lentas que a base além da tolerância"""
+    referencia = {(m["linhas"], m["etapa"]): m for m in base}
+    return [
+        m for m in medicoes
+        if (m["linhas"], m["etapa"]) in referencia
+        and m["segundos"] > referencia[(m["linhas"], m["etapa"])]["segundos"] * (1 + tolerancia)
+    ]
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 7. EXECUÇÃO
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do Sales BI (sem Google)")
+    parser.add_argument("--linhas", type=int, nargs="+", default=TAMANHOS_PADRAO, help="tamanhos de Detalhes_Canais")
+    parser.add_argument("--json", help="grava as medições neste arquivo")
+    parser.add_argument("--base", help="medições anteriores (--json) para comparar")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_REGRESSAO, help="folga antes de acusar regressão")
+    args = parser.parse_args(argv)
+
+    servidor = ServidorPlanilha().iniciar()
+    diretorio = Path(tempfile.mkdtemp(prefix="sales_bi_bench_"))
+
+    # O app lê BASE_URL ao ser importado: o servidor local precisa existir antes
+    os.environ["SALES_BI_BASE_URL"] = servidor.url_base
+    os.environ["SALES_BI_CACHE_DIR"] = str(diretorio / "cache")
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    app = importlib.import_module("app")
+
+    try:
+        catalogo = catalogo_semente()
+        referencias = gerar_referencias(app, catalogo)
+        for nome, df in referencias.items():
+            servidor.publicar(app.ABAS[nome]["gid"], df)
+        referencias = {nome: app.limpar_dados_aba(df) for nome, df in referencias.items()}
+
+        medicoes = []
+        for n in args.linhas:
+            print(f"⏱️  {n:,} linhas...", flush=True)
+            medicoes += executar_tamanho(app, servidor, n, catalogo, referencias, diretorio / "cache")
+    finally:
+        servidor.parar()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))["medicoes"] if args.base else None
+    imprimir_relatorio(medicoes, base)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "gerado_em": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "medicoes": medicoes,
+        }, indent=2), encoding="utf-8")
+        print(f"\n💾 Medições gravadas em {args.json}")
+
+    if base:
+        lentas = regressoes(medicoes, base, args.tolerancia)
+        for m in lentas:
+            print(f"❌ Regressão: {m['etapa']} com {m['linhas']:,} linhas")
+        return 1 if lentas else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Planilha falsa em memória para os testes de gravação, cache e deduplicação
+- AbaFalsa: substituta de gspread.Worksheet (linhas em texto, falhas programadas)
+- SessaoFalsa: o export CSV das abas, com ETag e 304 como o Google
+- Fixture `planilha`: app isolado (cache em tmp, singletons novos, sem espera de backoff)
+"""
+import csv
+import hashlib
+import io
+import re
+import sys
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import app  # noqa: E402
+
+SINGLETONS = [
+    "get_cache_abas", "_indice_dedup", "_indice_referencias", "get_motor_local",
+    "_indices_consulta", "_cubo_planilha", "_indices_tabelas",
+]
+
+class AbaFalsa:
+    """
+    Worksheet em memória (RAW: cada célula fica como o texto enviado)
+    `falhas`: [(momento, erro)] consumidas uma por append_rows
+    - "antes": levanta sem gravar; "depois": grava e levanta; None: grava normalmente
+    """
+
+    def __init__(self, cabecalho=None, nome="Detalhes_Canais", informa_faixa=True):
+        self.nome = nome
+        self.linhas = [list(cabecalho)] if cabecalho else []
+        self.informa_faixa = informa_faixa
+        self.falhas = []
+        self.appends = 0
+        self.leituras = 0
+
+    def row_values(self, numero):
+        return list(self.linhas[numero - 1]) if numero <= len(self.linhas) else []
+
+    def append_row(self, valores):
+        return self.append_rows([valores])
+
+    def append_rows(self, valores):
+        self.appends += 1
+        momento, erro = self.falhas.pop(0) if self.falhas else (None, None)
+        if momento == "antes":
+            raise erro
+        inicio = len(self.linhas) + 1
+        self.linhas.extend([str(celula) for celula in linha] for linha in valores)
+        if momento == "depois":
+            raise erro
+        if not self.informa_faixa:
+            return {}
+        return {"updates": {"updatedRange": f"'{self.nome}'!A{inicio}:P{len(self.linhas)}"}}
+
+    def get_values(self, faixa):
+        self.leituras += 1
+        inicio, fim = (int(n) for n in re.findall(r"\d+", faixa))
+        return [list(linha) for linha in self.linhas[inicio - 1:fim]]
+
+    def col_values(self, coluna):
+        self.leituras += 1
+        valores = [linha[coluna - 1] if len(linha) >= coluna else "" for linha in self.linhas]
+        while valores and valores[-1] == "":
+            valores.pop()
+        return valores
+
+    @property
+    def dados(self):
+        """Linhas abaixo do cabeçalho"""
+        return self.linhas[1:]
+
+    def csv(self):
+        """Export CSV da aba (texto das células, como o Google devolve)"""
+        saida = io.StringIO()
+        csv.writer(saida, lineterminator="\n").writerows(self.linhas)
+        return saida.getvalue().encode("utf-8")
+
+class SessaoFalsa:
+    """Substituta de get_sessao_http: serve o CSV de cada gid com ETag / 304"""
+
+    def __init__(self, etag=True):
+        self.etag = etag        # False: servidor sem ETag (sempre 200)
+        self.abas = {}          # gid -> AbaFalsa ou bytes do CSV
+        self.requisicoes = []   # (gid, status)
+
+    def publicar(self, nome_aba, conteudo):
+        self.abas[app.ABAS[nome_aba]["gid"]] = conteudo
+
+    def get(self, url, headers=None, timeout=None):
+        gid = parse_qs(urlparse(url).query).get("gid", [""])[0]
+        resposta = requests.Response()
+        resposta.url = url
+        conteudo = self.abas.get(gid)
+        if conteudo is None:
+            resposta.status_code = 404
+            resposta._content = b""
+        else:
+            conteudo = conteudo.csv() if isinstance(conteudo, AbaFalsa) else conteudo
+            etag = '"' + hashlib.md5(conteudo).hexdigest() + '"'
+            if self.etag:
+                resposta.headers["ETag"] = etag
+            if self.etag and (headers or {}).get("If-None-Match") == etag:
+                resposta.status_code = 304
+                resposta._content = b""
+            else:
+                resposta.status_code = 200
+                resposta._content = conteudo
+        self.requisicoes.append((gid, resposta.status_code))
+        return resposta
+
+def _limpar_singletons():
+    for nome in SINGLETONS:
+        getattr(app, nome).clear()
+
+@pytest.fixture
+def planilha(tmp_path, monkeypatch):
+    """SessaoFalsa no lugar do Google, cache em disco em tmp e singletons recriados"""
+    sessao = SessaoFalsa()
+    monkeypatch.setattr(app, "DIR_CACHE_DISCO", str(tmp_path / "cache"))
+    monkeypatch.setattr(app, "get_sessao_http", lambda: sessao)
+    monkeypatch.setattr(app.time, "sleep", lambda segundos: None)
+    _limpar_singletons()
+    yield sessao
+    # Downloads agendados em segundo plano terminam antes de desfazer os monkeypatch
+    app.get_cache_abas()._executor.shutdown(wait=True)
+    _limpar_singletons()
+
+def aguardar_downloads():
+    """Espera os downloads em segundo plano do cache de abas"""
+    cache = app.get_cache_abas()
+    while True:
+        with cache._lock:
+            futuros = list(cache._em_andamento.values())
+        if not futuros:
+            return
+        for futuro in futuros:
+            try:
+                futuro.result()
+            except Exception:
+                pass
@@ -0,0 +1,99 @@
+"""
+Matriz BCG calculada no app (classificar_bcg)
+- Quadrantes por crescimento (mês atual x anterior) e participação relativa
+  (venda / maior concorrente no canal; o líder se compara com o segundo)
+- Mesmo resultado de uma versão célula a célula em dados aleatórios
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import app
+
+VACA, ESTRELA, INTERROGACAO, ABACAXI = app.ORDEM_BCG
+
+def _vendas(linhas):
+    return pd.DataFrame(linhas, columns=["Data", "Canal", "Produto", "Total Venda", "Lucro Bruto"])
+
+def _por_par(resultado):
+    return {(c, p): q for c, p, q in zip(resultado["Canal"], resultado["Produto"], resultado["Classificação"])}
+
+def test_quadrantes():
+    vendas = _vendas([
+        ("2025-05-10", "A", "X", 100.0, 30.0), ("2025-04-10", "A", "X", 100.0, 30.0),
+        ("2025-05-11", "A", "Y", 80.0, 10.0), ("2025-04-11", "A", "Y", 50.0, 5.0),
+        ("2025-05-12", "A", "Z", 10.0, 1.0), ("2025-04-12", "A", "Z", 20.0, 2.0),
+        ("2025-05-13", "A", "W", 30.0, 3.0),
+        ("2025-05-14", "B", "X", 5.0, 1.0),
+        ("2025-03-01", "A", "Z", 9999.0, 0.0),   # fora do período
+        ("sem data", "A", "Z", 9999.0, 0.0),
+    ])
+    resultado = app.classificar_bcg(vendas)
+
+    assert _por_par(resultado) == {
+        ("A", "X"): VACA, ("A", "Y"): ESTRELA, ("A", "Z"): ABACAXI,
+        ("A", "W"): INTERROGACAO, ("B", "X"): ESTRELA,
+    }
+    x = resultado.set_index(["Canal", "Produto"]).loc[("A", "X")]
+    assert x["Participação Relativa"] == pytest.approx(100 / 80)
+    assert x["Crescimento"] == 0.0
+    assert x["Margem (%)"] == pytest.approx(0.3)
+    assert resultado.set_index(["Canal", "Produto"]).loc[("A", "Z"), "Venda Anterior"] == 20.0
+
+def test_ordenado_por_quadrante_e_venda():
+    vendas = _vendas([
+        ("2025-05-01", "A", f"P{i}", float(v), 0.0) for i, v in enumerate([5, 50, 20, 100, 1])
+    ])
+    resultado = app.classificar_bcg(vendas)
+    codigos = resultado["Classificação"].cat.codes.to_numpy()
+    assert (np.diff(codigos) >= 0).all()
+    for _, grupo in resultado.groupby("Classificação", observed=True):
+        assert grupo["Venda Atual"].is_monotonic_decreasing
+
+@pytest.mark.parametrize("vendas", [
+    pd.DataFrame(),
+    _vendas([]),
+    pd.DataFrame({"Canal": ["A"], "Produto": ["X"], "Total Venda": [1.0]}),
+    _vendas([("sem data", "A", "X", 1.0, 0.0)]),
+], ids=["vazio", "sem_linhas", "sem_data", "datas_invalidas"])
+def test_sem_dados_validos(vendas):
+    resultado = app.classificar_bcg(vendas)
+    assert resultado.empty
+    assert "Classificação" in resultado.columns
+
+def _referencia(vendas):
+    """Classificação par a par, com laços (mesmas regras do docstring)"""
+    meses = pd.to_datetime(vendas["Data"]).dt.to_period("M")
+    atual, anterior = meses.max(), meses.max() - 1
+    somas = {}
+    for mes, canal, produto, venda in zip(meses, vendas["Canal"], vendas["Produto"], vendas["Total Venda"]):
+        if mes in (atual, anterior):
+            par = somas.setdefault((canal, produto), [0.0, 0.0])
+            par[0 if mes == atual else 1] += venda
+    classes = {}
+    for (canal, produto), (venda_atual, venda_anterior) in somas.items():
+        outros = [v[0] for (c, p), v in somas.items() if c == canal and p != produto]
+        concorrente = max(outros, default=0.0)
+        crescimento = (venda_atual / venda_anterior - 1 if venda_anterior > 0
+                       else (np.inf if venda_atual > 0 else 0.0))
+        participacao = (venda_atual / concorrente if concorrente > 0
+                        else (np.inf if venda_atual > 0 else 0.0))
+        alta_part = participacao >= app.LIMIAR_PARTICIPACAO_BCG
+        alto_cresc = crescimento >= app.LIMIAR_CRESCIMENTO_BCG
+        classes[(canal, produto)] = (VACA if alta_part and not alto_cresc else ESTRELA if alta_part
+                                     else INTERROGACAO if alto_cresc else ABACAXI)
+    return classes
+
+@pytest.mark.parametrize("semente", range(5))
+def test_igual_a_referencia(semente):
+    rng = np.random.default_rng(semente)
+    n = 400
+    dias = np.datetime64("2025-01-01") + rng.integers(0, 120, n).astype("timedelta64[D]")
+    vendas = pd.DataFrame({
+        "Data": np.datetime_as_string(dias, unit="D"),
+        "Canal": rng.choice(["A", "B", "C"], n),
+        "Produto": rng.choice([f"SKU{i}" for i in range(12)], n),
+        "Total Venda": rng.integers(0, 200, n).astype(float),
+        "Lucro Bruto": rng.normal(10, 5, n),
+    })
+    assert _por_par(app.classificar_bcg(vendas)) == _referencia(vendas)
@@ -0,0 +1,199 @@
+"""
+Cache de abas em memória (CacheAbas)
+- Primeira carga sem cópia bloqueia; depois a aba expirada é servida
+  enquanto uma thread refaz o download (stale-while-revalidate)
+- Início a frio serve a cópia do disco e revalida em segundo plano
+- Erro no download mantém a última versão boa
+- Invalidação seletiva e um download por aba de cada vez
+"""
+import threading
+
+import pandas as pd
+import pytest
+
+from conftest import app
+
+class Downloads:
+    """_baixar_aba controlável: versão crescente por aba, pausa e falha sob demanda"""
+
+    def __init__(self):
+        self.chamadas = []
+        self.liberar = threading.Event()
+        self.liberar.set()
+        self.falhar = False
+
+    def __call__(self, nome_aba, url):
+        self.chamadas.append(nome_aba)
+        assert self.liberar.wait(10)
+        if self.falhar:
+            raise RuntimeError("download falhou")
+        return pd.DataFrame({"versao": [self.chamadas.count(nome_aba)]})
+
+@pytest.fixture
+def downloads(planilha, monkeypatch):
+    falso = Downloads()
+    monkeypatch.setattr(app, "_baixar_aba", falso)
+    return falso
+
+def _esperar(cache):
+    for futuro in list(cache._em_andamento.values()):
+        try:
+            futuro.result(10)
+        except Exception:
+            pass
+
+def _versao(df):
+    return int(df["versao"].iloc[0])
+
+def test_primeira_carga_bloqueia_e_depois_serve_da_memoria(downloads):
+    cache = app.CacheAbas(ttl=60)
+    df, erro = cache.obter("produtos")
+    assert (_versao(df), erro) == (1, None)
+
+    df, _ = cache.obter("produtos")
+    assert _versao(df) == 1
+    assert downloads.chamadas == ["produtos"]
+    assert cache.estatisticas()["acertos"] == 1
+
+def test_expirada_e_servida_enquanto_revalida(downloads):
+    cache = app.CacheAbas(ttl=60)
+    cache.obter("produtos")
+    versao = cache.versao("produtos")
+    cache._entradas["produtos"]["carregado_em"] -= 120  # passou do TTL
+
+    downloads.liberar.clear()
+    df, _ = cache.obter("produtos")
+    assert _versao(df) == 1  # não esperou o download
+    assert cache.atualizando() == ["produtos"]
+
+    downloads.liberar.set()
+    _esperar(cache)
+    df, _ = cache.obter("produtos")
+    assert _versao(df) == 2
+    assert cache.versao("produtos") > versao
+
+def test_um_download_por_aba_de_cada_vez(downloads):
+    cache = app.CacheAbas(ttl=60)
+    cache.obter("produtos")
+    cache._entradas["produtos"]["carregado_em"] -= 120
+    downloads.liberar.clear()
+    for _ in range(5):
+        cache.obter("produtos")
+    downloads.liberar.set()
+    _esperar(cache)
+    assert downloads.chamadas == ["produtos", "produtos"]
+
+def test_inicio_a_frio_serve_o_disco_e_revalida(downloads):
+    gid = app.ABAS["kits"]["gid"]
+    app._salvar_cache_disco(gid, pd.DataFrame({"versao": [0]}), {"sha256": "x", "memoria": [1, 1]})
+    cache = app.CacheAbas(ttl=60)
+
+    downloads.liberar.clear()
+    df, _ = cache.obter("kits")
+    assert _versao(df) == 0
+    assert cache.versao("kits") == 0.0
+
+    downloads.liberar.set()
+    _esperar(cache)
+    assert _versao(cache.obter("kits")[0]) == 1
+
+def test_erro_mantem_a_ultima_versao_boa(downloads):
+    cache = app.CacheAbas(ttl=60)
+    cache.obter("produtos")
+    downloads.falhar = True
+    cache.invalidar(["produtos"])
+    _esperar(cache)
+
+    df, erro = cache.obter("produtos")
+    assert _versao(df) == 1
+    assert erro == "download falhou"
+
+def test_erro_sem_versao_anterior_devolve_vazio(downloads):
+    downloads.falhar = True
+    cache = app.CacheAbas(ttl=60)
+    df, erro = cache.obter("produtos")
+    assert df.empty and erro == "download falhou"
+    # Não tenta de novo a cada acesso dentro do TTL
+    cache.obter("produtos")
+    assert downloads.chamadas == ["produtos"]
+
+def test_invalidar_so_as_abas_escolhidas(downloads):
+    cache = app.CacheAbas(ttl=60)
+    cache.obter("produtos")
+    cache.obter("kits")
+    downloads.liberar.clear()
+
+    cache.invalidar(["kits"])
+    assert cache.versao("kits") == 0.0
+    assert cache.versao("produtos") > 0
+    assert cache.atualizando() == ["kits"]
+    assert _versao(cache.obter("kits")[0]) == 1  # versão antiga até a nova chegar
+
+    downloads.liberar.set()
+    _esperar(cache)
+    assert downloads.chamadas == ["produtos", "kits", "kits"]
+    assert _versao(cache.obter("kits")[0]) == 2
+
+# ───────────────────────────────────────────────────────────────────────────────
+# Orçamento de bytes (LRU)
+# ───────────────────────────────────────────────────────────────────────────────
+
+LINHAS_ABA = 1000
+
+@pytest.fixture
+def downloads_com_disco(planilha, monkeypatch):
+    """Cada download grava a aba no cache em disco, como o _baixar_aba real"""
+    chamadas = []
+
+    def baixar(nome_aba, url):
+        chamadas.append(nome_aba)
+        df = pd.DataFrame({"valor": range(LINHAS_ABA), "versao": len(chamadas)})
+        app._salvar_cache_disco(app.ABAS[nome_aba]["gid"], df, {"sha256": nome_aba, "memoria": [1, 1]})
+        return df
+
+    monkeypatch.setattr(app, "_baixar_aba", baixar)
+    return chamadas
+
+def _bytes_aba():
+    return app.memoria_df(pd.DataFrame({"valor": range(LINHAS_ABA), "versao": 1}))
+
+def test_orcamento_despeja_a_menos_usada(downloads_com_disco):
+    cache = app.CacheAbas(ttl=60, orcamento_bytes=2 * _bytes_aba())
+    cache.obter("produtos")
+    cache.obter("kits")
+    cache.obter("produtos")  # kits passa a ser a menos usada
+    cache.obter("custos")
+
+    estatisticas = cache.estatisticas()
+    assert estatisticas["despejos"] == 1
+    assert estatisticas["abas"] == 2
+    assert estatisticas["bytes"] <= estatisticas["orcamento"]
+    assert list(cache._entradas) == ["produtos", "custos"]
+
+def test_despejada_volta_do_disco_com_a_mesma_versao(downloads_com_disco):
+    cache = app.CacheAbas(ttl=60, orcamento_bytes=_bytes_aba())
+    cache.obter("produtos")
+    versao = cache.versao("produtos")
+    cache.obter("kits")
+    assert "produtos" not in cache._entradas
+    assert cache.versao("produtos") == versao
+
+    df, _ = cache.obter("produtos")
+    assert df["versao"].iloc[0] == 1
+    assert cache.versao("produtos") == versao
+    assert downloads_com_disco == ["produtos", "kits"]  # sem novo download
+
+def test_aba_maior_que_o_orcamento_fica(downloads_com_disco):
+    cache = app.CacheAbas(ttl=60, orcamento_bytes=_bytes_aba() // 2)
+    df, _ = cache.obter("produtos")
+    assert len(df) == LINHAS_ABA
+    assert list(cache._entradas) == ["produtos"]
+    assert cache.estatisticas()["despejos"] == 0
+
+def test_preparar_nao_baixa_de_novo_a_despejada_recente(downloads_com_disco):
+    cache = app.CacheAbas(ttl=60, orcamento_bytes=_bytes_aba())
+    cache.obter("produtos")
+    cache.obter("kits")
+    cache.preparar(["produtos", "kits", "custos"])
+    _esperar(cache)
+    assert downloads_com_disco == ["produtos", "kits", "custos"]
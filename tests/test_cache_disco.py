@@ -0,0 +1,103 @@
+"""
+Cache em disco das abas (Parquet + metadados por GID)
+- 304 no If-None-Match: lê o Parquet, sem parse nem limpeza
+- Servidor sem ETag com o mesmo conteúdo (sha256): também pula o parse
+- Conteúdo novo: parse, limpeza e cache regravado
+"""
+import json
+
+import pandas as pd
+import pytest
+
+from conftest import SessaoFalsa, app
+
+CSV_V1 = (
+    'Data,Canal,CNPJ,Produto,Quantidade,Total Venda\n'
+    '2025-01-01,Shein,MEI,00123,2,"R$ 1.234,56"\n'
+    '2025-01-02,Shein,MEI,ABC,1,"R$ 10,00"\n'
+).encode("utf-8")
+CSV_V2 = CSV_V1 + '2025-01-03,Shein,MEI,XYZ,5,"R$ 0,50"\n'.encode("utf-8")
+GID = app.ABAS["detalhes_canais"]["gid"]
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Conta as chamadas ao parse do CSV"""
+    chamadas = []
+    original = app.ler_csv_aba
+
+    def contar(nome_aba, conteudo):
+        chamadas.append(nome_aba)
+        return original(nome_aba, conteudo)
+
+    monkeypatch.setattr(app, "ler_csv_aba", contar)
+    return chamadas
+
+def _baixar():
+    return app._baixar_aba("detalhes_canais", app.ABAS_URLS["detalhes_canais"])
+
+def test_primeiro_download_grava_parquet_e_metadados(planilha, parses):
+    planilha.publicar("detalhes_canais", CSV_V1)
+    df = _baixar()
+
+    assert parses == ["detalhes_canais"]
+    assert df["Total Venda"].tolist() == [1234.56, 10.0]
+    assert df["Produto"].astype(str).tolist() == ["00123", "ABC"]
+    arquivo_dados, arquivo_meta = app._caminhos_cache_disco(GID)
+    meta = json.loads(arquivo_meta.read_text(encoding="utf-8"))
+    assert arquivo_dados.exists()
+    assert meta["etag"] and len(meta["sha256"]) == 64
+    assert meta["memoria"][1] <= meta["memoria"][0]
+
+def test_304_le_o_parquet_sem_parse(planilha, parses):
+    planilha.publicar("detalhes_canais", CSV_V1)
+    primeiro = _baixar()
+    segundo = _baixar()
+
+    assert [status for _, status in planilha.requisicoes] == [200, 304]
+    assert parses == ["detalhes_canais"]
+    pd.testing.assert_frame_equal(segundo, primeiro)
+
+def test_sem_etag_mesmo_conteudo_pula_o_parse(planilha, parses, monkeypatch):
+    sessao = SessaoFalsa(etag=False)
+    monkeypatch.setattr(app, "get_sessao_http", lambda: sessao)
+    sessao.publicar("detalhes_canais", CSV_V1)
+    primeiro = _baixar()
+    segundo = _baixar()
+
+    assert [status for _, status in sessao.requisicoes] == [200, 200]
+    assert parses == ["detalhes_canais"]
+    pd.testing.assert_frame_equal(segundo, primeiro)
+
+def test_conteudo_novo_refaz_o_parse(planilha, parses):
+    planilha.publicar("detalhes_canais", CSV_V1)
+    _baixar()
+    planilha.publicar("detalhes_canais", CSV_V2)
+    df = _baixar()
+
+    assert parses == ["detalhes_canais", "detalhes_canais"]
+    assert len(df) == 3
+    meta = app._ler_cache_disco(GID)
+    assert meta["sha256"] == app.hashlib.sha256(CSV_V2).hexdigest()
+
+def test_parquet_ilegivel_refaz_o_parse(planilha, parses, monkeypatch):
+    sessao = SessaoFalsa(etag=False)
+    monkeypatch.setattr(app, "get_sessao_http", lambda: sessao)
+    sessao.publicar("detalhes_canais", CSV_V1)
+    _baixar()
+    arquivo_dados, _ = app._caminhos_cache_disco(GID)
+    arquivo_dados.write_bytes(b"corrompido")
+
+    df = _baixar()
+    assert parses == ["detalhes_canais", "detalhes_canais"]
+    assert len(df) == 2
+
+def test_sem_parquet_baixa_de_novo(planilha, parses):
+    planilha.publicar("detalhes_canais", CSV_V1)
+    _baixar()
+    arquivo_dados, _ = app._caminhos_cache_disco(GID)
+    arquivo_dados.unlink()
+
+    assert app._ler_cache_disco(GID) == {}
+    _baixar()
+    assert [status for _, status in planilha.requisicoes] == [200, 200]
+    assert len(parses) == 2
@@ -0,0 +1,94 @@
+"""
+Consulta indexada das linhas de venda (IndiceConsulta)
+- Período por busca binária e seleções por código dão as mesmas linhas
+  que uma máscara booleana sobre a tabela inteira
+- Visões derivadas memorizadas por filtro, com LRU limitado
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import app
+
+def _vendas(n=600, semente=0):
+    rng = np.random.default_rng(semente)
+    dias = np.datetime64("2025-01-01") + rng.integers(0, 90, n).astype("timedelta64[D]")
+    datas = pd.Series(np.datetime_as_string(dias, unit="D"), dtype=object)
+    # Formatos misturados e datas inválidas, como numa planilha real
+    datas[::7] = pd.to_datetime(datas[::7]).dt.strftime("%d/%m/%Y")
+    datas[::50] = "sem data"
+    return pd.DataFrame({
+        "Data": datas,
+        "Canal": rng.choice(["Shein", "Shopee 150", "Mercado Livre"], n),
+        "CNPJ": rng.choice(["MEI", "Simples Nacional", None], n),
+        "Produto": rng.choice([f"SKU{i}" for i in range(20)], n),
+        "Total Venda": rng.uniform(10, 100, n).round(2),
+    })
+
+def _referencia(vendas, filtro):
+    inicio, fim, selecoes = filtro
+    mascara = np.ones(len(vendas), dtype=bool)
+    datas = app.datas_vendas(vendas["Data"])
+    if inicio is not None:
+        mascara &= (datas >= pd.Timestamp(inicio)).to_numpy()
+    if fim is not None:
+        mascara &= (datas <= pd.Timestamp(fim)).to_numpy()
+    for dim, valores in selecoes:
+        mascara &= vendas[dim].isin(valores).to_numpy()
+    return np.flatnonzero(mascara)
+
+FILTROS = {
+    "todas": app.FILTRO_TODAS,
+    "periodo": (date(2025, 2, 1), date(2025, 2, 28), ()),
+    "um_dia": (date(2025, 1, 15), date(2025, 1, 15), ()),
+    "so_inicio": (date(2025, 3, 1), None, ()),
+    "so_fim": (None, date(2025, 1, 10), ()),
+    "canal": (None, None, (("Canal", ("Shein",)),)),
+    "varias_dimensoes": (None, None, (("Canal", ("Shein", "Mercado Livre")), ("Produto", ("SKU1", "SKU7")))),
+    "periodo_e_cnpj": (date(2025, 1, 20), date(2025, 3, 5), (("CNPJ", ("MEI",)),)),
+    "valor_inexistente": (None, None, (("Produto", ("NAO EXISTE",)),)),
+    "fora_do_periodo": (date(2026, 1, 1), date(2026, 12, 31), ()),
+}
+
+@pytest.mark.parametrize("filtro", FILTROS.values(), ids=FILTROS.keys())
+def test_igual_a_mascara(filtro):
+    vendas = _vendas()
+    indice = app.IndiceConsulta(vendas, "v1")
+    assert indice.consultar(filtro).tolist() == _referencia(vendas, filtro).tolist()
+
+def test_periodo_e_categorias():
+    vendas = _vendas()
+    indice = app.IndiceConsulta(vendas, "v1")
+    assert indice.periodo == (np.datetime64("2025-01-01"), np.datetime64("2025-03-31"))
+    assert list(indice.categorias["Canal"]) == ["Mercado Livre", "Shein", "Shopee 150"]
+
+def test_dimensao_ausente_nao_seleciona_nada():
+    vendas = _vendas().drop(columns=["CNPJ"])
+    indice = app.IndiceConsulta(vendas, "v1")
+    assert len(indice.consultar((None, None, (("CNPJ", ("MEI",)),)))) == 0
+
+def test_visao_memorizada_por_filtro():
+    vendas = _vendas()
+    indice = app.IndiceConsulta(vendas, "v1")
+    filtro = FILTROS["canal"]
+    chamadas = []
+
+    def construir(linhas):
+        chamadas.append(len(linhas))
+        return linhas.groupby("Produto")["Total Venda"].sum().reset_index()
+
+    primeira = indice.visao(filtro, "por_produto", construir)
+    segunda = indice.visao(filtro, "por_produto", construir)
+    pd.testing.assert_frame_equal(primeira, segunda)
+    assert chamadas == [int((vendas["Canal"] == "Shein").sum())]
+
+def test_lru_de_filtros():
+    indice = app.IndiceConsulta(_vendas(), "v1")
+    filtros = [(None, None, (("Produto", (f"SKU{i % 20}",)), ("Canal", (str(i),)))) for i in range(40)]
+    for filtro in filtros:
+        indice.consultar(filtro)
+    assert len(indice._memo) == app.LIMITE_MEMO_FILTROS
+    assert filtros[0] not in indice._memo
+    assert filtros[-1] in indice._memo
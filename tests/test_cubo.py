@@ -0,0 +1,97 @@
+"""
+Cubo de tendências (CuboVendas)
+- Dia / semana (começa na segunda) / mês iguais a um groupby direto das linhas
+- Lote acumulado como delta dá o mesmo cubo que montar tudo de novo
+- Filtro e quebra por dimensão; linhas sem data ficam de fora
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import app
+
+def _vendas(n=500, semente=0, inicio="2025-01-01"):
+    rng = np.random.default_rng(semente)
+    dias = np.datetime64(inicio) + rng.integers(0, 120, n).astype("timedelta64[D]")
+    datas = pd.Series(np.datetime_as_string(dias, unit="D"), dtype=object)
+    datas[::40] = ""
+    return pd.DataFrame({
+        "Data": datas,
+        "Canal": rng.choice(["Shein", "Shopee 150", "Mercado Livre"], n),
+        "CNPJ": rng.choice(["MEI", "Simples Nacional"], n),
+        "Produto": rng.choice([f"SKU{i}" for i in range(8)], n),
+        "Quantidade": rng.integers(1, 10, n),
+        "Total Venda": rng.uniform(10, 100, n).round(2),
+        "Lucro Bruto": rng.normal(5, 3, n).round(2),
+    })
+
+def _periodo(datas, grao):
+    datas = pd.to_datetime(datas, errors="coerce")
+    if grao == "Semana":
+        return datas - pd.to_timedelta(datas.dt.weekday, unit="D")
+    if grao == "Mês":
+        return datas.dt.to_period("M").dt.start_time
+    return datas
+
+def _referencia(vendas, grao, medida, por=None):
+    df = vendas.assign(Periodo=_periodo(vendas["Data"], grao)).dropna(subset=["Periodo"])
+    if por is None:
+        return df.groupby("Periodo")[medida].sum()
+    return df.groupby(["Periodo", por])[medida].sum().unstack(por, fill_value=0)
+
+def _comparar(obtido, esperado):
+    obtido = obtido.copy()
+    obtido.index = pd.to_datetime(obtido.index)
+    np.testing.assert_allclose(obtido.to_numpy(dtype=float), esperado.to_numpy(dtype=float))
+    assert list(obtido.index) == list(esperado.index)
+
+@pytest.mark.parametrize("grao", app.GRAOS_CUBO)
+@pytest.mark.parametrize("medida", app.MEDIDAS_CUBO)
+def test_total_por_grao(grao, medida):
+    vendas = _vendas()
+    _comparar(app.CuboVendas(vendas).tendencia(grao, medida), _referencia(vendas, grao, medida))
+
+@pytest.mark.parametrize("grao", app.GRAOS_CUBO)
+def test_quebra_por_canal(grao):
+    vendas = _vendas()
+    obtido = app.CuboVendas(vendas).tendencia(grao, "Total Venda", por="Canal")
+    esperado = _referencia(vendas, grao, "Total Venda", por="Canal")
+    _comparar(obtido[sorted(obtido.columns)], esperado[sorted(esperado.columns)])
+
+@pytest.mark.parametrize("grao", app.GRAOS_CUBO)
+def test_lote_acumulado_igual_a_remontar(grao):
+    base, lote = _vendas(semente=1), _vendas(n=80, semente=2, inicio="2025-04-15")
+    cubo = app.CuboVendas(base)
+    cubo.tendencia(grao, "Quantidade")  # consolidado antes do lote
+    cubo.acumular(lote)
+    remontado = app.CuboVendas(pd.concat([base, lote], ignore_index=True))
+
+    _comparar(cubo.tendencia(grao, "Quantidade"), remontado.tendencia(grao, "Quantidade"))
+    obtido = cubo.cubo(grao).sort_index()
+    pd.testing.assert_frame_equal(obtido, remontado.cubo(grao).sort_index(), check_exact=False)
+
+def test_filtro_de_periodo_e_dimensao():
+    vendas = _vendas()
+    filtro = (date(2025, 2, 12), date(2025, 3, 20), (("Canal", ("Shein",)), ("CNPJ", ("MEI",))))
+    obtido = app.CuboVendas(vendas).tendencia("Mês", "Total Venda", filtro=filtro)
+
+    # Início arredonda para o começo do mês que o contém
+    datas = pd.to_datetime(vendas["Data"], errors="coerce")
+    selecao = vendas[(datas >= "2025-02-01") & (datas <= "2025-03-31")
+                     & (vendas["Canal"] == "Shein") & (vendas["CNPJ"] == "MEI")]
+    _comparar(obtido, _referencia(selecao, "Mês", "Total Venda"))
+
+def test_linhas_sem_data_ficam_de_fora():
+    vendas = _vendas()
+    total = app.CuboVendas(vendas).tendencia("Dia", "Total Venda").sum()
+    assert total == pytest.approx(vendas.loc[vendas["Data"] != "", "Total Venda"].sum())
+
+def test_cubo_vazio():
+    cubo = app.CuboVendas(pd.DataFrame())
+    assert cubo.vazio
+    assert cubo.tendencia("Mês", "Total Venda").empty
+    cubo.acumular(_vendas(n=10))
+    assert not cubo.vazio
+    assert cubo.tendencia("Mês", "Quantidade").sum() > 0
@@ -0,0 +1,107 @@
+"""
+Deduplicação de uploads (IndiceDedup / VerificadorDuplicados)
+- Repetições contam: a k-ésima linha igual é duplicada só se a planilha tem k
+- O que o próprio upload grava não conta para os lotes seguintes
+- Reconciliação com a aba recarregada e persistência em disco
+- Ida e volta pela planilha: upload gravado e relido tem os mesmos hashes
+"""
+import numpy as np
+import pandas as pd
+
+from conftest import AbaFalsa, aguardar_downloads, app
+
+H = np.array([11, 22, 33], dtype="uint64")
+
+def _indice(tmp_path, hashes=()):
+    indice = app.IndiceDedup(tmp_path / "dedup.npy")
+    indice.adicionar(np.asarray(hashes, dtype="uint64"))
+    return indice
+
+def _upload(linhas, verificar=True):
+    bruto = pd.DataFrame({
+        "Produto": [f"SKU-{i % 7}" for i in range(linhas)],
+        "Quantidade": [str(1 + i % 3) for i in range(linhas)],
+        "Total Venda": [f"R$ 1.{i % 5}34,5{i % 10}" for i in range(linhas)],
+    })
+    return app.preparar_dados_para_salvar(
+        bruto, "shopee_matriz", "Lucro Presumido", "2025-04-02", mostrar_status=False, verificar_duplicados=verificar
+    )
+
+def test_repeticoes_contam_entre_lotes(tmp_path):
+    indice = _indice(tmp_path, [11, 11, 22])
+    verificador = app.VerificadorDuplicados(indice)
+
+    assert verificador.marcar(np.array([11, 33, 11], dtype="uint64")).tolist() == [True, False, True]
+    # Terceiro 11 do upload: a planilha só tem dois
+    assert verificador.marcar(np.array([11, 22, 22], dtype="uint64")).tolist() == [False, True, False]
+
+def test_upload_nao_conta_as_proprias_linhas(tmp_path):
+    indice = _indice(tmp_path)
+    verificador = app.VerificadorDuplicados(indice)
+
+    assert not verificador.marcar(H).any()
+    indice.adicionar(H)  # upload concluído
+    assert not verificador.marcar(H).any()
+    assert app.VerificadorDuplicados(indice).marcar(H).all()
+
+def test_sincronizar_adota_a_aba_e_mantem_uploads_posteriores(tmp_path, monkeypatch):
+    aba = pd.DataFrame({"Data": ["2025-01-01"], "Canal": ["Shein"], "CNPJ": ["MEI"], "Produto": ["X"],
+                        "Quantidade": [1], "Total Venda": [10.0]})
+    monkeypatch.setattr(app.time, "time", lambda: 500.0)
+    indice = _indice(tmp_path, [99])  # linha apagada da planilha depois
+    monkeypatch.setattr(app.time, "time", lambda: 2000.0)
+    indice.adicionar(H)
+
+    indice.sincronizar(aba, 1000.0)  # versão baixada antes do upload de H
+    assert len(indice) == 4
+    verificador = app.VerificadorDuplicados(indice)
+    assert verificador.marcar(np.r_[H, np.uint64(99)]).tolist() == [True, True, True, False]
+    assert verificador.marcar(app.hash_linhas_vendas(aba)).all()
+
+    indice.sincronizar(aba, 3000.0)  # versão que já inclui o upload: só o que está na aba
+    assert len(indice) == 1
+    assert not app.VerificadorDuplicados(indice).marcar(H).any()
+
+def test_versao_sem_momento_so_acrescenta(tmp_path):
+    indice = _indice(tmp_path, [11, 11])
+    aba = pd.DataFrame({"Data": ["2025-01-01"], "Canal": ["Shein"], "CNPJ": ["MEI"], "Produto": ["X"],
+                        "Quantidade": [1], "Total Venda": [10.0]})
+    indice.sincronizar(aba, 0.0)
+    assert len(indice) == 3
+    assert app.VerificadorDuplicados(indice).marcar(np.array([11, 11], dtype="uint64")).all()
+
+def test_persistido_em_disco(tmp_path):
+    _indice(tmp_path, [11, 11, 22])
+    recarregado = app.IndiceDedup(tmp_path / "dedup.npy")
+    assert len(recarregado) == 3
+    assert app.VerificadorDuplicados(recarregado).marcar(np.array([11, 11, 11], dtype="uint64")).tolist() == [
+        True, True, False,
+    ]
+
+def test_hash_igual_para_upload_e_planilha(planilha):
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS)
+    planilha.publicar("detalhes_canais", aba)
+    lote = _upload(40)
+    assert not lote[app.COLUNA_DUPLICADO].any()
+
+    assert app.salvar_dados_sheets(lote, worksheet=aba)
+    aguardar_downloads()
+    lida = app.carregar_aba("detalhes_canais")
+    assert len(lida) == 40
+    assert np.array_equal(np.sort(app.hash_linhas_vendas(lida)), np.sort(app.hash_linhas_vendas(lote)))
+
+def test_reimportacao_continua_duplicada_depois_de_recarregar(planilha):
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS)
+    planilha.publicar("detalhes_canais", aba)
+    assert app.salvar_dados_sheets(_upload(40), worksheet=aba)
+
+    # Recarga da aba com as linhas gravadas: os hashes do upload saem dos pendentes
+    aguardar_downloads()
+    indice = app.get_indice_dedup()
+    assert indice._pendentes == []
+    assert len(indice) == 40
+
+    repetido = _upload(40)
+    assert repetido[app.COLUNA_DUPLICADO].all()
+    assert app.salvar_dados_sheets(repetido, worksheet=aba)
+    assert len(aba.dados) == 40
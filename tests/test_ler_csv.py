@@ -0,0 +1,55 @@
+"""
+Parse do CSV exportado (ler_csv_aba, engine pyarrow) com o mesmo resultado
+do pd.read_csv(on_bad_lines='skip') que ele substitui
+- Linha com colunas a mais é descartada; linha curta é completada com vazio
+- Chaves continuam texto (zero à esquerda), datas não viram date32
+"""
+import io
+
+import pandas as pd
+import pytest
+
+from conftest import app
+
+CABECALHO = b"Data,Canal,Produto,Quantidade,Total Venda,Vazia\n"
+LINHAS = [
+    b'2025-01-01,Shein,00123,1,"R$ 1.234,56",\n',
+    b'2025-01-02,Shopee Matriz,ABC,2,"R$ 10,00",\n',
+    b'03/01/2025,Mercado Livre,0042,3,"R$ 0,99",\n',
+]
+CURTA = b"2025-01-04,Shein,XYZ\n"
+LONGA = b'2025-01-05,Shein,LONG,5,"R$ 5,00",,sobra\n'
+
+CASOS = {
+    "limpo": LINHAS,
+    "curta": LINHAS[:1] + [CURTA] + LINHAS[1:],
+    "longa": LINHAS[:2] + [LONGA] + LINHAS[2:],
+    "curta_e_longa": [CURTA] + LINHAS + [LONGA],
+    "so_curta_no_fim": LINHAS + [b"2025-01-06\n"],
+}
+
+def _esperado(conteudo):
+    colunas = CABECALHO.decode().strip().split(",")
+    texto = app.tipos_csv_aba("detalhes_canais", colunas)
+    return pd.read_csv(io.BytesIO(conteudo), dtype={col: str for col in texto}, on_bad_lines="skip")
+
+@pytest.mark.parametrize("linhas", CASOS.values(), ids=CASOS.keys())
+def test_mesmo_resultado_do_read_csv(linhas):
+    conteudo = CABECALHO + b"".join(linhas)
+    obtido = app.ler_csv_aba("detalhes_canais", conteudo)
+    esperado = _esperado(conteudo)
+    pd.testing.assert_frame_equal(obtido, esperado, check_dtype=False)
+    assert obtido["Produto"].tolist() == esperado["Produto"].tolist()
+
+def test_linha_curta_completada_com_vazio():
+    conteudo = CABECALHO + b"".join(CASOS["curta"])
+    df = app.limpar_dados_aba(app.ler_csv_aba("detalhes_canais", conteudo))
+    assert df["Produto"].tolist() == ["00123", "XYZ", "ABC", "0042"]
+    assert df["Quantidade"].tolist() == [1, 0, 2, 3]
+    assert df["Total Venda"].tolist() == [1234.56, 0.0, 10.0, 0.99]
+
+def test_colunas_de_texto_nao_viram_numero():
+    df = app.ler_csv_aba("detalhes_canais", CABECALHO + b"".join(LINHAS))
+    assert df["Produto"].tolist() == ["00123", "ABC", "0042"]
+    assert df["Data"].tolist() == ["2025-01-01", "2025-01-02", "03/01/2025"]
+    assert df["Vazia"].isna().all()
@@ -0,0 +1,88 @@
+"""
+Equivalência das limpezas vetorizadas (2.1) com as funções célula a célula
+clean_currency_series / clean_percent_series / safe_int_series devem dar
+o mesmo resultado que clean_currency / clean_percent / safe_int em cada célula
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import app  # noqa: E402
+
+NBSP = "\xa0"
+
+MOEDA = [
+    "R$ 1.234,56", "R$ -1.234,56", "-R$ 10,00", "R$ 0,00", "R$1.000.000,00", "1.234,5",
+    "12", "1,5", "1.5", "", " ", "-", "abc", "inf", "-inf", "nan",
+    f"R${NBSP}1.234,56", f"{NBSP}12,30",
+]
+PERCENTUAL = [
+    "15%", "15,5%", "0,5%", "150%", "-5%", "100%", "1", "0.25", "0,25", "1,5",
+    "", " ", "-", "abc", "inf", "nan", f"12{NBSP}%",
+]
+INTEIROS = ["1", "12", "3.7", "-2.9", "1e3", "", " ", "-", "abc", "inf", "nan", "1.234", f"{NBSP}5"]
+NUMEROS = [0, 1, -3, 12.5, 0.25, 1.0, 150, -0.5, np.nan]
+
+PARES = [
+    (app.clean_currency_series, app.clean_currency, MOEDA),
+    (app.clean_percent_series, app.clean_percent, PERCENTUAL),
+    (app.safe_int_series, app.safe_int, INTEIROS),
+]
+IDS = ["moeda", "percentual", "inteiro"]
+
+def _esperado(escalar, serie):
+    return [escalar(valor) for valor in serie.to_numpy(dtype=object)]
+
+def _mesmo_valor(a, b):
+    return a == b or (pd.isna(a) and pd.isna(b))
+
+def _comparar(vetorizada, escalar, serie):
+    obtido = vetorizada(serie)
+    assert obtido.index.equals(serie.index)
+    esperado = _esperado(escalar, serie)
+    divergentes = [
+        (valor, a, b) for valor, a, b in zip(serie.to_numpy(dtype=object), obtido, esperado) if not _mesmo_valor(a, b)
+    ]
+    assert not divergentes
+
+@pytest.mark.parametrize("vetorizada, escalar, textos", PARES, ids=IDS)
+def test_texto_object(vetorizada, escalar, textos):
+    _comparar(vetorizada, escalar, pd.Series(textos + [None, np.nan], dtype=object))
+
+@pytest.mark.parametrize("vetorizada, escalar, textos", PARES, ids=IDS)
+def test_texto_str(vetorizada, escalar, textos):
+    _comparar(vetorizada, escalar, pd.Series(textos + [None], dtype="str"))
+
+@pytest.mark.parametrize("vetorizada, escalar, textos", PARES, ids=IDS)
+def test_categoria(vetorizada, escalar, textos):
+    _comparar(vetorizada, escalar, pd.Series(textos * 2 + [None], dtype="category"))
+
+@pytest.mark.parametrize("vetorizada, escalar, textos", PARES, ids=IDS)
+def test_coluna_mista(vetorizada, escalar, textos):
+    _comparar(vetorizada, escalar, pd.Series(textos + NUMEROS + [True, False, None], dtype=object))
+
+@pytest.mark.parametrize("vetorizada, escalar, textos", PARES, ids=IDS)
+@pytest.mark.parametrize("tipo", ["float64", "Float64"])
+def test_coluna_numerica(vetorizada, escalar, textos, tipo):
+    _comparar(vetorizada, escalar, pd.Series(NUMEROS, dtype=tipo))
+
+@pytest.mark.parametrize("vetorizada, escalar, textos", PARES, ids=IDS)
+def test_coluna_inteira(vetorizada, escalar, textos):
+    _comparar(vetorizada, escalar, pd.Series([0, 1, -7, 250, 10**6], dtype="int64"))
+
+@pytest.mark.parametrize("vetorizada, escalar, textos", PARES, ids=IDS)
+def test_coluna_vazia(vetorizada, escalar, textos):
+    _comparar(vetorizada, escalar, pd.Series([], dtype=object))
+
+def test_indice_preservado():
+    serie = pd.Series(["R$ 1,00", "x", None], index=[10, 5, 7], dtype=object)
+    _comparar(app.clean_currency_series, app.clean_currency, serie)
+
+@pytest.mark.parametrize("valor", [2.0**63, -(2.0**64), "1e19", "-9.3e18", 1e300])
+def test_safe_int_fora_do_int64(valor):
+    serie = pd.Series([valor, "7", None], dtype=object)
+    assert list(app.safe_int_series(serie)) == _esperado(app.safe_int, serie)
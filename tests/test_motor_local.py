@@ -0,0 +1,125 @@
+"""
+Motor local incremental (MotorLocal)
+- Recarga de Detalhes_Canais igual às linhas somadas mantém o estado (sem reconstruir)
+- Versão anterior ao último lote (ou expirada, 0.0) não apaga o que foi acumulado
+- Edição na planilha ou referência nova reconstrói tudo
+"""
+import pandas as pd
+import pytest
+
+from conftest import AbaFalsa, aguardar_downloads, app
+
+SEM_REFERENCIAS = (None,) * len(app.ABAS_REFERENCIA)
+
+def _upload(linhas, inicio=0):
+    bruto = pd.DataFrame({
+        "Produto": [f"SKU-{i % 11}" for i in range(inicio, inicio + linhas)],
+        "Quantidade": [str(1 + i % 4) for i in range(inicio, inicio + linhas)],
+        "Total Venda": [f"R$ {50 + i % 90},{i % 100:02d}" for i in range(inicio, inicio + linhas)],
+    })
+    canal = ["mercado_livre", "shein"][inicio % 2]
+    return app.preparar_dados_para_salvar(
+        bruto, canal, "MEI", "2025-05-20", mostrar_status=False, verificar_duplicados=False
+    )
+
+def _gravar(aba, lote):
+    aba.append_rows(app._celulas_planilha(lote[app.COLUNAS_ESPERADAS]).values.tolist())
+
+def _lida(aba):
+    """Detalhes_Canais como carregar_aba devolve (CSV -> limpeza -> tipos compactos)"""
+    return app.otimizar_tipos(app.limpar_dados_aba(app.ler_csv_aba("detalhes_canais", aba.csv())))
+
+def _sincronizar(motor, df, versao, versoes_referencias=SEM_REFERENCIAS):
+    motor.sincronizar({"detalhes_canais": df}, (versao,) + versoes_referencias, app.IndiceReferencias({}))
+
+def _totais(motor):
+    geral = motor.resultado()["dashboard_geral"]
+    return int(geral["Quantidade"].sum()), round(float(geral["Total Venda"].sum()), 2)
+
+def _totais_aba(df):
+    return int(df["Quantidade"].sum()), round(float(df["Total Venda"].sum()), 2)
+
+@pytest.fixture
+def motor_com_lote(monkeypatch):
+    """Motor construído com 300 linhas (versão 100) e um lote de 500 somado no momento 200"""
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS)
+    _gravar(aba, _upload(300))
+    motor = app.MotorLocal()
+    _sincronizar(motor, _lida(aba), 100.0)
+    antiga = _lida(aba)
+
+    lote = _upload(500, inicio=301)
+    _gravar(aba, lote)
+    monkeypatch.setattr(app.time, "time", lambda: 200.0)
+    motor.acumular(lote)
+    monkeypatch.undo()
+    return motor, aba, antiga
+
+def test_recarga_igual_mantem_o_estado(motor_com_lote):
+    motor, aba, _ = motor_com_lote
+    revisao = motor.revisao
+    recarregada = _lida(aba)
+
+    _sincronizar(motor, recarregada, 300.0)
+    assert motor.revisao == revisao
+    assert motor._linhas == 800
+    assert _totais(motor) == _totais_aba(recarregada)
+
+@pytest.mark.parametrize("versao", [0.0, 150.0, 200.0], ids=["invalidada", "anterior", "mesmo_momento"])
+def test_versao_antiga_nao_apaga_o_lote(motor_com_lote, versao):
+    motor, aba, antiga = motor_com_lote
+    revisao = motor.revisao
+    esperado = _totais_aba(_lida(aba))
+
+    _sincronizar(motor, antiga, versao)
+    assert motor.revisao == revisao
+    assert len(motor.resultado()["vendas"]) == 800
+    assert _totais(motor) == esperado
+
+    # A recarga que chega depois é adotada sem reconstruir
+    _sincronizar(motor, _lida(aba), 300.0)
+    assert motor.revisao == revisao
+
+def test_edicao_na_planilha_reconstroi(motor_com_lote):
+    motor, aba, _ = motor_com_lote
+    aba.linhas[5][app.COLUNAS_ESPERADAS.index("Total Venda")] = "9999,99"
+    editada = _lida(aba)
+
+    _sincronizar(motor, editada, 300.0)
+    assert _totais(motor) == _totais_aba(editada)
+
+def test_linha_apagada_reconstroi(motor_com_lote):
+    motor, aba, _ = motor_com_lote
+    del aba.linhas[10]
+    menor = _lida(aba)
+
+    _sincronizar(motor, menor, 300.0)
+    assert motor._linhas == 799
+    assert _totais(motor) == _totais_aba(menor)
+
+def test_referencia_nova_reconstroi(motor_com_lote):
+    motor, aba, _ = motor_com_lote
+    revisao = motor.revisao
+
+    _sincronizar(motor, _lida(aba), 300.0, (300.0,) + SEM_REFERENCIAS[1:])
+    assert motor.revisao == revisao + 1
+    assert motor._linhas == 800
+
+def test_upload_e_recarga_pelo_app(planilha):
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS)
+    _gravar(aba, _upload(300))
+    planilha.publicar("detalhes_canais", aba)
+
+    app.calcular_abas_locais()
+    motor = app.get_motor_local()
+    assert motor._linhas == 300
+
+    assert app.salvar_dados_sheets(_upload(500, inicio=301), worksheet=aba)
+    assert motor._linhas == 800
+    revisao = motor.revisao
+
+    aguardar_downloads()
+    resultado = app.calcular_abas_locais()
+    assert motor.revisao == revisao
+    assert len(resultado["vendas"]) == 800
+    assert _totais(motor) == _totais_aba(_lida(aba))
@@ -0,0 +1,121 @@
+"""
+Gravação em Detalhes_Canais (salvar_dados_sheets) contra uma AbaFalsa
+- Append ambíguo (timeout de leitura depois de gravar) não duplica o lote
+- 429 reenvia direto; 5xx antes de gravar reenvia depois de conferir
+- Upload interrompido retoma do checkpoint sem reenviar linhas
+- Números gravados voltam da planilha com o mesmo valor
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+
+from conftest import AbaFalsa, app
+
+def _upload(linhas, inicio=0):
+    """Lote já preparado para salvar (sem consulta ao índice de duplicados)"""
+    bruto = pd.DataFrame({
+        "Produto": [f"SKU-{i:03d}" for i in range(inicio, inicio + linhas)],
+        "Quantidade": [str(1 + i % 7) for i in range(inicio, inicio + linhas)],
+        "Total Venda": [f"R$ {1000 + i},{i % 100:02d}" for i in range(inicio, inicio + linhas)],
+    })
+    return app.preparar_dados_para_salvar(
+        bruto, "mercado_livre", "Simples Nacional", "2025-03-10", mostrar_status=False, verificar_duplicados=False
+    )
+
+def _erro_api(status):
+    resposta = requests.Response()
+    resposta.status_code = status
+    resposta._content = b'{"error": {"code": %d, "message": "erro", "status": "X"}}' % status
+    gspread = pytest.importorskip("gspread")
+    return gspread.exceptions.APIError(resposta)
+
+def _produtos(aba):
+    return [linha[app.COLUNAS_ESPERADAS.index("Produto")] for linha in aba.dados]
+
+@pytest.mark.parametrize("informa_faixa", [True, False], ids=["updatedRange", "sem_faixa"])
+def test_timeout_depois_de_gravar_nao_duplica(planilha, informa_faixa):
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS, informa_faixa=informa_faixa)
+    aba.falhas = [(None, None), ("depois", requests.exceptions.ReadTimeout("leitura"))]
+    lotes = [_upload(20), _upload(20, inicio=20)]
+
+    assert app.salvar_dados_sheets(lotes, remover_duplicados=False, worksheet=aba)
+    assert _produtos(aba) == [f"SKU-{i:03d}" for i in range(40)]
+    assert aba.appends == 2
+    assert aba.leituras >= 1
+
+def test_5xx_antes_de_gravar_confere_e_reenvia(planilha):
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS)
+    aba.falhas = [("antes", _erro_api(503))]
+
+    assert app.salvar_dados_sheets(_upload(15), remover_duplicados=False, worksheet=aba)
+    assert _produtos(aba) == [f"SKU-{i:03d}" for i in range(15)]
+    assert aba.appends == 2
+    assert aba.leituras == 1
+
+def test_429_reenvia_sem_conferir(planilha):
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS)
+    aba.falhas = [("antes", _erro_api(429)), ("antes", _erro_api(429))]
+
+    assert app.salvar_dados_sheets(_upload(15), remover_duplicados=False, worksheet=aba)
+    assert len(aba.dados) == 15
+    assert aba.appends == 3
+    assert aba.leituras == 0
+
+def test_erro_definitivo_nao_reenvia(planilha):
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS)
+    aba.falhas = [("antes", _erro_api(400))]
+
+    assert not app.salvar_dados_sheets(_upload(5), remover_duplicados=False, worksheet=aba)
+    assert aba.dados == []
+    assert aba.appends == 1
+
+def test_retoma_depois_de_interrupcao(planilha):
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS)
+    lotes = [_upload(10), _upload(10, inicio=10), _upload(10, inicio=20)]
+    aba.falhas = [(None, None), (None, None), ("antes", RuntimeError("processo caiu"))]
+
+    assert not app.salvar_dados_sheets(lotes, id_envio="envio-teste", remover_duplicados=False, worksheet=aba)
+    assert len(aba.dados) == 20
+    assert app._ler_checkpoint("envio-teste") == {"linhas_enviadas": 20, "concluido": False}
+
+    # Mesmo arquivo de novo: só o terceiro lote é enviado
+    assert app.salvar_dados_sheets(lotes, id_envio="envio-teste", remover_duplicados=False, worksheet=aba)
+    assert _produtos(aba) == [f"SKU-{i:03d}" for i in range(30)]
+    assert app._ler_checkpoint("envio-teste")["concluido"]
+
+    # Já concluído: nada é reenviado
+    appends = aba.appends
+    assert app.salvar_dados_sheets(lotes, id_envio="envio-teste", remover_duplicados=False, worksheet=aba)
+    assert aba.appends == appends
+    assert len(aba.dados) == 30
+
+def test_retomada_conta_os_duplicados_pulados(planilha):
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS)
+    lote = _upload(12)
+    lote[app.COLUNA_DUPLICADO] = np.arange(12) % 3 == 0
+    metades = [lote.iloc[:6], lote.iloc[6:]]
+    aba.falhas = [(None, None), ("antes", RuntimeError("processo caiu"))]
+
+    assert not app.salvar_dados_sheets(metades, id_envio="envio-dup", worksheet=aba)
+    assert app.salvar_dados_sheets(metades, id_envio="envio-dup", worksheet=aba)
+    assert _produtos(aba) == [f"SKU-{i:03d}" for i in range(12) if i % 3]
+
+def test_cabecalho_em_aba_vazia(planilha):
+    aba = AbaFalsa()
+    aba.falhas = [(None, None), ("depois", requests.exceptions.ReadTimeout("leitura"))]
+
+    assert app.salvar_dados_sheets(_upload(3), remover_duplicados=False, worksheet=aba)
+    assert aba.linhas[0] == app.COLUNAS_ESPERADAS
+    assert len(aba.dados) == 3
+
+def test_numeros_voltam_com_o_mesmo_valor(planilha):
+    aba = AbaFalsa(app.COLUNAS_ESPERADAS)
+    lote = _upload(50)
+    lote["Total Venda"] = [1234.56, 100.0, 0.1 + 0.2, 1e7 + 0.01, -5.5] * 10
+
+    assert app.salvar_dados_sheets(lote, remover_duplicados=False, worksheet=aba)
+    lido = app.limpar_dados_aba(app.ler_csv_aba("detalhes_canais", aba.csv()))
+    assert lido["Total Venda"].tolist() == lote["Total Venda"].tolist()
+    assert lido["Quantidade"].tolist() == lote["Quantidade"].tolist()
+    assert (lido["Custo Total"] == 0).all()